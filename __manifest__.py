@@ -9,13 +9,14 @@
     "license": "AGPL-3",
     'category': 'Education',
     'version': '18.0.1.0.0',
-    'depends': ['base', 'contacts', 'hr', 'web', 'fleet', 'mail'],
+    'depends': ['base', 'contacts', 'hr', 'web', 'bus', 'fleet', 'mail'],
     'data': [
         'security/ir.model.access.csv',
         'views/geocode_wizard_view.xml',
         'data/cron_jobs.xml',
         'data/student_data.xml',
         'data/teacher_data.xml',
+        'data/exam_grade_band_data.xml',
         'views/server_actions.xml',
         'views/student.xml',
         'views/parent.xml',
@@ -25,14 +26,23 @@
         'views/teacher.xml',
         'views/exam.xml',
         'views/exam_result.xml',
+        'views/exam_grade_band.xml',
+        'views/exam_ranking.xml',
+        'views/exam_result_import_wizard_view.xml',
         'views/transport.xml',
         'views/transport_iot_view.xml',
+        'views/geocode_job_view.xml',
+        'views/transport_assign_wizard_view.xml',
+        'views/route_optimize_wizard_view.xml',
         'views/map_template.xml',
         'views/fee.xml',
         'views/hostel.xml',
+        'views/hostel_allocation_wizard_view.xml',
         'views/fee_type.xml',
+        'views/fee_ledger.xml',
         'views/library.xml',
         'views/library_issue.xml',
+        'views/library_issue_wizard_view.xml',
     ],
     'demo': [
         'data/demo_danang_routes.xml',
@@ -41,5 +51,5 @@
     'installable': True,
     'application': True,
     'auto_install': False,
-    'external_dependencies': {'python': ['requests']},
+    'external_dependencies': {'python': ['requests', 'numpy']},
 }
\ No newline at end of file
@@ -1,14 +1,31 @@
 # -*- coding: utf-8 -*-
 from odoo import http
+from odoo.addons.bus.websocket import WebsocketConnectionHandler
 from odoo.http import request
+import gzip
 import json
+import math
+from datetime import timezone
 from markupsafe import Markup
+from werkzeug.http import http_date
+
+MAX_BATCH_EVENTS = 5000
+MAX_NEARBY_RESULTS = 500
+MAX_NEARBY_RADIUS_M = 50000
+NEARBY_MODELS = {
+    'stop': 'school.transport.stop',
+    'student': 'school.student',
+}
+# Zoom level the route map opens at, before it is fitted to the route.
+DEFAULT_MAP_ZOOM = 13
+# Protocol version the bus websocket expects from map pages.
+BUS_VERSION = getattr(WebsocketConnectionHandler, '_VERSION', '')
 
 
 class SchoolTransportController(http.Controller):
     
     @http.route('/school_transport/map/<int:route_id>', type='http', auth='user', website=True)
-    def transport_map(self, route_id, **kwargs):
+    def transport_map(self, route_id, v=None, **kwargs):
         """Render the interactive map for a transport route."""
         route = request.env['school.transport.route'].browse(route_id)
         
@@ -16,26 +33,193 @@ class SchoolTransportController(http.Controller):
             return request.render('at_school_management.transport_map_error', {
                 'error': 'Route not found'
             })
-        
-        # Get map data
-        map_data = route.get_map_data()
-        
-        return request.render('at_school_management.transport_map_template', {
+
+        version, last_modified = route._map_version()
+        headers = self._cache_headers(version, last_modified, immutable=(v == version))
+        if self._not_modified(version):
+            return request.make_response('', headers=headers, status=304)
+
+        response = request.render('at_school_management.transport_map_template', {
             'route': route,
-            'map_data': Markup(json.dumps(map_data)),
+            'map_data': Markup(route._map_payload(version, DEFAULT_MAP_ZOOM)),
+            'map_zoom': DEFAULT_MAP_ZOOM,
+            'bus_version': BUS_VERSION,
             'center_lat': route.map_center_lat or 16.0544,
             'center_lon': route.map_center_lon or 108.2022,
         })
+        response.headers.update(headers)
+        return response
     
     @http.route('/school_transport/api/route/<int:route_id>', type='json', auth='user')
-    def get_route_data(self, route_id, **kwargs):
+    def get_route_data(self, route_id, zoom=None, **kwargs):
         """API endpoint to get route data as JSON."""
         route = request.env['school.transport.route'].browse(route_id)
         
         if not route.exists():
             return {'error': 'Route not found'}
         
-        return route.get_map_data()
+        return json.loads(route._map_payload(route._map_version()[0], self._parse_zoom(zoom)))
+
+    @http.route('/school_transport/api/route/<int:route_id>/data', type='http', auth='user', methods=['GET'])
+    def get_route_data_http(self, route_id, zoom=None, **kwargs):
+        """Cacheable GET variant of the route data API, with ETag/304 support.
+        Query: zoom=<map zoom> (optional) selects the geometry resolution.
+        """
+        route = request.env['school.transport.route'].browse(route_id)
+
+        if not route.exists():
+            return request.make_response(
+                json.dumps({'error': 'Route not found'}),
+                headers={'Content-Type': 'application/json'}, status=404)
+
+        version, last_modified = route._map_version()
+        headers = self._cache_headers(version, last_modified)
+        if self._not_modified(version):
+            return request.make_response('', headers=headers, status=304)
+        headers['Content-Type'] = 'application/json'
+        return request.make_response(route._map_payload(version, self._parse_zoom(zoom)), headers=headers)
+
+    @http.route('/school_transport/fleet_map', type='http', auth='user', website=True)
+    def fleet_map(self, **kwargs):
+        """Render every route on a single map."""
+        return request.render('at_school_management.transport_fleet_map_template', {'bus_version': BUS_VERSION})
+
+    @http.route('/school_transport/api/fleet', type='http', auth='user', methods=['GET'])
+    def get_fleet_data(self, bbox=None, encoding='polyline', zoom=None, **kwargs):
+        """
+        Map data of all routes in one response.
+        Query: bbox=min_lon,min_lat,max_lon,max_lat (optional),
+        encoding=polyline|geojson and zoom=<map zoom> (optional, selects the
+        geometry resolution). Gzip compressed when the client accepts it.
+        """
+        if bbox:
+            try:
+                bbox = [float(value) for value in bbox.split(',')]
+            except ValueError:
+                bbox = None
+            if not bbox or len(bbox) != 4:
+                return request.make_response(
+                    json.dumps({'error': 'bbox must be min_lon,min_lat,max_lon,max_lat'}),
+                    headers={'Content-Type': 'application/json'}, status=400)
+        if encoding not in ('polyline', 'geojson'):
+            encoding = 'polyline'
+
+        Route = request.env['school.transport.route']
+        version, last_modified = Route._fleet_version()
+        use_gzip = 'gzip' in request.httprequest.accept_encodings
+        # Each encoding of the body is a distinct representation.
+        etag = f'{version}-gz' if use_gzip else version
+        headers = self._cache_headers(etag, last_modified)
+        headers['Vary'] = 'Accept-Encoding'
+        if self._not_modified(etag):
+            return request.make_response('', headers=headers, status=304)
+
+        body = json.dumps(Route._fleet_map_data(bbox, encoding, version, self._parse_zoom(zoom)), separators=(',', ':')).encode()
+        headers['Content-Type'] = 'application/json'
+        if use_gzip:
+            body = gzip.compress(body, compresslevel=6)
+            headers['Content-Encoding'] = 'gzip'
+        return request.make_response(body, headers=headers)
+
+    @http.route('/school_transport/api/nearby', type='json', auth='user')
+    def nearby(self, kind='stop', lat=None, lon=None, radius_m=500, bbox=None, limit=100, **kwargs):
+        """
+        Stops or students near a point or inside a box.
+        Params: kind ("stop" or "student"), and either lat/lon/radius_m or
+        bbox [min_lon, min_lat, max_lon, max_lat]; radius_m (at most 50 km);
+        limit (1 to 500).
+        Results are sorted by distance when searching around a point.
+        """
+        model = NEARBY_MODELS.get(kind)
+        if not model:
+            return {'error': 'Unknown kind'}
+        Model = request.env[model]
+        try:
+            limit = max(1, min(int(limit or MAX_NEARBY_RESULTS), MAX_NEARBY_RESULTS))
+            if bbox:
+                min_lon, min_lat, max_lon, max_lat = self._finite_floats(*bbox)
+                # Keep the box on the globe, so its geohash cover stays small.
+                min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+                min_lon, max_lon = max(min_lon, -180.0), min(max_lon, 180.0)
+                records = Model._search_bbox(min_lat, min_lon, max_lat, max_lon, limit=limit)
+                distances = [None] * len(records)
+            else:
+                lat, lon, radius_m = self._finite_floats(lat, lon, radius_m)
+                radius_m = max(0.0, min(radius_m, MAX_NEARBY_RADIUS_M))
+                records, distances = Model._search_nearby(lat, lon, radius_m / 1000.0, limit=limit)
+        except (TypeError, ValueError):
+            return {'error': 'Give lat, lon and radius_m, or bbox as [min_lon, min_lat, max_lon, max_lat], '
+                             'and an integer limit'}
+
+        return {'results': [{
+            'id': record.id,
+            'name': record.display_name,
+            'lat': record[Model._geocode_lat_field],
+            'lon': record[Model._geocode_lon_field],
+            'distance_m': round(distance * 1000.0, 1) if distance is not None else None,
+        } for record, distance in zip(records, distances)]}
+
+    def _finite_floats(self, *values):
+        """``values`` as floats; raises ValueError unless all are finite."""
+        values = [float(value) for value in values]
+        if not all(math.isfinite(value) for value in values):
+            raise ValueError("Coordinates and radius must be finite numbers")
+        return values
+
+    def _cache_headers(self, version, last_modified, immutable=False):
+        """Validation headers for a versioned resource.
+
+        Versioned URLs (``?v=`` matching the current version) may be
+        reused by the browser for a day; everything else must be
+        revalidated, which costs a 304 at most.
+        """
+        headers = {
+            'ETag': f'"{version}"',
+            'Cache-Control': 'private, max-age=86400' if immutable else 'private, no-cache',
+        }
+        if last_modified:
+            headers['Last-Modified'] = http_date(last_modified.replace(tzinfo=timezone.utc))
+        return headers
+
+    def _parse_zoom(self, zoom):
+        try:
+            return int(zoom) if zoom not in (None, '') else None
+        except (TypeError, ValueError):
+            return None
+
+    def _not_modified(self, version):
+        return request.httprequest.if_none_match.contains(version)
+
+    @http.route('/school_transport/api/eta/<int:route_id>', type='http', auth='user', methods=['GET'])
+    def route_eta(self, route_id, **kwargs):
+        """
+        Predicted arrival times at the upcoming stops of a route.
+        Response: {"status": "ok", "stops": [{"stop_id", "name", "eta",
+        "minutes", "source"}, ...], ...}; times are UTC. Status is
+        "no_stops", "no_position" or "stale" (last position too old) with
+        an empty stop list when nothing can be predicted.
+        """
+        route = request.env['school.transport.route'].browse(route_id)
+
+        if not route.exists():
+            return request.make_response(
+                json.dumps({'error': 'Route not found'}),
+                headers={'Content-Type': 'application/json'}, status=404)
+
+        return request.make_response(route._eta_json(), headers={
+            'Content-Type': 'application/json',
+            'Cache-Control': 'private, max-age=15',
+        })
+
+    @http.route('/school_transport/api/geocode_job/<int:job_id>', type='json', auth='user')
+    def geocode_job_progress(self, job_id, **kwargs):
+        """Progress of a background geocoding job, for UI polling."""
+        job = request.env['school.geocode.job'].browse(job_id)
+
+        if not job.exists():
+            return {'error': 'Job not found'}
+
+        return job._progress_data()
 
     @http.route('/school_transport/api/checkin', type='http', auth='public', methods=['POST'], csrf=False)
     def iot_checkin(self, **kwargs):
@@ -48,62 +232,175 @@ class SchoolTransportController(http.Controller):
             "timestamp": "2025-11-28 14:00:00"
         }
         """
-        # 1. Extract Data
         try:
             data = json.loads(request.httprequest.data)
         except json.JSONDecodeError:
+            return self._json_response({'status': 'error', 'message': 'Invalid JSON'})
+
+        result = request.env['school.transport.trip.log'].sudo()._receive_checkins([data])[0]
+        return self._json_response(result)
+
+    @http.route('/school_transport/api/checkin/batch', type='http', auth='public', methods=['POST'], csrf=False)
+    def iot_checkin_batch(self, **kwargs):
+        """
+        Receive a batch of IoT Check-in events buffered by a reader.
+        Payload: a JSON array of check-in events, {"events": [...]}, or
+        NDJSON (one event per line).
+        Response: {"status": "ok", "results": [...]} with one result per
+        event, in order.
+        """
+        events = self._parse_events(request.httprequest.get_data(as_text=True))
+        if events is None:
+            return self._json_response({'status': 'error', 'message': 'Invalid JSON'})
+        if len(events) > MAX_BATCH_EVENTS:
+            return self._json_response({
+                'status': 'error',
+                'message': f'Too many events (max {MAX_BATCH_EVENTS})',
+            })
+
+        results = request.env['school.transport.trip.log'].sudo()._receive_checkins(events)
+        return self._json_response({'status': 'ok', 'results': results})
+
+    @http.route('/school_transport/api/gps', type='http', auth='public', methods=['POST'], csrf=False)
+    def gps_ping(self, **kwargs):
+        """
+        Receive GPS pings from vehicles.
+        Payload: one ping, a JSON array, {"events": [...]} or NDJSON, each
+        ping being {"vehicle_id": 1, "gps_lat": 16.0, "gps_lon": 108.0,
+        "timestamp": "2025-11-28 14:00:00", "speed": 30, "heading": 90}.
+        Response: {"status": "ok", "results": [...]}, aligned with the pings.
+        """
+        events = self._parse_events(request.httprequest.get_data(as_text=True))
+        if events is None:
+            return self._json_response({'status': 'error', 'message': 'Invalid JSON'})
+        if len(events) > MAX_BATCH_EVENTS:
+            return self._json_response({
+                'status': 'error',
+                'message': f'Too many events (max {MAX_BATCH_EVENTS})',
+            })
+
+        results = request.env['school.transport.vehicle.position'].sudo()._ingest_pings(events)
+        return self._json_response({'status': 'ok', 'results': results})
+
+    @http.route('/school_transport/api/live', type='http', auth='user', methods=['GET'])
+    def live_positions(self, since=0, route_id=None, **kwargs):
+        """
+        Vehicle positions updated after cursor ``since``, answered at once.
+        Map pages load the current positions here, then receive updates
+        pushed over the bus (``school_transport.positions`` channel, or
+        ``school_transport.positions.<route_id>``) and only come back
+        with their last ``seq`` after reconnecting.
+        Response: {"seq": <new cursor>, "positions": [...]}.
+        """
+        try:
+            since = int(since or 0)
+            route_id = int(route_id) if route_id else None
+        except ValueError:
             return request.make_response(
-                json.dumps({'status': 'error', 'message': 'Invalid JSON'}),
-                headers={'Content-Type': 'application/json'}
-            )
-            
-        card_id = data.get('card_id')
-        gps_lat = data.get('gps_lat')
-        gps_lon = data.get('gps_lon')
-        timestamp = data.get('timestamp')
-
-        if not card_id:
+                json.dumps({'error': 'since and route_id must be integers'}),
+                headers={'Content-Type': 'application/json'}, status=400)
+        request.env['school.transport.vehicle.position'].check_access('read')
+        positions, seq = request.env['school.transport.vehicle.position'].sudo()._changes_since(since, route_id)
+        return request.make_response(
+            json.dumps({'seq': seq, 'positions': positions}),
+            headers={'Content-Type': 'application/json', 'Cache-Control': 'no-store'})
+
+    @http.route('/school_transport/api/stop_events', type='http', auth='user', methods=['GET'])
+    def stop_events(self, since=0, route_id=None, **kwargs):
+        """
+        Vehicle arrivals and departures at stops recorded after cursor ``since``.
+        Response: {"cursor": <new cursor>, "events": [[id, vehicle_id,
+        route_id, stop_id, "a"|"d", time], ...]}; "a" is an arrival, "d" a
+        departure, times are UTC.
+        """
+        try:
+            since = int(since or 0)
+            route_id = int(route_id) if route_id else None
+        except ValueError:
             return request.make_response(
-                json.dumps({'status': 'error', 'message': 'Missing card_id'}),
-                headers={'Content-Type': 'application/json'}
-            )
+                json.dumps({'error': 'since and route_id must be integers'}),
+                headers={'Content-Type': 'application/json'}, status=400)
+        StopEvent = request.env['school.transport.stop.event']
+        StopEvent.check_access('read')
+        events, cursor = StopEvent.sudo()._events_since(since, route_id)
+        return request.make_response(
+            json.dumps({'cursor': cursor, 'events': events}),
+            headers={'Content-Type': 'application/json', 'Cache-Control': 'no-store'})
 
-        # 2. Find Student Card
-        card = request.env['school.student.card'].sudo().search([('card_id', '=', card_id)], limit=1)
-        
-        # 3. Prepare Log Data
-        log_vals = {
-            'card_id': card_id,
-            'timestamp': timestamp or fields.Datetime.now(),
-            'gps_lat': gps_lat,
-            'gps_lon': gps_lon,
-            'event_type': 'check_in', # Default to check-in for now
+    @http.route('/school/api/exam/<int:exam_id>/ranking', type='http', auth='user', methods=['GET'])
+    def exam_ranking(self, exam_id, **kwargs):
+        """
+        Precomputed ranking and per-class statistics of an exam, with ETag/304 support.
+        Response: {"exam_id", "classes": [{"class_id", "class", "students",
+        "mean", "stddev", "median", "min", "max", "pass_rate"}, ...],
+        "ranking": [[student_id, student, class_id, marks, grade, rank,
+        percentile], ...]}.
+        """
+        exam = request.env['school.exam'].browse(exam_id)
+
+        if not exam.exists():
+            return request.make_response(
+                json.dumps({'error': 'Exam not found'}),
+                headers={'Content-Type': 'application/json'}, status=404)
+
+        Ranking = request.env['school.exam.ranking']
+        Ranking.check_access('read')
+        request.env.cr.execute("""
+            SELECT max(write_date), count(*), coalesce(sum(id), 0) FROM school_exam_ranking WHERE exam_id = %s
+        """, [exam.id])
+        last_modified, count, id_sum = request.env.cr.fetchone()
+        version = f'{exam.id}-{count}-{id_sum}-{last_modified and last_modified.timestamp()}'
+        headers = self._cache_headers(version, last_modified)
+        if self._not_modified(version):
+            return request.make_response('', headers=headers, status=304)
+
+        rankings = Ranking.sudo().search([('exam_id', '=', exam.id)])
+        stats = request.env['school.exam.class.stat'].sudo().search([('exam_id', '=', exam.id)])
+        data = {
+            'exam_id': exam.id,
+            'classes': [{
+                'class_id': stat.class_id.id,
+                'class': stat.class_id.name,
+                'students': stat.student_count,
+                'mean': round(stat.mean, 2),
+                'stddev': round(stat.stddev, 2),
+                'median': stat.median,
+                'min': stat.min_marks,
+                'max': stat.max_marks,
+                'pass_rate': round(stat.pass_rate, 2),
+            } for stat in stats],
+            'ranking': [[
+                ranking.student_id.id, ranking.student_id.name, ranking.class_id.id, ranking.marks,
+                ranking.grade or None, ranking.rank, ranking.percentile,
+            ] for ranking in rankings],
         }
+        headers['Content-Type'] = 'application/json'
+        return request.make_response(json.dumps(data), headers=headers)
 
-        response_data = {}
-        if card:
-            # Valid Student
-            log_vals.update({
-                'student_id': card.student_id.id,
-                'status': 'success',
-                'message': f'Student {card.student_id.name} checked in.',
-            })
-            request.env['school.transport.trip.log'].sudo().create(log_vals)
-            response_data = {
-                'status': 'success',
-                'student_name': card.student_id.name,
-                'student_id': card.student_id.id
-            }
-        else:
-            # Invalid Card
-            log_vals.update({
-                'status': 'denied',
-                'message': 'Card not registered.',
-            })
-            request.env['school.transport.trip.log'].sudo().create(log_vals)
-            response_data = {'status': 'error', 'message': 'Card not found'}
-            
+    def _parse_events(self, body):
+        """Decode a JSON array/object or NDJSON body into a list of events.
+
+        Undecodable NDJSON lines become ``None`` entries so they are
+        reported individually. Returns None if the body is not usable.
+        """
+        try:
+            data = json.loads(body)
+        except json.JSONDecodeError:
+            data = None
+            lines = [line for line in body.splitlines() if line.strip()]
+            if len(lines) > 1:
+                data = []
+                for line in lines:
+                    try:
+                        data.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        data.append(None)
+        if isinstance(data, dict):
+            data = data['events'] if isinstance(data.get('events'), list) else [data]
+        return data if isinstance(data, list) else None
+
+    def _json_response(self, data):
         return request.make_response(
-            json.dumps(response_data),
+            json.dumps(data),
             headers={'Content-Type': 'application/json'}
         )
@@ -1,18 +1,28 @@
 from . import classes
 from . import parent
 from . import partner
+from . import geocode_mixin
 from . import student
 from . import student_document
 from . import subject
 from . import teacher
 from . import exam
+from . import exam_grade_band
 from . import exam_result
+from . import exam_ranking
 from . import library
 from . import library_issue
 from . import transport
 from . import fee
 from . import hostel
 from . import fee_type
+from . import fee_ledger
 from . import nominatim_service
+from . import geocode_cache
 from . import osm_service
-from . import transport_iot
\ No newline at end of file
+from . import geocode_job
+from . import trip_log_storage
+from . import transport_iot
+from . import vehicle_position
+from . import eta
+from . import stop_event
\ No newline at end of file
@@ -0,0 +1,303 @@
+from odoo import models, fields, api, tools
+import json
+import logging
+import time
+from datetime import timedelta
+import pytz
+from psycopg2.extras import execute_values
+
+from ..tools import geodesy
+
+_logger = logging.getLogger(__name__)
+
+# Lifetime of a cached ETA prediction when nothing else changes.
+ETA_CACHE_SECONDS = 30
+
+
+class EtaSegmentStat(models.Model):
+    """
+    Travel time statistics of one route segment (stop to next stop) for a
+    weekday and time band, kept as running count/mean/M2 (Welford) so new
+    observations are merged without rereading history.
+    """
+    _name = 'school.transport.eta.stat'
+    _description = 'Route Segment Travel Time'
+    _order = 'route_id, weekday, band'
+
+    route_id = fields.Many2one('school.transport.route', string="Route", required=True, readonly=True, ondelete='cascade')
+    from_stop_id = fields.Many2one('school.transport.stop', string="From Stop", required=True, readonly=True, ondelete='cascade')
+    to_stop_id = fields.Many2one('school.transport.stop', string="To Stop", required=True, readonly=True, ondelete='cascade')
+    weekday = fields.Integer(string="Weekday", required=True, readonly=True, help="0 = Monday")
+    band = fields.Integer(string="Time Band", required=True, readonly=True,
+                          help="Index of the time-of-day band of the departure, in local time")
+    count = fields.Integer(string="Trips", readonly=True)
+    mean = fields.Float(string="Mean (s)", readonly=True)
+    m2 = fields.Float(string="Sum of Squared Deviations", readonly=True)
+    stddev = fields.Float(string="Std Dev (s)", compute='_compute_stddev')
+
+    _sql_constraints = [
+        ('segment_unique', 'unique(route_id, from_stop_id, to_stop_id, weekday, band)',
+         'Only one statistic per segment, weekday and band.'),
+    ]
+
+    @api.depends('count', 'm2')
+    def _compute_stddev(self):
+        for stat in self:
+            stat.stddev = (stat.m2 / (stat.count - 1)) ** 0.5 if stat.count > 1 else 0.0
+
+    def _eta_tz(self):
+        return pytz.timezone(self.env.company.partner_id.tz or 'UTC')
+
+    def _band_minutes(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param('school_transport.eta_band_minutes', 60))
+
+    def _slot(self, when, tz, band_minutes):
+        """``(weekday, band)`` of a naive UTC datetime, in local time."""
+        local = pytz.utc.localize(when).astimezone(tz)
+        return local.weekday(), (local.hour * 60 + local.minute) // band_minutes
+
+    @api.model
+    def _learn_segments(self, visits):
+        """Merge observed stop visits into the statistics.
+
+        :param visits: ``(route id, vehicle id, stop id, arrived, departed)``
+            tuples; consecutive visits of the same vehicle on the same route
+            give one segment observation (departure to next arrival)
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        max_segment = int(ICP.get_param('school_transport.eta_max_segment_minutes', 60)) * 60
+        tz, band_minutes = self._eta_tz(), self._band_minutes()
+
+        # Welford accumulators for this batch, merged into the table below.
+        acc = {}
+        last = {}
+        for route_id, vehicle_id, stop_id, arrived, departed in sorted(visits, key=lambda v: (v[0], v[1] or 0, v[3])):
+            prev = last.get((route_id, vehicle_id))
+            last[(route_id, vehicle_id)] = (stop_id, departed)
+            if not prev or prev[0] == stop_id:
+                continue
+            seconds = (arrived - prev[1]).total_seconds()
+            if not 0 < seconds <= max_segment:
+                continue
+            key = (route_id, prev[0], stop_id) + self._slot(prev[1], tz, band_minutes)
+            count, mean, m2 = acc.get(key, (0, 0.0, 0.0))
+            count += 1
+            delta = seconds - mean
+            mean += delta / count
+            m2 += delta * (seconds - mean)
+            acc[key] = (count, mean, m2)
+        if not acc:
+            return 0
+
+        now = fields.Datetime.now()
+        rows = [key + values + (self.env.uid, now, self.env.uid, now) for key, values in acc.items()]
+        # Chan et al. parallel merge of two (count, mean, M2) aggregates.
+        execute_values(self.env.cr._obj, """
+            INSERT INTO school_transport_eta_stat AS s
+                (route_id, from_stop_id, to_stop_id, weekday, band, count, mean, m2,
+                 create_uid, create_date, write_uid, write_date)
+            VALUES %s
+            ON CONFLICT (route_id, from_stop_id, to_stop_id, weekday, band) DO UPDATE
+               SET count = s.count + EXCLUDED.count,
+                   mean = s.mean + (EXCLUDED.mean - s.mean) * EXCLUDED.count::float8 / (s.count + EXCLUDED.count),
+                   m2 = s.m2 + EXCLUDED.m2
+                        + (EXCLUDED.mean - s.mean) ^ 2 * s.count::float8 * EXCLUDED.count / (s.count + EXCLUDED.count),
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """, rows)
+        self.invalidate_model()
+        return sum(values[0] for values in acc.values())
+
+    @api.model
+    def _visits_from_logs(self, rows, radius_km):
+        """Stop visits of check-in rows ``(route, vehicle, time, lat, lon)``.
+
+        Each tap is matched to the nearest stop of its route within
+        ``radius_km``; consecutive taps at the same stop form one visit.
+        """
+        route_ids = list({row[0] for row in rows})
+        self.env.cr.execute("""
+            SELECT route_id, id, latitude, longitude FROM school_transport_stop
+             WHERE route_id IN %s AND latitude != 0 AND longitude != 0
+        """, [tuple(route_ids)])
+        stops = {}
+        for route_id, stop_id, lat, lon in self.env.cr.fetchall():
+            stops.setdefault(route_id, ([], [], []))
+            for values, value in zip(stops[route_id], (stop_id, lat, lon)):
+                values.append(value)
+
+        visits = []
+        rows = sorted(rows, key=lambda r: (r[0], r[1] or 0, r[2]))
+        by_route = {}
+        for row in rows:
+            by_route.setdefault(row[0], []).append(row)
+        for route_id, route_rows in by_route.items():
+            if route_id not in stops:
+                continue
+            stop_ids, lats, lons = stops[route_id]
+            dist = geodesy.distance_matrix([r[3] for r in route_rows], [r[4] for r in route_rows], lats, lons)
+            nearest = dist.argmin(axis=1)
+            current = None
+            for i, (row, k) in enumerate(zip(route_rows, nearest.tolist())):
+                if dist[i, k] > radius_km:
+                    continue
+                vehicle_id, at = row[1], row[2]
+                if current and current[1] == vehicle_id and current[2] == stop_ids[k]:
+                    current[4] = at
+                    continue
+                current = [route_id, vehicle_id, stop_ids[k], at, at]
+                visits.append(current)
+        return [tuple(visit) for visit in visits]
+
+    @api.model
+    def _learn_from_trip_logs(self):
+        """Cron: learn segment times from trip logs created since the last run.
+
+        Progress is kept in ``school_transport.eta_log_cursor`` (last trip
+        log id), so each log is read once. Taps are matched to stops within
+        ``school_transport.stop_radius_m`` (default 75). Taps flagged
+        ``geofenced`` were learned live by the geofences and are skipped;
+        late taps the geofences ignored are learned here.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        cursor = int(ICP.get_param('school_transport.eta_log_cursor', 0))
+        radius_km = int(ICP.get_param('school_transport.stop_radius_m', 75)) / 1000.0
+        chunk_size = int(ICP.get_param('school_transport.eta_chunk_size', 20000))
+        deadline = time.monotonic() + int(ICP.get_param('school_transport.eta_time_budget', 240))
+
+        learned = 0
+        while time.monotonic() < deadline:
+            self.env.cr.execute("""
+                SELECT id, route_id, vehicle_id, timestamp, gps_lat, gps_lon
+                  FROM school_transport_trip_log
+                 WHERE id > %s AND route_id IS NOT NULL AND status = 'success'
+                   AND gps_lat != 0 AND gps_lon != 0
+                   AND geofenced IS NOT TRUE
+              ORDER BY id
+                 LIMIT %s
+            """, [cursor, chunk_size])
+            rows = self.env.cr.fetchall()
+            if not rows:
+                break
+            learned += self._learn_segments(self._visits_from_logs([row[1:] for row in rows], radius_km))
+            cursor = rows[-1][0]
+            ICP.set_param('school_transport.eta_log_cursor', cursor)
+            self.env.cr.commit()
+        _logger.info("ETA statistics: %s segment observations learned.", learned)
+
+
+class TransportRoute(models.Model):
+    _inherit = 'school.transport.route'
+
+    def _segment_times(self, when):
+        """Expected seconds between consecutive stops, for departures at ``when``.
+
+        Uses the statistics of the same weekday and time band, else of the
+        same band on any weekday, else of any time. Returns
+        ``{(from stop id, to stop id): (seconds, source)}``.
+        """
+        self.ensure_one()
+        Stat = self.env['school.transport.eta.stat']
+        weekday, band = Stat._slot(when, Stat._eta_tz(), Stat._band_minutes())
+        self.env.cr.execute("""
+            SELECT from_stop_id, to_stop_id, weekday, band, count, mean
+              FROM school_transport_eta_stat
+             WHERE route_id = %s
+        """, [self.id])
+        exact, same_band, overall = {}, {}, {}
+        for from_stop, to_stop, w, b, count, mean in self.env.cr.fetchall():
+            key = (from_stop, to_stop)
+            if w == weekday and b == band:
+                exact[key] = (count, mean)
+            for table, match in ((same_band, b == band), (overall, True)):
+                if match:
+                    n, total = table.get(key, (0, 0.0))
+                    table[key] = (n + count, total + count * mean)
+        times = {key: (total / n, 'history') for key, (n, total) in overall.items() if n}
+        times.update({key: (total / n, 'history') for key, (n, total) in same_band.items() if n})
+        times.update({key: (mean, 'history') for key, (_count, mean) in exact.items()})
+        return times
+
+    def _predict_etas(self, now=None):
+        """Predicted arrival at each upcoming stop from the vehicle's last position.
+
+        Segments without history are estimated from their length at
+        ``school_transport.eta_default_speed_kmh`` (default 25). No stops
+        are predicted, with status ``stale``, when the last position is
+        older than ``school_transport.eta_stale_minutes`` (default 10).
+        """
+        self.ensure_one()
+        now = now or fields.Datetime.now()
+        position = self.env['school.transport.vehicle.position'].search([('route_id', '=', self.id)], limit=1)
+        stops = self.stop_ids.sorted(lambda s: (s.sequence, s.id)).filtered(lambda s: s.latitude and s.longitude)
+        result = {'route_id': self.id, 'generated_at': fields.Datetime.to_string(now), 'stops': []}
+        if not position or not stops:
+            result['status'] = 'no_position' if stops else 'no_stops'
+            return result
+
+        ICP = self.env['ir.config_parameter'].sudo()
+        stale_after = timedelta(minutes=int(ICP.get_param('school_transport.eta_stale_minutes', 10)))
+        if not position.timestamp or position.timestamp < now - stale_after:
+            # The bus stopped reporting; any prediction would be made up.
+            result.update({
+                'status': 'stale',
+                'vehicle_id': position.vehicle_id.id,
+                'position_time': fields.Datetime.to_string(position.timestamp),
+            })
+            return result
+
+        speed = float(ICP.get_param('school_transport.eta_default_speed_kmh', 25)) / 3600.0
+        lats, lons = stops.mapped('latitude'), stops.mapped('longitude')
+        to_stops = geodesy.haversine(position.latitude, position.longitude, lats, lons)
+        legs = geodesy.haversine(lats[:-1], lons[:-1], lats[1:], lons[1:]) if len(stops) > 1 else []
+        k = int(to_stops.argmin())
+        # Past the nearest stop if the next one is closer to the bus than to it.
+        if k + 1 < len(stops) and to_stops[k + 1] < legs[k]:
+            k += 1
+        times = self._segment_times(position.timestamp)
+
+        # First upcoming stop: the share of its segment still to drive.
+        if k > 0 and legs[k - 1]:
+            seconds, source = times.get((stops[k - 1].id, stops[k].id), (legs[k - 1] / speed, 'distance'))
+            elapsed = seconds * min(float(to_stops[k] / legs[k - 1]), 1.0)
+        else:
+            elapsed, source = float(to_stops[k]) / speed, 'distance'
+        base = max(position.timestamp, now - timedelta(minutes=5))
+        upcoming = []
+        for i in range(k, len(stops)):
+            if i > k:
+                seconds, source = times.get((stops[i - 1].id, stops[i].id), (float(legs[i - 1]) / speed, 'distance'))
+                elapsed += seconds
+            eta = base + timedelta(seconds=elapsed)
+            upcoming.append({
+                'stop_id': stops[i].id,
+                'name': stops[i].name,
+                'eta': fields.Datetime.to_string(eta),
+                'minutes': max(round((eta - now).total_seconds() / 60.0), 0),
+                'source': source,
+            })
+        result.update({
+            'status': 'ok',
+            'vehicle_id': position.vehicle_id.id,
+            'position_time': fields.Datetime.to_string(position.timestamp),
+            'stops': upcoming,
+        })
+        return result
+
+    @tools.ormcache('self.id', 'position_seq', 'stats_version', 'bucket')
+    def _eta_payload(self, position_seq, stats_version, bucket):
+        """Serialized ``_predict_etas``, shared by all pollers until the bus
+        reports a new position, new history is learned or the time bucket
+        rolls over."""
+        return json.dumps(self._predict_etas())
+
+    def _eta_json(self):
+        """Cached ETA payload of this route, as a JSON string."""
+        self.ensure_one()
+        self.env.cr.execute("""
+            SELECT (SELECT max(seq) FROM school_transport_vehicle_position WHERE route_id = %s),
+                   (SELECT max(write_date) FROM school_transport_eta_stat WHERE route_id = %s)
+        """, [self.id, self.id])
+        position_seq, stats_date = self.env.cr.fetchone()
+        stats_version = str(stats_date)
+        return self._eta_payload(position_seq, stats_version, int(time.time() // ETA_CACHE_SECONDS))
@@ -0,0 +1,16 @@
+from odoo import models, fields
+
+
+class ExamGradeBand(models.Model):
+    _name = 'school.exam.grade.band'
+    _description = 'Exam Grade Band'
+    _order = 'min_percent desc'
+
+    name = fields.Char(string="Grade", required=True)
+    min_percent = fields.Float(string="Minimum (%)", required=True,
+                               help="Lowest percentage of the maximum marks that earns this grade")
+    active = fields.Boolean(string="Active", default=True)
+
+    _sql_constraints = [
+        ('min_percent_unique', 'unique(min_percent)', 'Two grade bands cannot start at the same percentage.'),
+    ]
@@ -0,0 +1,175 @@
+from odoo import models, fields, api, tools, _
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Result fields the rankings are computed from.
+RANKING_FIELDS = ('exam_id', 'student_id', 'marks_obtained', 'grade', 'status')
+
+
+class ExamRanking(models.Model):
+    """
+    Rank and percentile of every result within its exam and class, with
+    the class mean and the z-score of the marks. Rows are recomputed with
+    SQL window functions, one exam at a time, whenever results of the exam
+    change; nothing is computed when the report is read.
+    """
+    _name = 'school.exam.ranking'
+    _description = 'Exam Ranking'
+    _order = 'exam_id, class_id, rank, student_id'
+    _rec_name = 'student_id'
+
+    exam_id = fields.Many2one('school.exam', string="Exam", required=True, readonly=True, index=True, ondelete='cascade')
+    class_id = fields.Many2one('school.class', string="Class", readonly=True, index=True, ondelete='cascade')
+    student_id = fields.Many2one('school.student', string="Student", required=True, readonly=True, ondelete='cascade')
+    result_id = fields.Many2one('school.exam.result', string="Result", required=True, readonly=True, ondelete='cascade')
+    marks = fields.Integer(string="Marks", readonly=True, aggregator='avg')
+    grade = fields.Char(string="Grade", readonly=True)
+    status = fields.Selection([('pass', 'Pass'), ('fail', 'Fail')], string="Status", readonly=True)
+    rank = fields.Integer(string="Rank", readonly=True, aggregator=None, help="Rank in the class, 1 for the best marks")
+    percentile = fields.Float(string="Percentile", readonly=True, digits=(5, 2), aggregator=None,
+                              help="Share of the class with lower marks, in percent")
+    class_mean = fields.Float(string="Class Mean", readonly=True, digits=(10, 2), aggregator=None)
+    z_score = fields.Float(string="Z-Score", readonly=True, digits=(10, 2), aggregator=None,
+                           help="Distance of the marks from the class mean, in standard deviations")
+
+    def init(self):
+        self.env.cr.execute("SELECT 1 FROM school_exam_ranking LIMIT 1")
+        if not self.env.cr.fetchone():
+            # First install on a database with existing results.
+            self._refresh()
+
+    @api.model
+    def _refresh(self, exam_ids=None):
+        """Recompute the rankings of ``exam_ids``, or of every exam."""
+        if exam_ids is not None:
+            exam_ids = tuple(exam_id for exam_id in exam_ids if exam_id)
+            if not exam_ids:
+                return
+        self.env['school.exam.result'].flush_model(RANKING_FIELDS)
+        self.env['school.student'].flush_model(['class_id'])
+        condition = "exam_id IN %(exam_ids)s" if exam_ids else "TRUE"
+        self.env.cr.execute(f"DELETE FROM school_exam_ranking WHERE {condition}", {'exam_ids': exam_ids})
+        condition = "r.exam_id IN %(exam_ids)s" if exam_ids else "TRUE"
+        self.env.cr.execute(f"""
+            INSERT INTO school_exam_ranking
+                (exam_id, class_id, student_id, result_id, marks, grade, status,
+                 rank, percentile, class_mean, z_score,
+                 create_uid, create_date, write_uid, write_date)
+            SELECT exam_id, class_id, student_id, id, marks, grade, status,
+                   rank() OVER (PARTITION BY exam_id, class_id ORDER BY marks DESC),
+                   round((percent_rank() OVER (PARTITION BY exam_id, class_id ORDER BY marks) * 100)::numeric, 2),
+                   avg(marks) OVER w,
+                   coalesce((marks - avg(marks) OVER w) / nullif(stddev_samp(marks) OVER w, 0), 0),
+                   %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+              FROM (SELECT r.exam_id, s.class_id, r.student_id, r.id,
+                           coalesce(r.marks_obtained, 0) AS marks, r.grade, r.status
+                      FROM school_exam_result r
+                      JOIN school_student s ON s.id = r.student_id
+                     WHERE {condition}) results
+            WINDOW w AS (PARTITION BY exam_id, class_id)
+        """, {'exam_ids': exam_ids, 'uid': self.env.uid})
+        self.invalidate_model()
+
+
+class ExamClassStatistics(models.Model):
+    """
+    Mean, spread and pass rate of each exam per class, aggregated by a SQL
+    view over the precomputed rankings.
+    """
+    _name = 'school.exam.class.stat'
+    _description = 'Exam Class Statistics'
+    _auto = False
+    _order = 'exam_id, class_id'
+
+    exam_id = fields.Many2one('school.exam', string="Exam", readonly=True)
+    class_id = fields.Many2one('school.class', string="Class", readonly=True)
+    student_count = fields.Integer(string="Students", readonly=True)
+    mean = fields.Float(string="Mean", readonly=True, digits=(10, 2), aggregator='avg')
+    stddev = fields.Float(string="Std Dev", readonly=True, digits=(10, 2), aggregator='avg')
+    median = fields.Float(string="Median", readonly=True, digits=(10, 2), aggregator=None)
+    min_marks = fields.Integer(string="Lowest", readonly=True, aggregator='min')
+    max_marks = fields.Integer(string="Highest", readonly=True, aggregator='max')
+    pass_count = fields.Integer(string="Passed", readonly=True)
+    pass_rate = fields.Float(string="Pass Rate (%)", readonly=True, digits=(5, 2), aggregator='avg')
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute(f"""
+            CREATE VIEW {self._table} AS (
+                SELECT min(id) AS id,
+                       exam_id,
+                       class_id,
+                       count(*) AS student_count,
+                       avg(marks) AS mean,
+                       coalesce(stddev_samp(marks), 0) AS stddev,
+                       percentile_cont(0.5) WITHIN GROUP (ORDER BY marks) AS median,
+                       min(marks) AS min_marks,
+                       max(marks) AS max_marks,
+                       count(*) FILTER (WHERE status = 'pass') AS pass_count,
+                       100.0 * count(*) FILTER (WHERE status = 'pass') / count(*) AS pass_rate
+                  FROM school_exam_ranking
+              GROUP BY exam_id, class_id
+            )
+        """)
+
+
+class Exam(models.Model):
+    _inherit = 'school.exam'
+
+    def action_view_ranking(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _("Rankings: %s", self.name),
+            'res_model': 'school.exam.ranking',
+            'view_mode': 'list',
+            'domain': [('exam_id', '=', self.id)],
+            'context': {'search_default_group_by_class': 1},
+        }
+
+    def action_view_class_stats(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _("Class Statistics: %s", self.name),
+            'res_model': 'school.exam.class.stat',
+            'view_mode': 'list,graph',
+            'domain': [('exam_id', '=', self.id)],
+        }
+
+
+class ExamResult(models.Model):
+    _inherit = 'school.exam.result'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        results = super().create(vals_list)
+        self.env['school.exam.ranking']._refresh(set(results.exam_id.ids))
+        return results
+
+    def write(self, vals):
+        if not any(name in vals for name in RANKING_FIELDS):
+            return super().write(vals)
+        exam_ids = set(self.exam_id.ids)
+        res = super().write(vals)
+        self.env['school.exam.ranking']._refresh(exam_ids | set(self.exam_id.ids))
+        return res
+
+    def unlink(self):
+        exam_ids = set(self.exam_id.ids)
+        res = super().unlink()
+        self.env['school.exam.ranking']._refresh(exam_ids)
+        return res
+
+
+class Student(models.Model):
+    _inherit = 'school.student'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'class_id' in vals:
+            # Students are ranked within their class.
+            self.env['school.exam.ranking']._refresh(set(
+                self.env['school.exam.result'].search([('student_id', 'in', self.ids)]).exam_id.ids))
+        return res
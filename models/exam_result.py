@@ -1,4 +1,13 @@
-from odoo import models, fields
+from odoo import models, fields, api
+import logging
+
+from ..tools import grading
+from ..tools.sheet import cell_text, chunked
+
+_logger = logging.getLogger(__name__)
+
+# Rows graded and created per create() call during imports.
+IMPORT_CHUNK_SIZE = 1000
 
 
 class ExamResult(models.Model):
@@ -11,3 +20,76 @@ class ExamResult(models.Model):
     grade = fields.Char(string="Grade")
     status = fields.Selection([('pass', 'Pass'), ('fail', 'Fail')], string="Status")
     admission_no = fields.Char(string="Admission No")
+
+    @api.model
+    def _grade_marks(self, exam, marks):
+        """``(grades, statuses)`` of ``marks`` in ``exam``, from the active grade bands."""
+        bands = self.env['school.exam.grade.band'].search([])
+        grades, passed = grading.grade(marks, exam.max_marks, exam.passing_marks,
+                                       bands.mapped('min_percent'), bands.mapped('name'))
+        return [g or False for g in grades], ['pass' if p else 'fail' for p in passed]
+
+    @api.model
+    def _import_marks(self, exam, rows, replace_existing=False):
+        """Create the results of ``exam`` from ``(line, admission no, marks)`` rows.
+
+        Admission numbers are resolved through a map of all students built
+        with one query; each chunk of rows is graded in one vectorized pass
+        and created with one ``create()``. Students who already have a
+        result for the exam are skipped, or their result is replaced if
+        ``replace_existing``.
+
+        :return: ``(imported, skipped, errors)``, ``errors`` being a list of
+            ``(line, message)``
+        """
+        self.env.cr.execute("SELECT admission_no, id FROM school_student WHERE admission_no IS NOT NULL")
+        students = {admission_no.strip(): student_id for admission_no, student_id in self.env.cr.fetchall()}
+        self.flush_model(['exam_id', 'student_id'])
+        self.env.cr.execute("SELECT student_id FROM school_exam_result WHERE exam_id = %s", [exam.id])
+        existing = {student_id for student_id, in self.env.cr.fetchall()}
+
+        imported, skipped, errors, seen = 0, 0, [], set()
+        for chunk in chunked(rows, IMPORT_CHUNK_SIZE):
+            parsed = []
+            for line, admission_no, marks in chunk:
+                admission_no = cell_text(admission_no)
+                student_id = students.get(admission_no)
+                if not student_id:
+                    errors.append((line, f"Unknown admission number '{admission_no}'."))
+                    continue
+                try:
+                    marks = float(cell_text(marks))
+                except ValueError:
+                    errors.append((line, f"Invalid marks '{cell_text(marks)}'."))
+                    continue
+                if not marks.is_integer() or marks < 0 or (exam.max_marks and marks > exam.max_marks):
+                    errors.append((line, f"Marks {cell_text(marks)} are not a whole number from 0 to the maximum marks."))
+                    continue
+                if student_id in seen:
+                    errors.append((line, f"Admission number '{admission_no}' appears more than once."))
+                    continue
+                seen.add(student_id)
+                if student_id in existing and not replace_existing:
+                    skipped += 1
+                    continue
+                parsed.append((student_id, admission_no, int(marks)))
+            if not parsed:
+                continue
+
+            if replace_existing:
+                replaced = [student_id for student_id, _adm, _marks in parsed if student_id in existing]
+                if replaced:
+                    self.search([('exam_id', '=', exam.id), ('student_id', 'in', replaced)]).unlink()
+            grades, statuses = self._grade_marks(exam, [marks for _sid, _adm, marks in parsed])
+            self.create([{
+                'exam_id': exam.id,
+                'student_id': student_id,
+                'admission_no': admission_no,
+                'marks_obtained': marks,
+                'grade': grade,
+                'status': status,
+            } for (student_id, admission_no, marks), grade, status in zip(parsed, grades, statuses)])
+            imported += len(parsed)
+        _logger.info("Exam %s: %s results imported, %s skipped, %s rejected.",
+                     exam.display_name, imported, skipped, len(errors))
+        return imported, skipped, errors
@@ -18,7 +18,7 @@ class FeePayment(models.Model):
     balance_amount = fields.Float(string="Balance Amount", compute="_compute_balance_amount", store=True)
     note = fields.Text(string="Remarks / Description")
 
-    @api.depends('fee_type')
+    @api.depends('fee_type.amount')
     def _compute_total_amount(self):
         for record in self:
             record.total_amount = record.fee_type.amount if record.fee_type else 0.0
@@ -0,0 +1,53 @@
+from odoo import models, fields, tools
+
+
+class FeeLedger(models.Model):
+    """
+    Amount due, paid and outstanding per student, academic year and fee
+    type, aggregated by a SQL view over the fee payments. The amount due
+    is read from the fee type, so editing a fee type is reflected at once.
+    Only fees with at least one payment appear.
+    """
+    _name = 'school.fee.ledger'
+    _description = 'Student Fee Ledger'
+    _auto = False
+    _order = 'academic_year desc, balance_amount desc'
+
+    student_id = fields.Many2one('school.student', string="Student", readonly=True)
+    class_id = fields.Many2one('school.class', string="Class", readonly=True)
+    academic_year = fields.Char(string="Academic Year", readonly=True)
+    fee_type_id = fields.Many2one('school.fee.type', string="Fee Type", readonly=True)
+    amount_due = fields.Float(string="Amount Due", readonly=True)
+    amount_paid = fields.Float(string="Amount Paid", readonly=True)
+    balance_amount = fields.Float(string="Balance", readonly=True)
+    payment_count = fields.Integer(string="Payments", readonly=True)
+    last_payment_date = fields.Date(string="Last Payment", readonly=True, aggregator='max')
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS school_fee_payment_ledger_index
+                ON school_fee_payment (admission_no, academic_year, fee_type)
+        """)
+        self.env.cr.execute(f"""
+            CREATE VIEW {self._table} AS (
+                SELECT p.id,
+                       p.admission_no AS student_id,
+                       s.class_id,
+                       p.academic_year,
+                       p.fee_type AS fee_type_id,
+                       coalesce(t.amount, 0) AS amount_due,
+                       p.amount_paid,
+                       coalesce(t.amount, 0) - p.amount_paid AS balance_amount,
+                       p.payment_count,
+                       p.last_payment_date
+                  FROM (SELECT min(id) AS id, admission_no, academic_year, fee_type,
+                               sum(amount_paid) AS amount_paid,
+                               count(*) AS payment_count,
+                               max(payment_date) AS last_payment_date
+                          FROM school_fee_payment
+                      GROUP BY admission_no, academic_year, fee_type) p
+                  JOIN school_student s ON s.id = p.admission_no
+             LEFT JOIN school_fee_type t ON t.id = p.fee_type
+            )
+        """)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import logging
+from datetime import timedelta
+
+from odoo import models, fields, api
+
+_logger = logging.getLogger(__name__)
+
+ADDRESS_KEYS = ('street', 'city', 'state', 'country', 'postalcode')
+DEFAULT_TTL_DAYS = 90
+DEFAULT_NEGATIVE_TTL_DAYS = 7
+DEFAULT_MAX_ENTRIES = 50000
+
+
+def normalize_address(street=None, city=None, state=None, country=None, postalcode=None):
+    """Return the normalized (street, city, state, country, postalcode) tuple.
+
+    Values are case-folded and whitespace-collapsed so that trivially
+    different spellings of the same address share one cache entry.
+    """
+    values = (street, city, state, country, postalcode)
+    return tuple(' '.join(str(v).split()).casefold() if v else '' for v in values)
+
+
+def address_key(address, limit=1):
+    """Fixed-width cache key for a normalized address tuple."""
+    raw = '\x1f'.join(address) + '\x1f%s' % limit
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class GeocodeCache(models.Model):
+    """
+    Persistent cache of Nominatim results, keyed on the normalized address.
+    """
+    _name = 'schoolbus.geocode.cache'
+    _description = 'Geocoding Result Cache'
+    _order = 'last_hit desc'
+
+    key = fields.Char(string="Key", required=True, index=True, readonly=True)
+    street = fields.Char(string="Street", readonly=True)
+    city = fields.Char(string="City", readonly=True)
+    state = fields.Char(string="State", readonly=True)
+    country = fields.Char(string="Country", readonly=True)
+    postalcode = fields.Char(string="Postal Code", readonly=True)
+    result = fields.Text(string="Result (JSON)", readonly=True)
+    found = fields.Boolean(string="Found", readonly=True)
+    expires_at = fields.Datetime(string="Expires At", index=True, readonly=True)
+    hit_count = fields.Integer(string="Hits", readonly=True)
+    last_hit = fields.Datetime(string="Last Hit", readonly=True)
+
+    _sql_constraints = [
+        ('key_unique', 'unique(key)', 'Geocoding cache keys must be unique.'),
+    ]
+
+    def _get_param_int(self, name, default):
+        value = self.env['ir.config_parameter'].sudo().get_param(name)
+        try:
+            return int(value) if value else default
+        except ValueError:
+            return default
+
+    @api.model
+    def _lookup_many(self, addresses, limit=1):
+        """Return ``{address: results}`` for the cached entries among ``addresses``.
+
+        Misses are absent from the result; an empty list is a cached
+        negative result.
+        """
+        keys = {address_key(address, limit): address for address in addresses}
+        if not keys:
+            return {}
+        self.env.cr.execute("""
+            UPDATE schoolbus_geocode_cache
+               SET hit_count = hit_count + 1, last_hit = now() at time zone 'UTC'
+             WHERE key IN %s AND expires_at > now() at time zone 'UTC'
+         RETURNING key, result
+        """, [tuple(keys)])
+        return {keys[key]: json.loads(result or '[]') for key, result in self.env.cr.fetchall()}
+
+    @api.model
+    def _store(self, address, results, limit=1):
+        """Insert or refresh the cache entry for ``address``."""
+        if results:
+            ttl = self._get_param_int('schoolbus.geocode_cache_ttl_days', DEFAULT_TTL_DAYS)
+        else:
+            ttl = self._get_param_int('schoolbus.geocode_cache_negative_ttl_days', DEFAULT_NEGATIVE_TTL_DAYS)
+        now = fields.Datetime.now()
+        # Concurrent workers may geocode the same address; upsert so the
+        # loser of the race refreshes the row instead of failing.
+        self.env.cr.execute("""
+            INSERT INTO schoolbus_geocode_cache
+                (key, street, city, state, country, postalcode, result, found,
+                 expires_at, hit_count, last_hit, create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 0, %s, %s, %s, %s, %s)
+            ON CONFLICT (key) DO UPDATE
+               SET result = EXCLUDED.result,
+                   found = EXCLUDED.found,
+                   expires_at = EXCLUDED.expires_at,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """, [
+            address_key(address, limit), *(v or None for v in address),
+            json.dumps(results or []), bool(results), now + timedelta(days=ttl),
+            now, self.env.uid, now, self.env.uid, now,
+        ])
+
+    @api.model
+    def _gc_expired(self):
+        """Cron: drop expired entries and trim the cache to its size limit."""
+        self.env.cr.execute(
+            "DELETE FROM schoolbus_geocode_cache WHERE expires_at <= now() at time zone 'UTC'")
+        expired = self.env.cr.rowcount
+        max_entries = self._get_param_int('schoolbus.geocode_cache_max_entries', DEFAULT_MAX_ENTRIES)
+        self.env.cr.execute("""
+            DELETE FROM schoolbus_geocode_cache
+             WHERE id IN (SELECT id FROM schoolbus_geocode_cache
+                           ORDER BY last_hit DESC NULLS LAST, id DESC
+                          OFFSET %s)
+        """, [max_entries])
+        evicted = self.env.cr.rowcount
+        self.invalidate_model()
+        _logger.info("Geocode cache cleanup: %s expired, %s evicted.", expired, evicted)
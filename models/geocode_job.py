@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import time
+
+from odoo import models, fields, api, _
+
+_logger = logging.getLogger(__name__)
+
+
+class GeocodeJob(models.Model):
+    """
+    Background geocoding of a list of records, processed by cron in
+    committed chunks.
+    """
+    _name = 'school.geocode.job'
+    _description = 'Geocoding Job'
+    _order = 'id desc'
+
+    name = fields.Char(string="Description", required=True)
+    res_model = fields.Char(string="Model", required=True, readonly=True)
+    res_ids = fields.Text(string="Record IDs (JSON)", required=True, readonly=True)
+    user_id = fields.Many2one('res.users', string="Requested By", default=lambda self: self.env.user, readonly=True)
+    state = fields.Selection([
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('cancelled', 'Cancelled'),
+        ('failed', 'Failed'),
+    ], string="Status", default='queued', required=True, readonly=True, index=True)
+    total = fields.Integer(string="Total", readonly=True)
+    position = fields.Integer(string="Processed", readonly=True)
+    done_count = fields.Integer(string="Geocoded", readonly=True)
+    failed_count = fields.Integer(string="Failed", readonly=True)
+    remaining = fields.Integer(string="Remaining", compute='_compute_progress')
+    progress = fields.Float(string="Progress", compute='_compute_progress')
+    date_started = fields.Datetime(string="Started", readonly=True)
+    date_finished = fields.Datetime(string="Finished", readonly=True)
+    error = fields.Text(string="Error", readonly=True)
+
+    @api.depends('total', 'position')
+    def _compute_progress(self):
+        for job in self:
+            job.remaining = job.total - job.position
+            job.progress = 100.0 * job.position / job.total if job.total else 100.0
+
+    @api.model
+    def _enqueue(self, res_model, res_ids):
+        """Create a queued job for ``res_ids`` and wake up the job runner."""
+        model_name = self.env['ir.model']._get(res_model).name or res_model
+        job = self.sudo().create({
+            'name': _("Geocode %(count)s %(model)s", count=len(res_ids), model=model_name),
+            'res_model': res_model,
+            'res_ids': json.dumps(list(res_ids)),
+            'total': len(res_ids),
+            'user_id': self.env.uid,
+        })
+        cron = self.env.ref('at_school_management.ir_cron_geocode_jobs', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        return job
+
+    def action_cancel(self):
+        self.filtered(lambda j: j.state in ('queued', 'running')).write({
+            'state': 'cancelled',
+            'date_finished': fields.Datetime.now(),
+        })
+
+    def action_refresh(self):
+        """Reload the progress dialog."""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def _progress_data(self):
+        """Progress summary served to the UI."""
+        self.ensure_one()
+        return {
+            'id': self.id,
+            'state': self.state,
+            'total': self.total,
+            'done': self.done_count,
+            'failed': self.failed_count,
+            'remaining': self.remaining,
+            'progress': round(self.progress, 1),
+        }
+
+    def _run_chunk(self, chunk_size):
+        """Geocode the next chunk of this job and record the outcome."""
+        ids = json.loads(self.res_ids)[self.position:self.position + chunk_size]
+        records = self.env[self.res_model].browse(ids).exists()
+        records.geocode_record()
+        geocoded = len(records.filtered(lambda r: r.geocode_state == 'done'))
+        position = self.position + len(ids)
+        vals = {
+            'position': position,
+            'done_count': self.done_count + geocoded,
+            'failed_count': self.failed_count + len(ids) - geocoded,
+        }
+        if position >= self.total:
+            vals.update(state='done', date_finished=fields.Datetime.now())
+        self.write(vals)
+
+    @api.model
+    def _process_jobs(self):
+        """Cron: work through queued jobs, committing after every chunk.
+
+        Cancellation is checked between chunks; when the time budget runs
+        out the cron re-triggers itself to continue.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        chunk_size = int(ICP.get_param('schoolbus.geocode_job_chunk_size', 50))
+        deadline = time.monotonic() + int(ICP.get_param('schoolbus.geocode_job_time_budget', 240))
+        for job in self.search([('state', 'in', ('queued', 'running'))], order='id'):
+            if job.state == 'queued':
+                job.write({'state': 'running', 'date_started': fields.Datetime.now()})
+                self.env.cr.commit()
+            while job.state == 'running':
+                if time.monotonic() > deadline:
+                    self.env.ref('at_school_management.ir_cron_geocode_jobs')._trigger()
+                    return
+                try:
+                    job._run_chunk(chunk_size)
+                except Exception as e:
+                    self.env.cr.rollback()
+                    job.invalidate_recordset()
+                    if job.state == 'cancelled':
+                        break
+                    _logger.exception("Geocoding job %s failed", job.id)
+                    job.write({'state': 'failed', 'error': str(e), 'date_finished': fields.Datetime.now()})
+                self.env.cr.commit()
+                job.invalidate_recordset(['state'])
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from odoo import models, fields, api
+from odoo.tools import SQL
+from odoo.tools.sql import column_exists
+
+from ..tools import geodesy, geohash
+
+_logger = logging.getLogger(__name__)
+
+GEOCODE_STATES = [
+    ('pending', 'Pending'),
+    ('done', 'Geocoded'),
+    ('retry', 'Retry Scheduled'),
+    ('failed', 'Failed'),
+    ('no_address', 'No Address'),
+]
+
+
+class GeocodeMixin(models.AbstractModel):
+    """
+    Shared geocoding behaviour for records with a latitude/longitude pair.
+
+    Inheriting models name their coordinate and address fields and
+    override ``_geocode_query``.
+    """
+    _name = 'schoolbus.geocode.mixin'
+    _description = 'Geocoding Mixin'
+
+    _geocode_lat_field = 'x_lat'
+    _geocode_lon_field = 'x_lon'
+    _geocode_address_fields = ()
+
+    geocode_state = fields.Selection(
+        GEOCODE_STATES, string="Geocoding Status", default='pending',
+        required=True, readonly=True, index=True, copy=False)
+    geocode_attempts = fields.Integer(string="Geocoding Attempts", readonly=True, copy=False)
+    geocode_next_retry = fields.Datetime(string="Next Geocoding Retry", readonly=True, index=True, copy=False)
+    geocode_error = fields.Char(string="Last Geocoding Error", readonly=True, copy=False)
+    geohash = fields.Char(string="Geohash", compute='_compute_geohash', store=True, copy=False,
+                          help="Spatial key of the coordinates, used for proximity searches")
+
+    def init(self):
+        super().init()
+        if self._abstract:
+            return
+        # Prefix (LIKE 'abc%') lookups need a pattern index under any collation.
+        self.env.cr.execute(SQL(
+            "CREATE INDEX IF NOT EXISTS %s ON %s (geohash text_pattern_ops)",
+            SQL.identifier(f'{self._table}_geohash_prefix_index'),
+            SQL.identifier(self._table),
+        ))
+
+    @api.depends(lambda self: (self._geocode_lat_field, self._geocode_lon_field))
+    def _compute_geohash(self):
+        for record in self:
+            lat, lon = record[self._geocode_lat_field], record[self._geocode_lon_field]
+            record.geohash = geohash.encode(lat, lon) if lat and lon else False
+
+    def _auto_init(self):
+        new_column = not column_exists(self.env.cr, self._table, 'geocode_state')
+        res = super()._auto_init()
+        if new_column:
+            # Records geocoded before the status column existed are done.
+            self.env.cr.execute(SQL(
+                "UPDATE %s SET geocode_state = 'done' WHERE %s != 0 AND %s != 0",
+                SQL.identifier(self._table),
+                SQL.identifier(self._geocode_lat_field),
+                SQL.identifier(self._geocode_lon_field),
+            ))
+        return res
+
+    def _geocode_placed(self, vals):
+        """Whether ``vals`` places the record by hand, with both coordinates
+        set and no geocoding status of their own."""
+        return bool(vals.get(self._geocode_lat_field) and vals.get(self._geocode_lon_field)
+                    and 'geocode_state' not in vals)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        # Records created with coordinates (demo data, imports, hand-placed
+        # stops) must not be picked up by the geocoding cron.
+        vals_list = [dict(vals, geocode_state='done') if self._geocode_placed(vals) else vals
+                     for vals in vals_list]
+        return super().create(vals_list)
+
+    def write(self, vals):
+        if self._geocode_placed(vals):
+            vals = dict(vals, geocode_state='done', geocode_attempts=0,
+                        geocode_next_retry=False, geocode_error=False)
+        elif any(name in vals for name in self._geocode_address_fields):
+            vals = dict(vals, geocode_state='pending', geocode_attempts=0,
+                        geocode_next_retry=False, geocode_error=False)
+        return super().write(vals)
+
+    @api.model
+    def _search_bbox(self, min_lat, min_lon, max_lat, max_lon, domain=None, limit=None):
+        """Records whose coordinates lie inside the box."""
+        cells = geohash.cover(min_lat, min_lon, max_lat, max_lon)
+        cell_domain = ['|'] * (len(cells) - 1) + [('geohash', '=like', cell + '%') for cell in cells]
+        lat_field, lon_field = self._geocode_lat_field, self._geocode_lon_field
+        return self.search((domain or []) + cell_domain + [
+            (lat_field, '>=', min_lat), (lat_field, '<=', max_lat),
+            (lon_field, '>=', min_lon), (lon_field, '<=', max_lon),
+        ], limit=limit)
+
+    @api.model
+    def _search_nearby(self, lat, lon, radius_km, domain=None, limit=None):
+        """Records within ``radius_km`` of a point, nearest first.
+
+        Candidates come from the geohash index and are refined by exact
+        distance. Returns ``(records, distances in km)``.
+        """
+        candidates = self._search_bbox(*geohash.radius_box(lat, lon, radius_km), domain=domain)
+        if not candidates:
+            return candidates, []
+        distances = geodesy.haversine(
+            lat, lon, candidates.mapped(self._geocode_lat_field), candidates.mapped(self._geocode_lon_field))
+        order = [i for i in distances.argsort(kind='stable').tolist() if distances[i] <= radius_km][:limit]
+        return candidates.browse([candidates.ids[i] for i in order]), [float(distances[i]) for i in order]
+
+    def _geocode_query(self):
+        """Return the structured address of this record, or False if it has none.
+
+        Inheriting models override this; by default records have no
+        address and are marked ``no_address``.
+        """
+        return False
+
+    def _geocode_retry_vals(self, error):
+        """Values recording one more failed attempt, with exponential backoff."""
+        ICP = self.env['ir.config_parameter'].sudo()
+        max_attempts = int(ICP.get_param('schoolbus.geocode_max_attempts', 8))
+        base = int(ICP.get_param('schoolbus.geocode_retry_base_minutes', 60))
+        attempts = self.geocode_attempts + 1
+        if attempts >= max_attempts:
+            return {'geocode_state': 'failed', 'geocode_attempts': attempts,
+                    'geocode_next_retry': False, 'geocode_error': error}
+        delay = min(base * 2 ** (attempts - 1), 30 * 24 * 60)
+        return {
+            'geocode_state': 'retry',
+            'geocode_attempts': attempts,
+            'geocode_next_retry': fields.Datetime.now() + timedelta(minutes=delay),
+            'geocode_error': error,
+        }
+
+    def geocode_record(self):
+        """Button-callable method to geocode the selected records.
+
+        All addresses go through one batch lookup, and records ending up
+        with identical values are written together. Failed lookups only
+        update the geocoding status; existing coordinates are kept.
+        """
+        service = self.env['schoolbus.osm']
+        lat_field, lon_field = self._geocode_lat_field, self._geocode_lon_field
+        records, queries = [], []
+        updates = defaultdict(list)
+        for record in self:
+            query = record._geocode_query()
+            if query:
+                records.append(record)
+                queries.append(query)
+            else:
+                # Coordinates placed by hand are kept; only the status changes.
+                vals = {'geocode_state': 'no_address', 'geocode_attempts': 0,
+                        'geocode_next_retry': False, 'geocode_error': False}
+                updates[tuple(sorted(vals.items()))].append(record.id)
+
+        errors = {}
+        results = service._osm_geocode_batch(queries, limit=1, errors=errors) if queries else []
+        failed = 0
+        for index, (record, result) in enumerate(zip(records, results)):
+            if result:
+                vals = {
+                    lat_field: float(result[0].get('lat') or 0.0),
+                    lon_field: float(result[0].get('lon') or 0.0),
+                    'geocode_state': 'done',
+                    'geocode_attempts': 0,
+                    'geocode_next_retry': False,
+                    'geocode_error': False,
+                }
+            else:
+                failed += 1
+                vals = record._geocode_retry_vals(errors.get(index, "No geocoding result"))
+            updates[tuple(sorted(vals.items()))].append(record.id)
+
+        for vals, ids in updates.items():
+            self.browse(ids).write(dict(vals))
+        _logger.info("Geocoded %s %s record(s), %s without result.", len(self), self._name, failed)
+
+    @api.model
+    def _run_geocode_cron(self):
+        """Called by cron job to geocode records that are due.
+
+        Due records are scanned in id order from a persisted cursor, one
+        committed chunk at a time, until the time budget is spent. Failing
+        records are pushed back with exponential backoff, so they never
+        crowd out new ones.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        budget = int(ICP.get_param('schoolbus.geocode_cron_time_budget', 240))
+        chunk_size = int(ICP.get_param('schoolbus.geocode_cron_chunk_size', 50))
+        cursor_key = 'schoolbus.geocode_cursor.%s' % self._name
+        cursor = int(ICP.get_param(cursor_key, 0))
+        domain = [
+            ('geocode_state', 'in', ('pending', 'retry')),
+            '|', ('geocode_next_retry', '=', False),
+            ('geocode_next_retry', '<=', fields.Datetime.now()),
+        ]
+
+        deadline = time.monotonic() + budget
+        processed, wrapped = 0, False
+        while time.monotonic() < deadline:
+            records = self.search(domain + [('id', '>', cursor)], order='id', limit=chunk_size)
+            if not records:
+                if wrapped or not cursor:
+                    cursor = 0
+                    break
+                # Reached the end: restart once from the beginning for rows
+                # that became due behind the cursor.
+                cursor, wrapped = 0, True
+                continue
+            records.geocode_record()
+            cursor = records[-1].id
+            processed += len(records)
+            ICP.set_param(cursor_key, cursor)
+            self.env.cr.commit()
+
+        ICP.set_param(cursor_key, cursor)
+        _logger.info("Geocoding cron for %s processed %s record(s).", self._name, processed)
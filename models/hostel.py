@@ -1,4 +1,9 @@
 from odoo import models, fields, api
+from collections import Counter
+import logging
+from psycopg2.extras import execute_values
+
+_logger = logging.getLogger(__name__)
 
 
 class Hostel(models.Model):
@@ -22,20 +27,54 @@ class HostelRoom(models.Model):
     name = fields.Char(string="Room Number", required=True)
     hostel_id = fields.Many2one('hostel', string="Hostel", required=True)
     capacity = fields.Integer(string="Capacity", default=2)
-    current_occupancy = fields.Integer(string="Occupied", compute='_compute_occupancy')
-    available_beds = fields.Integer(string="Available", compute='_compute_available_beds')
+    current_occupancy = fields.Integer(string="Occupied", readonly=True, default=0,
+                                       help="Active allocations, maintained as allocations change")
+    available_beds = fields.Integer(string="Available", compute='_compute_available_beds', store=True)
     student_ids = fields.One2many('hostel.student', 'room_id', string="Students")
 
-    @api.depends('student_ids')
-    def _compute_occupancy(self):
-        for room in self:
-            room.current_occupancy = len(room.student_ids)
+    def init(self):
+        # Counters of rooms created before they were stored, or drifted by
+        # direct SQL edits, are rebuilt on every module update.
+        self._rebuild_occupancy()
 
     @api.depends('capacity', 'current_occupancy')
     def _compute_available_beds(self):
         for room in self:
             room.available_beds = room.capacity - room.current_occupancy
 
+    @api.model
+    def _rebuild_occupancy(self):
+        """Recount the active allocations of every room."""
+        self.env.cr.execute("""
+            UPDATE hostel_room r
+               SET current_occupancy = a.occupied,
+                   available_beds = coalesce(r.capacity, 0) - a.occupied
+              FROM (SELECT room.id, count(s.id) AS occupied
+                      FROM hostel_room room
+                 LEFT JOIN hostel_student s ON s.room_id = room.id AND s.status = 'active'
+                  GROUP BY room.id) a
+             WHERE r.id = a.id
+               AND (r.current_occupancy IS DISTINCT FROM a.occupied
+                    OR r.available_beds IS DISTINCT FROM coalesce(r.capacity, 0) - a.occupied)
+        """)
+        self.invalidate_model(['current_occupancy', 'available_beds'])
+
+    @api.model
+    def _add_occupancy(self, deltas):
+        """Apply ``{room id: change in active allocations}`` in one UPDATE."""
+        deltas = {room_id: delta for room_id, delta in deltas.items() if room_id and delta}
+        if not deltas:
+            return
+        self.flush_model(['capacity', 'current_occupancy', 'available_beds'])
+        execute_values(self.env.cr._obj, """
+            UPDATE hostel_room r
+               SET current_occupancy = r.current_occupancy + v.delta,
+                   available_beds = coalesce(r.capacity, 0) - r.current_occupancy - v.delta
+              FROM (VALUES %s) AS v(id, delta)
+             WHERE r.id = v.id
+        """, list(deltas.items()))
+        self.browse(list(deltas)).invalidate_recordset(['current_occupancy', 'available_beds'])
+
 
 class HostelStudent(models.Model):
     _name = 'hostel.student'
@@ -50,4 +89,112 @@ class HostelStudent(models.Model):
         ('active', 'Active'),
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled')
-    ], string="Status", default='active')
\ No newline at end of file
+    ], string="Status", default='active')
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        allocations = super().create(vals_list)
+        self.env['hostel.room']._add_occupancy(allocations._occupancy())
+        return allocations
+
+    def write(self, vals):
+        if 'room_id' not in vals and 'status' not in vals:
+            return super().write(vals)
+        before = self._occupancy()
+        res = super().write(vals)
+        deltas = self._occupancy()
+        deltas.subtract(before)
+        self.env['hostel.room']._add_occupancy(deltas)
+        return res
+
+    def unlink(self):
+        deltas = Counter({room_id: -count for room_id, count in self._occupancy().items()})
+        res = super().unlink()
+        self.env['hostel.room']._add_occupancy(deltas)
+        return res
+
+    def _occupancy(self):
+        """Active allocations of ``self`` per room id."""
+        return Counter(allocation.room_id.id for allocation in self
+                       if allocation.status == 'active' and allocation.room_id)
+
+    @api.model
+    def _allocate_rooms(self, students, rooms, by_class=False, date_from=None):
+        """Allocate ``students`` to free beds of ``rooms`` in one pass.
+
+        Students are grouped by gender (and class if ``by_class``); a room
+        only takes students of one group. Each group first fills the rooms
+        its members already occupy, then empty rooms in ``rooms`` order.
+        Students with an active allocation are left alone. All allocations
+        are created with a single ``create()``.
+
+        :return: ``(allocations, students left without a bed)``
+        """
+        if not students:
+            return self.browse(), students
+        self.flush_model(['student_id', 'room_id', 'status'])
+        self.env.cr.execute("""
+            SELECT student_id FROM hostel_student WHERE status = 'active' AND student_id IN %s
+        """, [tuple(students.ids)])
+        housed = {student_id for student_id, in self.env.cr.fetchall()}
+        students = students.filtered(lambda s: s.id not in housed)
+        if rooms:
+            # Lock the rooms so a concurrent allocation cannot hand out the same beds.
+            self.env.cr.execute("SELECT id FROM hostel_room WHERE id IN %s FOR UPDATE", [tuple(rooms.ids)])
+            rooms.invalidate_recordset(['current_occupancy', 'available_beds'])
+
+        def group_key(student):
+            return (student.gender, student.class_id.id if by_class else False)
+
+        # Group of the occupants of each partly filled room.
+        room_groups = {}
+        occupied = rooms.filtered('current_occupancy')
+        if occupied:
+            self.env.cr.execute("""
+                SELECT a.room_id, s.gender, s.class_id
+                  FROM hostel_student a
+                  JOIN school_student s ON s.id = a.student_id
+                 WHERE a.status = 'active' AND a.room_id IN %s
+            """, [tuple(occupied.ids)])
+            for room_id, gender, class_id in self.env.cr.fetchall():
+                room_groups.setdefault(room_id, set()).add((gender, class_id if by_class else False))
+
+        free_rooms = {}
+        empty_rooms = []
+        for room in rooms:
+            if room.available_beds <= 0:
+                continue
+            if not room.current_occupancy:
+                empty_rooms.append([room, room.available_beds])
+            elif len(room_groups.get(room.id, ())) == 1:
+                free_rooms.setdefault(next(iter(room_groups[room.id])), []).append([room, room.available_beds])
+        empty_rooms.reverse()
+
+        groups = {}
+        for student in students.sorted(lambda s: (s.class_id.id, s.name or '')):
+            groups.setdefault(group_key(student), []).append(student)
+
+        vals_list, unallocated = [], []
+        for key, members in groups.items():
+            beds = free_rooms.get(key, [])
+            for student in members:
+                while beds and beds[0][1] <= 0:
+                    beds.pop(0)
+                if not beds:
+                    if not empty_rooms:
+                        unallocated.append(student.id)
+                        continue
+                    beds.append(empty_rooms.pop())
+                room = beds[0]
+                room[1] -= 1
+                vals_list.append({
+                    'student_id': student.id,
+                    'hostel_id': room[0].hostel_id.id,
+                    'room_id': room[0].id,
+                    'date_from': date_from or fields.Date.today(),
+                    'status': 'active',
+                })
+        allocations = self.create(vals_list)
+        _logger.info("Hostel allocation: %s students allocated, %s without a bed.",
+                     len(allocations), len(unallocated))
+        return allocations, self.env['school.student'].browse(unallocated)
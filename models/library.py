@@ -1,4 +1,6 @@
-from odoo import models, fields
+from odoo import models, fields, api
+from odoo.exceptions import ValidationError
+from psycopg2.extras import execute_values
 
 
 class LibraryBook(models.Model):
@@ -9,4 +11,53 @@ class LibraryBook(models.Model):
     author = fields.Char(string="Author")
     ISBN = fields.Char(string="ISBN")
     total_copies = fields.Integer(string="Total Copies")
-    available_copies = fields.Integer(string="Available Copies")
\ No newline at end of file
+    available_copies = fields.Integer(string="Available Copies")
+
+    _sql_constraints = [
+        ('available_copies_non_negative', 'CHECK(available_copies >= 0)', 'Available copies cannot be negative.'),
+    ]
+
+    @api.model
+    def _take_copies(self, counts):
+        """Take ``{book id: copies}`` out of stock in one conditional UPDATE.
+
+        Stock is checked and decremented atomically, so concurrent issues
+        never oversell a book. If any book lacks copies, nothing is taken.
+        """
+        counts = {book_id: copies for book_id, copies in counts.items() if book_id and copies}
+        missing = set(counts) - self._update_copies(counts, -1)
+        if missing:
+            raise ValidationError("No available copies for book: %s" % ', '.join(
+                self.browse(sorted(missing)).mapped('title')))
+
+    @api.model
+    def _return_copies(self, counts):
+        """Put ``{book id: copies}`` back in stock in one UPDATE."""
+        self._update_copies(counts, 1)
+
+    @api.model
+    def _update_copies(self, counts, sign):
+        """Add ``sign * copies`` to the stock of each book of ``counts``.
+
+        Returns the ids of the books whose stock stays non-negative; unless
+        that is all of them, the batch is rolled back and nothing changes.
+        """
+        counts = {book_id: copies for book_id, copies in counts.items() if book_id and copies}
+        if not counts:
+            return set()
+        self.flush_model(['available_copies'])
+        with self.env.cr.savepoint(flush=False) as savepoint:
+            rows = execute_values(self.env.cr._obj, """
+                UPDATE school_library_book b
+                   SET available_copies = b.available_copies + v.delta,
+                       write_uid = v.uid,
+                       write_date = now() at time zone 'UTC'
+                  FROM (VALUES %s) AS v(id, delta, uid)
+                 WHERE b.id = v.id AND b.available_copies + v.delta >= 0
+             RETURNING b.id
+            """, [(book_id, sign * copies, self.env.uid) for book_id, copies in counts.items()], fetch=True)
+            updated = {book_id for book_id, in rows}
+            if len(updated) < len(counts):
+                savepoint.rollback()
+        self.browse(list(counts)).invalidate_recordset(['available_copies', 'write_uid', 'write_date'])
+        return updated
@@ -1,5 +1,5 @@
 from odoo import models, fields, api
-from odoo.exceptions import ValidationError
+from collections import Counter
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -20,18 +20,55 @@ class LibraryBookIssue(models.Model):
 
     @api.model_create_multi
     def create(self, vals_list):
-        for vals in vals_list:
-            book = self.env['school.library.book'].browse(vals.get('book_id'))
-            if book.available_copies <= 0:
-                raise ValidationError(f"No available copies for book: {book.title}")
-            book.available_copies -= 1
+        # One atomic stock check and decrement for the whole batch.
+        self.env['school.library.book']._take_copies(Counter(
+            vals.get('book_id') for vals in vals_list if vals.get('state', 'issued') == 'issued'))
         return super().create(vals_list)
 
     def return_book(self):
-        for record in self:
-            if record.state != 'returned':
-                book = record.book_id
-                book.available_copies += 1
-                record.return_date = fields.Date.today()
-                record.state = 'returned'
+        """Return the books of the issued records; returned ones are skipped.
 
+        The state change is a conditional UPDATE, so a book returned twice
+        at the same time goes back in stock only once.
+        """
+        if not self:
+            return
+        self.flush_recordset()
+        self.env.cr.execute("""
+            UPDATE school_library_issue
+               SET state = 'returned', return_date = %s, write_uid = %s, write_date = now() at time zone 'UTC'
+             WHERE id IN %s AND state = 'issued'
+         RETURNING book_id
+        """, [fields.Date.today(), self.env.uid, tuple(self.ids)])
+        counts = Counter(book_id for book_id, in self.env.cr.fetchall())
+        self.invalidate_recordset(['state', 'return_date', 'write_uid', 'write_date'])
+        self.env['school.library.book']._return_copies(counts)
+
+    @api.model
+    def _issue_to_students(self, books, students, issue_date=None):
+        """Issue one copy of each of ``books`` to each of ``students``.
+
+        Students who already hold a copy of a book are skipped for that
+        book. Stock is taken for the whole batch at once, so either every
+        issue is created or, if a book runs short, none is.
+
+        :return: ``(created issues, number of skipped student/book pairs)``
+        """
+        if not books or not students:
+            return self.browse(), 0
+        self.flush_model(['student_id', 'book_id', 'state'])
+        self.env.cr.execute("""
+            SELECT student_id, book_id FROM school_library_issue
+             WHERE state = 'issued' AND student_id IN %s AND book_id IN %s
+        """, [tuple(students.ids), tuple(books.ids)])
+        held = set(self.env.cr.fetchall())
+        issue_date = issue_date or fields.Date.today()
+        vals_list = [{
+            'student_id': student_id,
+            'book_id': book_id,
+            'issue_date': issue_date,
+        } for book_id in books.ids for student_id in students.ids if (student_id, book_id) not in held]
+        issues = self.create(vals_list)
+        _logger.info("Library: issued %s books to %s students, %s already held.",
+                     len(issues), len(students), len(held))
+        return issues, len(held)
@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
-import requests
 import logging
+import os
 from odoo import models, api, _
 from odoo.exceptions import UserError
+from .geocode_cache import ADDRESS_KEYS, normalize_address
+from ..tools.geocoder import GazetteerBackend, NominatimBackend, get_gazetteer
 
 _logger = logging.getLogger(__name__)
 GEOCODE_ENDPOINT = 'https://nominatim.openstreetmap.org/search'
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'gazetteer_danang.csv')
 
 class OsmService(models.AbstractModel):
     """
@@ -14,6 +17,36 @@ class OsmService(models.AbstractModel):
     _name = 'schoolbus.osm'
     _description = 'OpenStreetMap Geocoding Service'
 
+    def _geocoder_backends(self):
+        """Return the configured geocoder backends, in lookup order.
+
+        ``schoolbus.geocoder_backends`` is a comma-separated list of
+        ``gazetteer`` and ``nominatim``. The gazetteer only answers street
+        and place names without a house number. Its file is read from
+        ``schoolbus.gazetteer_path`` (CSV or SQLite) and defaults to the
+        Danang extract shipped with the module. ``schoolbus.nominatim_url``
+        can point at a local Nominatim instance (or a test stand-in)
+        instead of the public service.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        backends = []
+        for name in ICP.get_param('schoolbus.geocoder_backends', 'gazetteer,nominatim').split(','):
+            name = name.strip()
+            if name == 'gazetteer':
+                gazetteer = get_gazetteer(ICP.get_param('schoolbus.gazetteer_path', GAZETTEER_PATH))
+                if gazetteer:
+                    backends.append(GazetteerBackend(
+                        gazetteer, cutoff=float(ICP.get_param('schoolbus.gazetteer_cutoff', 0.85))))
+            elif name == 'nominatim':
+                backends.append(NominatimBackend(
+                    ICP.get_param('schoolbus.nominatim_url', GEOCODE_ENDPOINT),
+                    rate=float(ICP.get_param('schoolbus.nominatim_rate', 1.0)),
+                    workers=int(ICP.get_param('schoolbus.geocode_workers', 4)),
+                ))
+            elif name:
+                _logger.warning("Unknown geocoder backend %r ignored.", name)
+        return backends
+
     def _osm_geocode(self, street=None, city=None, state=None, country=None, postalcode=None, limit=1):
         """
         Geocodes a structured address to latitude and longitude.
@@ -21,33 +54,62 @@ class OsmService(models.AbstractModel):
         if not any([street, city, state, country, postalcode]):
             _logger.warning("Geocoding called with all empty parameters.")
             return []
+        query = {'street': street, 'city': city, 'state': state, 'country': country, 'postalcode': postalcode}
+        return self._osm_geocode_batch([query], limit=limit)[0]
+
+    def _osm_geocode_batch(self, queries, limit=1, errors=None):
+        """
+        Geocodes many structured addresses at once.
+
+        :param queries: list of dicts with any of the keys street, city,
+            state, country and postalcode
+        :param errors: optional dict receiving ``{index: message}`` for the
+            queries whose lookup failed (as opposed to finding nothing)
+        :return: list of result lists, aligned with ``queries``
+
+        Identical addresses are looked up once. Each backend only sees the
+        addresses the previous ones could not resolve, so the local
+        gazetteer answers what it can and the remote service handles the
+        rest. Remote answers (including "not found") go through
+        ``schoolbus.geocode.cache``; failed lookups yield an empty,
+        uncached result.
+        """
+        addresses = [normalize_address(**{k: q.get(k) for k in ADDRESS_KEYS}) for q in queries]
+        unique = {}
+        for address, query in zip(addresses, queries):
+            if any(address):
+                unique.setdefault(address, query)
+
+        cache = self.env['schoolbus.geocode.cache'].sudo()
+        found, failures = {}, {}
+        pending = list(unique)
+        for backend in self._geocoder_backends():
+            if not pending:
+                break
+            if backend.cacheable:
+                hits = cache._lookup_many(pending, limit)
+                found.update(hits)
+                pending = [address for address in pending if address not in hits]
+                if not pending:
+                    break
+
+            replies = backend.geocode_many([unique[address] for address in pending], limit)
+            unresolved = []
+            for address, reply in zip(pending, replies):
+                if reply is None:
+                    unresolved.append(address)
+                elif isinstance(reply, Exception):
+                    _logger.error("Geocoding request failed: %s", reply)
+                    failures[address] = str(reply)
+                    unresolved.append(address)
+                else:
+                    if backend.cacheable:
+                        cache._store(address, reply, limit)
+                    failures.pop(address, None)
+                    found[address] = reply
+            pending = unresolved
+
+        if errors is not None:
+            errors.update({i: failures[a] for i, a in enumerate(addresses) if a in failures})
 
-        params = {
-            'street': street,
-            'city': city,
-            'state': state,
-            'country': country,
-            'postalcode': postalcode,
-            'format': 'json',
-            'limit': limit,
-            'addressdetails': 1,
-        }
-        query_params = {k: v for k, v in params.items() if v}
-
-        try:
-            headers = {'User-Agent': 'Odoo (http://www.odoo.com)'}
-            response = requests.get(GEOCODE_ENDPOINT, params=query_params, headers=headers, timeout=10)
-            response.raise_for_status()
-            results = response.json()
-            
-            if not results:
-                return []
-                
-            return [{
-                'lat': res.get('lat'),
-                'lon': res.get('lon'),
-            } for res in results]
-
-        except requests.exceptions.RequestException as e:
-            _logger.error("OSM geocoding request failed: %s", e)
-            return []
\ No newline at end of file
+        return [found.get(address, []) for address in addresses]
@@ -0,0 +1,171 @@
+from odoo import models, fields, api, tools
+import logging
+from psycopg2.extras import execute_values
+
+from ..tools.geofence import GeofenceIndex
+
+_logger = logging.getLogger(__name__)
+
+MAX_EVENTS = 1000
+
+
+class StopEvent(models.Model):
+    """
+    Arrival or departure of a vehicle at a stop, detected by matching its
+    GPS points against the stop geofences. The table is append-only, so
+    readers follow it as a stream ordered by id.
+    """
+    _name = 'school.transport.stop.event'
+    _description = 'Vehicle Stop Event'
+    _order = 'id desc'
+    _rec_name = 'stop_id'
+
+    vehicle_id = fields.Many2one('fleet.vehicle', string="Vehicle", required=True, readonly=True,
+                                 index=True, ondelete='cascade')
+    route_id = fields.Many2one('school.transport.route', string="Route", readonly=True,
+                               index=True, ondelete='cascade')
+    stop_id = fields.Many2one('school.transport.stop', string="Stop", required=True, readonly=True,
+                              ondelete='cascade')
+    event_type = fields.Selection([
+        ('arrival', 'Arrival'),
+        ('departure', 'Departure')
+    ], string="Event", required=True, readonly=True)
+    timestamp = fields.Datetime(string="Time", required=True, readonly=True)
+
+    @api.model
+    def _detect(self, pings):
+        """Run GPS ``pings`` through the geofences of their routes.
+
+        A vehicle arrives at a stop with its first point inside the stop's
+        circle and departs at its last point inside it. Events are stored,
+        travel times between consecutive stops are fed to the ETA
+        statistics, and the geofence state of every pinged vehicle is
+        returned as ``{vehicle id: (stop id, arrived, seen, last stop id,
+        departed)}`` for ``_record_positions`` to store. Points older than
+        the vehicle's last known position are ignored; the others that
+        reach a route's geofences are flagged ``geofenced`` in place.
+        """
+        if not pings:
+            return {}
+        fences, stop_routes = self.env['school.transport.route']._geofences()
+        states = self.env['school.transport.vehicle.position']._geofence_states({p['vehicle_id'] for p in pings})
+
+        events, visits = [], []
+        for ping in sorted(pings, key=lambda p: (p['vehicle_id'], p['timestamp'])):
+            vehicle_id, route_id, at = ping['vehicle_id'], ping.get('route_id'), ping['timestamp']
+            (stop_id, arrived, seen, last_stop, departed), processed = states[vehicle_id]
+            if processed and at < processed:
+                continue
+            fence = fences.get(route_id)
+            located = fence.locate(ping['latitude'], ping['longitude']) if fence else None
+            if fence:
+                ping['geofenced'] = True
+            if located and located == stop_id:
+                seen = at
+            else:
+                if stop_id:
+                    events.append((vehicle_id, stop_routes.get(stop_id), stop_id, 'departure', seen))
+                    last_stop, departed = stop_id, seen
+                stop_id = arrived = seen = None
+                if located:
+                    events.append((vehicle_id, route_id, located, 'arrival', at))
+                    if last_stop and stop_routes.get(last_stop) == route_id:
+                        # Departure from the previous stop to arrival here is one segment.
+                        visits += [(route_id, vehicle_id, last_stop, departed, departed),
+                                   (route_id, vehicle_id, located, at, at)]
+                    stop_id, arrived, seen = located, at, at
+            states[vehicle_id] = ((stop_id, arrived, seen, last_stop, departed), at)
+
+        if events:
+            now = fields.Datetime.now()
+            execute_values(self.env.cr._obj, """
+                INSERT INTO school_transport_stop_event
+                    (vehicle_id, route_id, stop_id, event_type, timestamp,
+                     create_uid, create_date, write_uid, write_date)
+                VALUES %s
+            """, [event + (self.env.uid, now, self.env.uid, now) for event in events])
+            self.invalidate_model()
+        if visits:
+            self.env['school.transport.eta.stat']._learn_segments(visits)
+        return {vehicle_id: state for vehicle_id, (state, _at) in states.items()}
+
+    @api.model
+    def _events_since(self, event_id, route_id=None):
+        """Events after ``event_id``, oldest first, as compact rows, and the new cursor."""
+        self.env.cr.execute("""
+            SELECT id, vehicle_id, route_id, stop_id, event_type, timestamp
+              FROM school_transport_stop_event
+             WHERE id > %s AND (%s IS NULL OR route_id = %s)
+          ORDER BY id
+             LIMIT %s
+        """, [event_id, route_id, route_id, MAX_EVENTS])
+        rows = self.env.cr.fetchall()
+        events = [[eid, vehicle_id, rid, stop_id, event_type[0], fields.Datetime.to_string(at)]
+                  for eid, vehicle_id, rid, stop_id, event_type, at in rows]
+        return events, rows[-1][0] if rows else event_id
+
+
+class TransportRoute(models.Model):
+    _inherit = 'school.transport.route'
+
+    def unlink(self):
+        res = super().unlink()
+        # The route's stops are deleted by the database cascade.
+        self.env['school.transport.cache.version']._bump('geofences')
+        return res
+
+    @api.model
+    def _geofences(self):
+        """``({route id: GeofenceIndex}, {stop id: route id})`` of the current stops.
+
+        Stop circles have a radius of ``school_transport.stop_radius_m``
+        (default 75).
+        """
+        radius_m = int(self.env['ir.config_parameter'].sudo().get_param('school_transport.stop_radius_m', 75))
+        return self._geofence_index(self.env['school.transport.cache.version']._get('geofences'), radius_m)
+
+    @api.model
+    @tools.ormcache('version', 'radius_m')
+    def _geofence_index(self, version, radius_m):
+        """Geofence index of every route, rebuilt when the ``geofences``
+        counter is bumped by a change to the stops.
+
+        Callers must not mutate it.
+        """
+        self.env['school.transport.stop'].flush_model(['route_id', 'latitude', 'longitude'])
+        self.env.cr.execute("""
+            SELECT route_id, id, latitude, longitude FROM school_transport_stop
+             WHERE route_id IS NOT NULL AND latitude != 0 AND longitude != 0
+        """)
+        fences, stop_routes = {}, {}
+        for route_id, stop_id, lat, lon in self.env.cr.fetchall():
+            fences.setdefault(route_id, []).append((stop_id, lat, lon, radius_m / 1000.0))
+            stop_routes[stop_id] = route_id
+        return {route_id: GeofenceIndex(stops) for route_id, stops in fences.items()}, stop_routes
+
+
+class TransportStop(models.Model):
+    _inherit = 'school.transport.stop'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        stops = super().create(vals_list)
+        self.env['school.transport.cache.version']._bump('geofences')
+        return stops
+
+    def write(self, vals):
+        res = super().write(vals)
+        if any(name in vals for name in ('route_id', 'latitude', 'longitude')):
+            self.env['school.transport.cache.version']._bump('geofences')
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env['school.transport.cache.version']._bump('geofences')
+        return res
+
+    @api.model
+    def _write_route_order(self, rows):
+        super()._write_route_order(rows)
+        if rows:
+            self.env['school.transport.cache.version']._bump('geofences')
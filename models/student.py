@@ -1,11 +1,13 @@
-from odoo import models, fields, api, _
+from odoo import models, fields, api, Command, _
 import logging
 
+from ..tools.spatial import GridIndex
+
 _logger = logging.getLogger(__name__)
 
 class Student(models.Model):
     _name = 'school.student'
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'schoolbus.geocode.mixin']
     _description = 'Student Record'
 
     name = fields.Char(string="Full Name", required=True, tracking=True)
@@ -45,42 +47,92 @@ class Student(models.Model):
     x_lat = fields.Float(string="Latitude", digits=(10, 7), readonly=True)
     x_lon = fields.Float(string="Longitude", digits=(10, 7), readonly=True)
 
+    transport_stop_id = fields.Many2one('school.transport.stop', string="Pickup Stop", index=True,
+                                        ondelete='set null')
+
+    _geocode_address_fields = ('house_address',)
+
     # --- NEW GEOCODING METHODS ---
-    def geocode_record(self):
-        """Button-callable method to geocode a single student's address."""
-        service = self.env['schoolbus.osm']
-        for student in self:
-            if not student.house_address:
-                student.write({'x_lat': 0.0, 'x_lon': 0.0})
-                continue
-            
-            try:
-                results = service._osm_geocode(
-                    street=student.house_address,
-                    city='Danang',
-                    country='Vietnam',
-                    limit=1
-                )
-                if results:
-                    student.write({
-                        'x_lat': float(results[0].get('lat', 0.0)),
-                        'x_lon': float(results[0].get('lon', 0.0)),
-                    })
-                    _logger.info(f"Geocoded student {student.name}: {student.x_lat}, {student.x_lon}")
-                else:
-                    student.write({'x_lat': 0.0, 'x_lon': 0.0})
-            except Exception as e:
-                _logger.error(f"Geocoding failed for student {student.name}: {e}")
-                student.write({'x_lat': 0.0, 'x_lon': 0.0})
-
-    def _run_geocode_cron(self):
-        """Called by cron job to geocode students with missing coordinates."""
-        _logger.info("Running geocoding cron job for students...")
-        # Process in batches of 100 to avoid timeouts
-        students_to_geocode = self.search([
-            '|', ('x_lat', '=', 0.0), ('x_lon', '=', 0.0),
-            ('house_address', '!=', False)
-        ], limit=100)
-        
-        _logger.info(f"Found {len(students_to_geocode)} students to geocode.")
-        students_to_geocode.geocode_record()
\ No newline at end of file
+    def _geocode_query(self):
+        if not self.house_address:
+            return None
+        return {'street': self.house_address, 'city': 'Danang', 'country': 'Vietnam'}
+
+    def _assign_transport_stops(self, radius_km, stops):
+        """Assign each geocoded student to the nearest of ``stops`` within ``radius_km``.
+
+        Candidate pairs are taken nearest first across all students, so a
+        route whose seating capacity is reached goes to the students living
+        closest to its stops; the others fall back to their next nearest
+        stop. A seat held by a student of this run is only freed when that
+        student is moved to another route. Assigned students are moved onto
+        the stop's route, with one write per stop whose students change.
+        Returns the students that could not be assigned.
+        """
+        students = self.filtered(lambda s: s.x_lat and s.x_lon)
+        stops = stops.filtered(lambda s: s.latitude and s.longitude and s.route_id)
+        if not students or not stops:
+            return self
+
+        # Every current member holds a seat until they are moved elsewhere.
+        routes = stops.route_id
+        student_ids = students.ids
+        position = {sid: s_i for s_i, sid in enumerate(student_ids)}
+        free, held = {}, {}
+        for route in routes:
+            free[route.id] = route.capacity - len(route.student_ids)
+            for sid in route.student_ids.ids:
+                if sid in position:
+                    held.setdefault(position[sid], set()).add(route.id)
+
+        index = GridIndex(stops.mapped('latitude'), stops.mapped('longitude'), cell_km=radius_km)
+        student_idx, stop_idx, _distances = index.query_many(
+            students.mapped('x_lat'), students.mapped('x_lon'), radius_km)
+        route_of = [stop.route_id.id for stop in stops]
+        pairs = list(zip(student_idx.tolist(), stop_idx.tolist()))
+        assignment = {}
+        while pairs:
+            # Seats freed by moved students go to the nearest pairs left,
+            # so scan again until no seat is freed.
+            freed, waiting = False, []
+            for s_i, p_i in pairs:
+                if s_i in assignment:
+                    continue
+                route_id = route_of[p_i]
+                kept = held.get(s_i, set())
+                if route_id not in kept:
+                    if free[route_id] <= 0:
+                        waiting.append((s_i, p_i))
+                        continue
+                    free[route_id] -= 1
+                assignment[s_i] = p_i
+                for old_route_id in kept - {route_id}:
+                    free[old_route_id] += 1
+                    freed = True
+            pairs = waiting if freed else []
+
+        by_stop = {}
+        for s_i, p_i in assignment.items():
+            if students[s_i].transport_stop_id != stops[p_i]:
+                by_stop.setdefault(p_i, []).append(student_ids[s_i])
+        for p_i, ids in by_stop.items():
+            self.browse(ids).write({'transport_stop_id': stops[p_i].id})
+
+        target = {student_ids[s_i]: route_of[p_i] for s_i, p_i in assignment.items()}
+        self._move_to_routes(target)
+        return self - self.browse(list(target))
+
+    @api.model
+    def _move_to_routes(self, target):
+        """Make each student of ``target`` ({student id: route id}) a member
+        of that route only, with one write per affected route."""
+        if not target:
+            return
+        Route = self.env['school.transport.route']
+        routes = Route.search([('student_ids', 'in', list(target))]) | Route.browse(set(target.values()))
+        for route in routes:
+            current = set(route.student_ids.ids)
+            commands = [Command.unlink(sid) for sid in current.intersection(target) if target[sid] != route.id]
+            commands += [Command.link(sid) for sid, rid in target.items() if rid == route.id and sid not in current]
+            if commands:
+                route.write({'student_ids': commands})
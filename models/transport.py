@@ -1,10 +1,35 @@
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
+import hashlib
 import logging
 import json
-import math
+import time
+
+from psycopg2.extras import execute_values
+
+from odoo.exceptions import ValidationError
+from odoo.tools.sql import column_exists
+
+from ..tools import geodesy, polyline, route_optimizer
 
 _logger = logging.getLogger(__name__)
 
+# Simplified copies of the route geometry: (highest map zoom, field,
+# Douglas-Peucker tolerance in metres). Closer zooms get the full path.
+GEOMETRY_ZOOM_BANDS = (
+    (12, 'geometry_polyline_low', 40.0),
+    (15, 'geometry_polyline_mid', 5.0),
+)
+
+
+def geometry_field(zoom=None):
+    """Name of the route geometry field to serve at map ``zoom``."""
+    if zoom is not None:
+        for max_zoom, field, _tolerance in GEOMETRY_ZOOM_BANDS:
+            if zoom <= max_zoom:
+                return field
+    return 'geometry_polyline'
+
+
 class TransportRoute(models.Model):
     _name = 'school.transport.route'
     _description = 'Transport Route'
@@ -17,78 +42,370 @@ class TransportRoute(models.Model):
     stop_ids = fields.One2many('school.transport.stop', 'route_id', string="Route Stops")
     
     # Map and Route Geometry Fields
-    route_geometry = fields.Text(string="Route Geometry (JSON)", help="JSON array of [lat, lon] coordinates forming the route path")
+    route_geometry = fields.Text(string="Route Geometry (JSON)", compute='_compute_route_geometry', inverse='_inverse_route_geometry',
+                                 help="JSON array of [lat, lon] coordinates forming the route path")
+    geometry_polyline = fields.Text(string="Route Path", readonly=True,
+                                    help="Full resolution route path, as an encoded polyline")
+    geometry_polyline_low = fields.Text(string="Route Path (Low Zoom)", compute='_compute_geometry_levels', store=True)
+    geometry_polyline_mid = fields.Text(string="Route Path (Medium Zoom)", compute='_compute_geometry_levels', store=True)
     total_distance = fields.Float(string="Total Distance (km)", compute='_compute_total_distance', store=True)
     map_center_lat = fields.Float(string="Map Center Latitude", compute='_compute_map_center', store=True)
     map_center_lon = fields.Float(string="Map Center Longitude", compute='_compute_map_center', store=True)
     route_map_html = fields.Html(string="Route Map HTML", compute='_compute_route_map_html', sanitize=False)
 
 
+    def _auto_init(self):
+        migrate = (not column_exists(self.env.cr, self._table, 'geometry_polyline')
+                   and column_exists(self.env.cr, self._table, 'route_geometry'))
+        res = super()._auto_init()
+        if migrate:
+            # route_geometry used to be stored as JSON text.
+            self.env.cr.execute("""
+                SELECT id, route_geometry FROM school_transport_route
+                 WHERE route_geometry IS NOT NULL AND route_geometry NOT IN ('', '[]')
+            """)
+            for route_id, raw in self.env.cr.fetchall():
+                try:
+                    encoded = polyline.encode(json.loads(raw))
+                except (ValueError, TypeError):
+                    _logger.warning("Dropping unreadable geometry of transport route %s", route_id)
+                    continue
+                vals = dict(self._geometry_levels(encoded), geometry_polyline=encoded)
+                self.env.cr.execute(
+                    "UPDATE school_transport_route SET %s WHERE id = %%s" % ', '.join(f'{name} = %s' for name in vals),
+                    [*vals.values(), route_id],
+                )
+        return res
+
     def _compute_route_map_html(self):
         for route in self:
             if route.id:
-                route.route_map_html = f'<iframe style="width: 100%; height: 100%; border: none; border-radius: 8px;" src="/school_transport/map/{route.id}"></iframe>'
+                # Versioned URL: the browser may reuse its copy until the route changes.
+                version = route._map_version()[0]
+                route.route_map_html = f'<iframe style="width: 100%; height: 100%; border: none; border-radius: 8px;" src="/school_transport/map/{route.id}?v={version}"></iframe>'
             else:
                 route.route_map_html = '<p>Save the record to view the map.</p>'
     
+    def _stop_paths(self):
+        """Located stops of each route in sequence order, as ``(lat, lon)`` lists."""
+        return [
+            [(s.latitude, s.longitude) for s in route.stop_ids.sorted('sequence')
+             if s.latitude != 0.0 and s.longitude != 0.0]
+            for route in self
+        ]
+
     @api.depends('stop_ids.latitude', 'stop_ids.longitude')
     def _compute_map_center(self):
         """Compute the center point of the route for map display."""
-        for route in self:
-            stops_with_coords = route.stop_ids.filtered(lambda s: s.latitude != 0.0 and s.longitude != 0.0)
-            if stops_with_coords:
-                route.map_center_lat = sum(s.latitude for s in stops_with_coords) / len(stops_with_coords)
-                route.map_center_lon = sum(s.longitude for s in stops_with_coords) / len(stops_with_coords)
-            else:
-                # Default to Danang, Vietnam
-                route.map_center_lat = 16.0544
-                route.map_center_lon = 108.2022
+        # Default to Danang, Vietnam
+        centers = geodesy.centroids(self._stop_paths(), default=(16.0544, 108.2022))
+        for route, (lat, lon) in zip(self, centers):
+            route.map_center_lat = float(lat)
+            route.map_center_lon = float(lon)
     
     @api.depends('stop_ids.latitude', 'stop_ids.longitude', 'stop_ids.sequence')
     def _compute_total_distance(self):
         """Calculate total route distance based on stop coordinates."""
-        for route in self:
-            total = 0.0
-            ordered_stops = route.stop_ids.sorted(key=lambda s: s.sequence)
-            stops_with_coords = [s for s in ordered_stops if s.latitude != 0.0 and s.longitude != 0.0]
-            
-            for i in range(len(stops_with_coords) - 1):
-                stop1 = stops_with_coords[i]
-                stop2 = stops_with_coords[i + 1]
-                total += self._haversine_distance(
-                    stop1.latitude, stop1.longitude,
-                    stop2.latitude, stop2.longitude
-                )
-            route.total_distance = round(total, 2)
+        lengths = geodesy.path_lengths(self._stop_paths())
+        for route, length in zip(self, lengths):
+            route.total_distance = round(float(length), 2)
     
     def _haversine_distance(self, lat1, lon1, lat2, lon2):
         """Calculate distance between two points using Haversine formula."""
-        R = 6371  # Earth's radius in kilometers
-        
-        lat1_rad = math.radians(lat1)
-        lat2_rad = math.radians(lat2)
-        delta_lat = math.radians(lat2 - lat1)
-        delta_lon = math.radians(lon2 - lon1)
-        
-        a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        
-        return R * c
+        return float(geodesy.haversine(lat1, lon1, lat2, lon2))
     
+    @api.model
+    def _plan_stop_order(self, stops, time_limit):
+        """Order ``stops`` to shorten the path through them.
+
+        The first stop (by current sequence) stays first; stops without
+        coordinates keep their relative order at the end. Returns
+        ``(ordered stops, km before, km after)``.
+        """
+        stops = stops.sorted(lambda s: (s.sequence, s.id))
+        located = stops.filtered(lambda s: s.latitude and s.longitude)
+        before = after = 0.0
+        if len(located) > 1:
+            lats, lons = located.mapped('latitude'), located.mapped('longitude')
+            dist = geodesy.distance_matrix(lats, lons, lats, lons).tolist()
+            order = route_optimizer.optimize(dist, start=0, time_limit=time_limit)
+            before = route_optimizer.path_length(list(range(len(located))), dist)
+            after = route_optimizer.path_length(order, dist)
+            located = self.env['school.transport.stop'].browse([located.ids[i] for i in order])
+        return located | (stops - located), before, after
+
+    def _optimizer_time_limit(self):
+        return float(self.env['ir.config_parameter'].sudo().get_param('school_transport.optimizer_time_limit', 2.0))
+
+    def _optimizer_budgets(self):
+        """Yield each route with its share of the optimizer time budget.
+
+        ``school_transport.optimizer_time_limit`` caps the whole run; what
+        is left of it is split evenly among the routes not planned yet.
+        """
+        deadline = time.monotonic() + self._optimizer_time_limit()
+        for k, route in enumerate(self):
+            yield route, max(0.0, deadline - time.monotonic()) / (len(self) - k)
+
+    def _optimize_stop_sequence(self):
+        """Reorder the stops of each route. Returns ``(km before, km after)``."""
+        rows, before, after = [], 0.0, 0.0
+        for route, time_limit in self._optimizer_budgets():
+            ordered, route_before, route_after = self._plan_stop_order(route.stop_ids, time_limit)
+            rows += [(stop.id, route.id, (k + 1) * 10) for k, stop in enumerate(ordered)]
+            before += route_before
+            after += route_after
+        self.env['school.transport.stop']._write_route_order(rows)
+        self.filtered('geometry_polyline').compute_route_geometry()
+        return before, after
+
+    def action_optimize_stop_sequence(self):
+        before, after = self._optimize_stop_sequence()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _("Stop Order Optimized"),
+                'message': _("Route length %(before).2f km → %(after).2f km (%(saved).2f km saved).",
+                             before=before, after=after, saved=before - after),
+                'type': 'success',
+                'sticky': False,
+                'next': {'type': 'ir.actions.client', 'tag': 'soft_reload'},
+            }
+        }
+
+    def _build_fleet_routes(self):
+        """Redistribute the located stops of these routes among them.
+
+        Stops are split by the sweep heuristic around the depot
+        (``school_transport.depot_lat``/``depot_lon``) so that the students
+        picked up on each route fit its seating capacity, then each route's
+        stops are reordered. Students follow their pickup stop's route.
+        Stops that fit on no route keep their current route.
+
+        Returns a dict with ``before``/``after`` total km and the
+        ``unassigned`` stops.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        depot = (float(ICP.get_param('school_transport.depot_lat', 16.0544)),
+                 float(ICP.get_param('school_transport.depot_lon', 108.2022)))
+        stops = self.stop_ids.filtered(lambda s: s.latitude and s.longitude)
+        demand = dict(self.env['school.student']._read_group(
+            [('transport_stop_id', 'in', stops.ids)], ['transport_stop_id'], ['__count']))
+        groups, unassigned = route_optimizer.sweep(
+            list(zip(stops.mapped('latitude'), stops.mapped('longitude'))),
+            [demand.get(stop, 0) for stop in stops],
+            self.mapped('capacity'),
+            depot,
+        )
+
+        before = sum(self.mapped('total_distance'))
+        leftovers = stops.browse([stops.ids[i] for i in unassigned])
+        rows = []
+        for (route, time_limit), group in zip(self._optimizer_budgets(), groups):
+            # Stops without coordinates stay on their route, at the end.
+            group_stops = stops.browse([stops.ids[i] for i in group]) | (route.stop_ids - stops)
+            ordered, _before, _after = self._plan_stop_order(group_stops, time_limit)
+            ordered |= (route.stop_ids & leftovers).sorted(lambda s: (s.sequence, s.id))
+            rows += [(stop.id, route.id, (k + 1) * 10) for k, stop in enumerate(ordered)]
+
+        Stop = self.env['school.transport.stop']
+        Stop._write_route_order(rows)
+        route_of = {stop_id: route_id for stop_id, route_id, _sequence in rows}
+        students = self.env['school.student'].search([('transport_stop_id', 'in', list(route_of))])
+        self.env['school.student']._move_to_routes(
+            {student.id: route_of[student.transport_stop_id.id] for student in students})
+        self.filtered('geometry_polyline').compute_route_geometry()
+        return {
+            'before': before,
+            'after': sum(self.mapped('total_distance')),
+            'unassigned': leftovers,
+        }
+
     def compute_route_geometry(self):
         """Generate route geometry from ordered stops."""
         for route in self:
             ordered_stops = route.stop_ids.sorted(key=lambda s: s.sequence)
             stops_with_coords = [s for s in ordered_stops if s.latitude != 0.0 and s.longitude != 0.0]
-            
-            if stops_with_coords:
-                geometry = [[s.latitude, s.longitude] for s in stops_with_coords]
-                route.route_geometry = json.dumps(geometry)
-            else:
-                route.route_geometry = '[]'
+            route.geometry_polyline = polyline.encode([(s.latitude, s.longitude) for s in stops_with_coords]) or False
+
+    @api.depends('geometry_polyline')
+    def _compute_route_geometry(self):
+        for route in self:
+            points = polyline.decode(route.geometry_polyline or '')
+            route.route_geometry = json.dumps([[lat, lon] for lat, lon in points])
+
+    def _inverse_route_geometry(self):
+        for route in self:
+            try:
+                points = json.loads(route.route_geometry or '[]')
+                route.geometry_polyline = polyline.encode(points) or False
+            except (ValueError, TypeError):
+                raise ValidationError(_("Route geometry must be a JSON array of [lat, lon] pairs."))
+
+    @api.depends('geometry_polyline')
+    def _compute_geometry_levels(self):
+        for route in self:
+            route.update(self._geometry_levels(route.geometry_polyline))
+
+    @api.model
+    def _geometry_levels(self, encoded):
+        """Simplified encodings of the path ``encoded``, by zoom band field."""
+        points = polyline.decode(encoded or '')
+        return {
+            field: polyline.encode(polyline.simplify(points, tolerance)) or False
+            for _max_zoom, field, tolerance in GEOMETRY_ZOOM_BANDS
+        }
     
-    def get_map_data(self):
-        """Prepare data for map widget display."""
+    def _map_version(self):
+        """Return ``(version, last_modified)`` of the route's map data.
+
+        The version fingerprints the route and its stops (last write
+        dates, count and ids), so any change to what ``get_map_data``
+        returns yields a new version.
+        """
+        self.ensure_one()
+        self.env['school.transport.stop'].flush_model()
+        self.flush_recordset()
+        self.env.cr.execute("""
+            SELECT r.write_date, max(s.write_date), count(s.id), coalesce(sum(s.id), 0)
+              FROM school_transport_route r
+         LEFT JOIN school_transport_stop s ON s.route_id = r.id
+             WHERE r.id = %s
+          GROUP BY r.id
+        """, [self.id])
+        route_date, stop_date, count, id_sum = self.env.cr.fetchone()
+        raw = f'{self.id}:{route_date}:{stop_date}:{count}:{id_sum}'
+        last_modified = max(d for d in (route_date, stop_date) if d) if (route_date or stop_date) else None
+        return hashlib.sha1(raw.encode()).hexdigest()[:16], last_modified
+
+    def _map_payload(self, version, zoom=None):
+        """Serialized ``get_map_data``, cached per route version and zoom band.
+
+        A route or stop change produces a new version and therefore a new
+        cache entry; stale versions age out of the registry cache.
+        """
+        return self._map_field_payload(version, geometry_field(zoom))
+
+    @tools.ormcache('self.id', 'version', 'field')
+    def _map_field_payload(self, version, field):
+        return json.dumps(self._map_data(field))
+
+    @api.model
+    def _fleet_version(self):
+        """Version of the whole fleet's map data (all routes and stops)."""
+        self.env['school.transport.stop'].flush_model()
+        self.flush_model()
+        self.env.cr.execute("""
+            SELECT max(write_date), count(*), coalesce(sum(id), 0) FROM school_transport_route
+             UNION ALL
+            SELECT max(write_date), count(*), coalesce(sum(id), 0) FROM school_transport_stop
+        """)
+        rows = self.env.cr.fetchall()
+        dates = [row[0] for row in rows if row[0]]
+        return hashlib.sha1(repr(rows).encode()).hexdigest()[:16], max(dates) if dates else None
+
+    @tools.ormcache('version')
+    def _fleet_routes(self, version):
+        """Every route with its located stops, read in a single query.
+
+        Returns a tuple of ``(id, name, bus_number, points, stop_names,
+        times, paths)`` in route order, where ``points`` are ``(lat, lon)``
+        pairs in stop sequence, ``times`` ``(arrival, departure)`` pairs and
+        ``paths`` the encoded route geometry by field name.
+        """
+        self.env.cr.execute("""
+            SELECT r.id, r.name, r.bus_number,
+                   r.geometry_polyline, r.geometry_polyline_low, r.geometry_polyline_mid,
+                   s.name, s.latitude, s.longitude, s.arrival_time, s.departure_time
+              FROM school_transport_route r
+         LEFT JOIN school_transport_stop s
+                ON s.route_id = r.id AND s.latitude != 0 AND s.longitude != 0
+          ORDER BY r.name, r.id, s.sequence, s.id
+        """)
+        routes = {}
+        for (route_id, name, bus_number, full, low, mid,
+             stop_name, lat, lon, arrival, departure) in self.env.cr.fetchall():
+            route = routes.get(route_id)
+            if route is None:
+                paths = {'geometry_polyline': full, 'geometry_polyline_low': low, 'geometry_polyline_mid': mid}
+                route = routes[route_id] = (route_id, name, bus_number or '', [], [], [], paths)
+            if stop_name is not None:
+                route[3].append((lat, lon))
+                route[4].append(stop_name)
+                route[5].append((arrival or 0.0, departure or 0.0))
+        return tuple(
+            (route_id, name, bus_number, tuple(points), tuple(names), tuple(times), paths)
+            for route_id, name, bus_number, points, names, times, paths in routes.values()
+        )
+
+    @api.model
+    def _fleet_map_data(self, bbox=None, encoding='polyline', version=None, zoom=None):
+        """Map data of all routes, for the fleet map.
+
+        :param bbox: optional ``(min_lon, min_lat, max_lon, max_lat)``;
+            only routes with at least one stop inside it are returned
+        :param encoding: ``'polyline'`` for encoded polyline paths or
+            ``'geojson'`` for a FeatureCollection of quantized, delta
+            encoded coordinates (scale ``10**-5``)
+        :param zoom: map zoom level, selecting the geometry resolution
+        """
+        self.check_access('read')
+        self.env['school.transport.stop'].check_access('read')
+        routes = self._fleet_routes(version or self._fleet_version()[0])
+        if bbox:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            routes = [
+                route for route in routes
+                if any(min_lat <= lat <= max_lat and min_lon <= lon <= max_lon for lat, lon in route[3])
+            ]
+
+        field = geometry_field(zoom)
+        if encoding == 'geojson':
+            return {
+                'type': 'FeatureCollection',
+                'transform': {'scale': [1e-5, 1e-5], 'delta': True},
+                'features': [{
+                    'type': 'Feature',
+                    'id': route_id,
+                    'geometry': {
+                        'type': 'LineString',
+                        'coordinates': polyline.quantize(polyline.decode(paths[field] or '') or points),
+                    },
+                    'properties': {
+                        'name': name,
+                        'bus_number': bus_number,
+                        'stops': names,
+                        'stop_coordinates': polyline.quantize(points),
+                        'times': times,
+                    },
+                } for route_id, name, bus_number, points, names, times, paths in routes],
+            }
+        # ``path`` is empty for routes without geometry; clients then draw
+        # the line through the stops.
+        return {
+            'precision': 5,
+            'routes': [{
+                'id': route_id,
+                'name': name,
+                'bus_number': bus_number,
+                'path': paths[field] or '',
+                'stops_path': polyline.encode(points),
+                'stops': names,
+                'times': times,
+            } for route_id, name, bus_number, points, names, times, paths in routes],
+        }
+
+    def get_map_data(self, zoom=None):
+        """Prepare data for map widget display.
+
+        ``geometry`` is the route path as an encoded polyline, at the
+        resolution suited to map ``zoom`` (full resolution if None).
+        """
+        return self._map_data(geometry_field(zoom))
+
+    def _map_data(self, field):
+        """``get_map_data`` with the geometry read from ``field``."""
         self.ensure_one()
         ordered_stops = self.stop_ids.sorted(key=lambda s: s.sequence)
         
@@ -108,6 +425,7 @@ class TransportRoute(models.Model):
             'route_name': self.name,
             'bus_number': self.bus_number,
             'stops': stops_data,
+            'geometry': self[field] or '',
             'center_lat': self.map_center_lat,
             'center_lon': self.map_center_lon,
             'total_distance': self.total_distance,
@@ -116,6 +434,7 @@ class TransportRoute(models.Model):
 
 class TransportStop(models.Model):
     _name = 'school.transport.stop'
+    _inherit = ['schoolbus.geocode.mixin']
     _description = 'Route Stop'
     _order = 'route_id, sequence, id'
 
@@ -133,42 +452,46 @@ class TransportStop(models.Model):
     x_lat = fields.Float(related='latitude', string="X Latitude (deprecated)", readonly=True, store=False)
     x_lon = fields.Float(related='longitude', string="X Longitude (deprecated)", readonly=True, store=False)
 
-    def geocode_record(self):
-        """Button-callable method to geocode a single stop."""
-        service = self.env['schoolbus.osm']
-        for stop in self:
-            if not stop.name:
-                stop.write({'latitude': 0.0, 'longitude': 0.0})
-                continue
-            
-            try:
-                # Focus on Danang, Vietnam for better geocoding accuracy
-                results = service._osm_geocode(
-                    street=stop.name,
-                    city='Danang',
-                    country='Vietnam',
-                    limit=1
-                )
-                if results:
-                    stop.write({
-                        'latitude': float(results[0].get('lat', 0.0)),
-                        'longitude': float(results[0].get('lon', 0.0)),
-                    })
-                    _logger.info(f"Geocoded stop {stop.name}: {stop.latitude}, {stop.longitude}")
-                else:
-                    stop.write({'latitude': 0.0, 'longitude': 0.0})
-                    _logger.warning(f"No geocoding results for stop: {stop.name}")
-            except Exception as e:
-                _logger.error(f"Geocoding failed for stop {stop.name}: {e}")
-                stop.write({'latitude': 0.0, 'longitude': 0.0})
-
-    def _run_geocode_cron(self):
-        """Called by cron job to geocode stops with missing coordinates."""
-        _logger.info("Running geocoding cron job for transport stops...")
-        stops_to_geocode = self.search([
-            '|', ('latitude', '=', 0.0), ('longitude', '=', 0.0),
-            ('name', '!=', False)
-        ], limit=100)
-        
-        _logger.info(f"Found {len(stops_to_geocode)} stops to geocode.")
-        stops_to_geocode.geocode_record()
\ No newline at end of file
+    _geocode_lat_field = 'latitude'
+    _geocode_lon_field = 'longitude'
+    _geocode_address_fields = ('name',)
+
+    def _geocode_query(self):
+        if not self.name:
+            return None
+        # Focus on Danang, Vietnam for better geocoding accuracy
+        return {'street': self.name, 'city': 'Danang', 'country': 'Vietnam'}
+
+    def _distance_matrix(self, students):
+        """Distances in km from each of ``students`` (rows) to each stop (columns).
+
+        Students and stops without coordinates are included as-is; callers
+        filter them out beforehand if needed.
+        """
+        return geodesy.distance_matrix(
+            students.mapped('x_lat'), students.mapped('x_lon'),
+            self.mapped('latitude'), self.mapped('longitude'),
+        )
+
+    @api.model
+    def _write_route_order(self, rows):
+        """Set route and sequence of many stops in one query.
+
+        :param rows: ``(stop id, route id, sequence)`` tuples
+        """
+        if not rows:
+            return
+        stops = self.browse([row[0] for row in rows])
+        stops.flush_recordset(['route_id', 'sequence'])
+        stops.modified(['route_id', 'sequence'], before=True)
+        execute_values(self.env.cr._obj, f"""
+            UPDATE school_transport_stop s
+               SET route_id = v.route_id, sequence = v.sequence,
+                   write_uid = {int(self.env.uid)}, write_date = now() at time zone 'UTC'
+              FROM (VALUES %s) AS v(id, route_id, sequence)
+             WHERE s.id = v.id
+        """, rows)
+        routes = stops.route_id | self.env['school.transport.route'].browse({row[1] for row in rows})
+        stops.invalidate_recordset(['route_id', 'sequence', 'write_uid', 'write_date'])
+        routes.invalidate_recordset(['stop_ids'])
+        stops.modified(['route_id', 'sequence'])
@@ -1,11 +1,23 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, tools, SUPERUSER_ID
+from odoo.modules.registry import Registry
+import hashlib
+import logging
+import os
+from datetime import timedelta
+from psycopg2.extras import execute_values
+from ..tools.spool import Spool, get_flusher
+from .trip_log_storage import TRIP_LOG_COLUMNS, ROLLUP_FIELDS
+
+CACHE_VERSION_SEQUENCE = 'school_transport_cache_version_seq'
+
+_logger = logging.getLogger(__name__)
 
 class StudentCard(models.Model):
     _name = 'school.student.card'
     _description = 'Student RFID Card'
     _rec_name = 'card_id'
 
-    card_id = fields.Char(string="Card UID", required=True, unique=True, help="Unique Identifier from the RFID card")
+    card_id = fields.Char(string="Card UID", required=True, index=True, help="Unique Identifier from the RFID card")
     student_id = fields.Many2one('school.student', string="Student", required=True, help="Student assigned to this card")
     active = fields.Boolean(default=True, string="Active")
     issued_date = fields.Date(string="Issued Date", default=fields.Date.today)
@@ -15,30 +27,497 @@ class StudentCard(models.Model):
         ('expired', 'Expired')
     ], string="Status", default='active')
 
+    _sql_constraints = [
+        ('card_id_unique', 'unique(card_id)', 'This card UID is already registered.'),
+    ]
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        cards = super().create(vals_list)
+        self.env['school.transport.cache.version']._bump('cards')
+        return cards
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.env['school.transport.cache.version']._bump('cards')
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env['school.transport.cache.version']._bump('cards')
+        return res
+
+    @api.model
+    def _card_index(self):
+        """Return ``{card UID: (card id, student id, student name, refusal)}``.
+
+        ``refusal`` is False for usable cards, otherwise the reason the card
+        must be rejected. The index covers archived cards too and is cached
+        per version of the ``cards`` counter, bumped by every change to the
+        cards or their students' names, so any change is picked up by every
+        worker without clearing other caches. Callers must not mutate it.
+        """
+        return self._build_card_index(self.env['school.transport.cache.version']._get('cards'))
+
+    @api.model
+    @tools.ormcache('version')
+    def _build_card_index(self, version):
+        self.flush_model(['card_id', 'student_id', 'active', 'status'])
+        self.env['school.student'].flush_model(['name'])
+        self.env.cr.execute("""
+            SELECT c.card_id, c.id, c.student_id, s.name, c.active, c.status
+              FROM school_student_card c
+              JOIN school_student s ON s.id = c.student_id
+        """)
+        index = {}
+        for uid, card_id, student_id, name, active, status in self.env.cr.fetchall():
+            if not active:
+                refusal = 'Card deactivated.'
+            elif status in ('lost', 'expired'):
+                refusal = f'Card reported {status}.'
+            else:
+                refusal = False
+            index[uid] = (card_id, student_id, name, refusal)
+        return index
+
+
 class TripLog(models.Model):
     _name = 'school.transport.trip.log'
+    _inherit = ['school.transport.trip.log.base']
     _description = 'Transport Trip Log'
     _order = 'timestamp desc'
 
-    student_id = fields.Many2one('school.student', string="Student")
-    card_id = fields.Char(string="Card UID Used") # For logs where student might not be found or card is invalid
-    route_id = fields.Many2one('school.transport.route', string="Route")
-    vehicle_id = fields.Many2one('fleet.vehicle', string="Vehicle")
-    timestamp = fields.Datetime(string="Time", default=fields.Datetime.now, required=True)
-    gps_lat = fields.Float(string="Latitude", digits=(10, 7))
-    gps_lon = fields.Float(string="Longitude", digits=(10, 7))
-    event_type = fields.Selection([
+    _sql_constraints = [
+        ('event_key_unique', 'unique(event_key)', 'This reader event has already been logged.'),
+    ]
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        logs = super().create(vals_list)
+        self.env['school.transport.trip.rollup']._add_logs(logs)
+        return logs
+
+    def write(self, vals):
+        if not any(name in vals for name in ROLLUP_FIELDS):
+            return super().write(vals)
+        rollup = self.env['school.transport.trip.rollup']
+        rollup._add_logs(self, -1)
+        res = super().write(vals)
+        rollup._add_logs(self)
+        return res
+
+    def unlink(self):
+        self.env['school.transport.trip.rollup']._add_logs(self, -1)
+        return super().unlink()
+
+    @api.model
+    def _checkin_event_key(self, event):
+        """Idempotency key of a reader event, or None if it cannot be identified.
+
+        Readers may send their own ``event_id``; otherwise the card UID,
+        reader timestamp and position identify the tap.
+        """
+        if event.get('event_id'):
+            raw = 'id|%s|%s' % (event['card_id'], event['event_id'])
+        elif event.get('timestamp'):
+            raw = 'tap|%s|%s|%s|%s' % (event['card_id'], event['timestamp'],
+                                       event.get('gps_lat') or 0.0, event.get('gps_lon') or 0.0)
+        else:
+            return None
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    @api.model
+    def _ingest_checkins(self, events):
+        """Validate and log a batch of RFID check-in events.
+
+        Card UIDs are resolved from the in-memory card index. Events whose
+        idempotency key is already logged, even by a concurrent request,
+        are acknowledged again but not inserted twice; all new rows are
+        inserted with one ``INSERT ... ON CONFLICT DO NOTHING``.
+        Taps with a position are tagged with the stop whose geofence
+        contains them, and flagged ``geofenced`` once the live geofences
+        have consumed them.
+
+        :param events: list of dicts with ``card_id`` and optionally
+            ``event_id``, ``gps_lat``, ``gps_lon``, ``timestamp``,
+            ``vehicle_id`` and ``route_id``
+        :return: list of per-event result dicts, aligned with ``events``
+        """
+        results, vals_list = self._prepare_checkins(events)
+        self._apply_tap_state(results, vals_list)
+        new_vals, batch_keys = [], set()
+        for vals in vals_list:
+            if not vals or (vals['event_key'] and vals['event_key'] in batch_keys):
+                continue
+            batch_keys.add(vals['event_key'])
+            new_vals.append(vals)
+        if not new_vals:
+            return results
+        # Concurrent deliveries of the same event race on the unique key:
+        # let the database skip the losers instead of checking beforehand.
+        now = fields.Datetime.now()
+        audit = {'create_uid': self.env.uid, 'create_date': now, 'write_uid': self.env.uid, 'write_date': now}
+
+        def column_values(vals):
+            return tuple(audit[name] if name in audit else
+                         None if vals.get(name) is False else vals.get(name) for name in TRIP_LOG_COLUMNS)
+        rows = execute_values(self.env.cr._obj, f"""
+            INSERT INTO school_transport_trip_log ({', '.join(TRIP_LOG_COLUMNS)})
+            VALUES %s
+            ON CONFLICT (event_key) DO NOTHING
+            RETURNING id, event_key, card_id, timestamp
+        """, [column_values(vals) for vals in new_vals], fetch=True)
+        if not rows:
+            return results
+        self.invalidate_model()
+        self.env['school.transport.trip.rollup']._add_logs(self.browse([log_id for log_id, *_rest in rows]))
+        keyed = {vals['event_key']: vals for vals in new_vals if vals['event_key']}
+        unkeyed = {(vals['card_id'], vals['timestamp']): vals for vals in new_vals if not vals['event_key']}
+        pings = {}
+        for log_id, key, card_id, timestamp in rows:
+            vals = keyed[key] if key else unkeyed[(card_id, timestamp)]
+            if vals['vehicle_id'] and vals['gps_lat'] and vals['gps_lon']:
+                pings[log_id] = {
+                    'vehicle_id': vals['vehicle_id'],
+                    'route_id': vals['route_id'],
+                    'latitude': vals['gps_lat'],
+                    'longitude': vals['gps_lon'],
+                    'timestamp': vals['timestamp'],
+                }
+        # Readers on board double as GPS sources for live tracking.
+        self.env['school.transport.vehicle.position']._record_positions(list(pings.values()))
+        # Taps the geofences consumed are not learned again by the ETA cron.
+        geofenced = [log_id for log_id, ping in pings.items() if ping.get('geofenced')]
+        if geofenced:
+            self.env.cr.execute(
+                "UPDATE school_transport_trip_log SET geofenced = TRUE WHERE id IN %s", [tuple(geofenced)])
+        return results
+
+    @api.model
+    def _apply_tap_state(self, results, vals_list):
+        """Debounce repeated taps and infer check-in/check-out, in place.
+
+        Taps of the same card on the same route within
+        ``school_transport.tap_debounce_seconds`` of its last accepted tap
+        are dropped (their values become None) and reported as duplicates.
+        Accepted taps alternate check-in/check-out as long as they stay on
+        the same route within ``school_transport.trip_gap_minutes``;
+        otherwise they start a new trip with a check-in. Taps older than
+        the card's last accepted tap (late uploads) are logged as they are.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        debounce = timedelta(seconds=int(ICP.get_param('school_transport.tap_debounce_seconds', 30)))
+        trip_gap = timedelta(minutes=int(ICP.get_param('school_transport.trip_gap_minutes', 180)))
+
+        indices = sorted((i for i, vals in enumerate(vals_list) if vals),
+                         key=lambda i: vals_list[i]['timestamp'])
+        card_state = self.env['school.transport.card.state']
+        states = card_state._load({vals_list[i]['card_id'] for i in indices})
+        changed = {}
+        for i in indices:
+            vals = vals_list[i]
+            uid, route_id, timestamp = vals['card_id'], vals['route_id'], vals['timestamp']
+            last_route, last_type, last_at = states.get(uid, (False, False, None))
+            if last_at and timestamp < last_at:
+                continue
+            same_route = (last_route or False) == route_id
+            if last_at and same_route and timestamp - last_at < debounce:
+                vals_list[i] = None
+                results[i]['duplicate'] = True
+                continue
+            if vals['status'] == 'success':
+                if last_at and same_route and timestamp - last_at < trip_gap and last_type == 'check_in':
+                    vals['event_type'] = 'check_out'
+                    vals['message'] = f"Student {results[i]['student_name']} checked out."
+                results[i]['event_type'] = vals['event_type']
+            event_type = vals['event_type'] if vals['status'] == 'success' else last_type
+            states[uid] = changed[uid] = (route_id, event_type, timestamp)
+        card_state._upsert(changed)
+
+    @api.model
+    def _prepare_checkins(self, events):
+        """Return ``(results, vals_list)`` for ``events`` without writing anything.
+
+        Both lists are aligned with ``events``; rejected events have no
+        values (None).
+        """
+        card_index = self.env['school.student.card']._card_index()
+        route_ids, vehicle_routes = self.env['school.transport.route']._vehicle_route_index()
+        fences, _stop_routes = self.env['school.transport.route']._geofences()
+
+        results, vals_list = [], []
+        for event in events:
+            if not isinstance(event, dict) or not event.get('card_id'):
+                results.append({'status': 'error', 'message': 'Missing card_id'})
+                vals_list.append(None)
+                continue
+            try:
+                timestamp = fields.Datetime.to_datetime(event.get('timestamp')) or fields.Datetime.now()
+                gps_lat = float(event.get('gps_lat') or 0.0)
+                gps_lon = float(event.get('gps_lon') or 0.0)
+            except (TypeError, ValueError):
+                results.append({'status': 'error', 'message': 'Invalid timestamp or coordinates'})
+                vals_list.append(None)
+                continue
+
+            card_id = event['card_id']
+            vehicle_id = event.get('vehicle_id')
+            route_id = event.get('route_id')
+            if route_id not in route_ids:
+                route_id = vehicle_routes.get(vehicle_id, False)
+            fence = fences.get(route_id) if gps_lat and gps_lon else None
+            log_vals = {
+                'card_id': card_id,
+                'route_id': route_id,
+                'vehicle_id': vehicle_id if vehicle_id in vehicle_routes else False,
+                'stop_id': (fence and fence.locate(gps_lat, gps_lon)) or False,
+                'timestamp': timestamp,
+                'gps_lat': gps_lat,
+                'gps_lon': gps_lon,
+                'event_type': 'check_in', # Default to check-in for now
+                'event_key': self._checkin_event_key(event),
+            }
+            card = card_index.get(card_id)
+            if card is None:
+                # Invalid Card
+                log_vals.update({
+                    'status': 'denied',
+                    'message': 'Card not registered.',
+                })
+                results.append({'status': 'error', 'message': 'Card not found'})
+                vals_list.append(log_vals)
+                continue
+
+            _card, student_id, student_name, refusal = card
+            if refusal:
+                # Lost, expired or deactivated card
+                log_vals.update({
+                    'student_id': student_id,
+                    'status': 'denied',
+                    'message': refusal,
+                })
+                results.append({'status': 'error', 'message': refusal})
+            else:
+                # Valid Student
+                log_vals.update({
+                    'student_id': student_id,
+                    'status': 'success',
+                    'message': f'Student {student_name} checked in.',
+                })
+                results.append({
+                    'status': 'success',
+                    'student_name': student_name,
+                    'student_id': student_id,
+                    'event_type': 'check_in',
+                })
+            vals_list.append(log_vals)
+
+        return results, vals_list
+
+    @api.model
+    def _receive_checkins(self, events):
+        """Entry point of the check-in endpoints.
+
+        In write-behind mode (``school_transport.checkin_write_behind``)
+        events are validated against the card index, appended to the
+        durable local spool and acknowledged without touching the
+        database; a flusher bulk-inserts them shortly after.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        if not ICP.get_param('school_transport.checkin_write_behind'):
+            return self._ingest_checkins(events)
+
+        now = fields.Datetime.to_string(fields.Datetime.now())
+        for event in events:
+            if isinstance(event, dict) and not event.get('timestamp'):
+                # Stamp the event now so replays carry the same key.
+                event['timestamp'] = now
+        results, vals_list = self._prepare_checkins(events)
+        queued = [event for event, vals in zip(events, vals_list) if vals]
+        if queued:
+            self._checkin_spool().append(queued)
+            flusher = get_flusher(
+                'school_transport_spool_%s' % self.env.cr.dbname,
+                self._make_spool_flush(self.env.cr.dbname),
+                interval=int(ICP.get_param('school_transport.spool_flush_interval_ms', 500)) / 1000.0,
+                threshold=int(ICP.get_param('school_transport.spool_flush_events', 200)),
+            )
+            flusher.notify(len(queued))
+        for result, vals in zip(results, vals_list):
+            result['queued'] = bool(vals)
+        return results
+
+    @api.model
+    def _checkin_spool(self):
+        directory = os.path.join(tools.config['data_dir'], 'school_transport_spool', self.env.cr.dbname)
+        return Spool(directory)
+
+    @api.model
+    def _make_spool_flush(self, dbname):
+        def flush():
+            with Registry(dbname).cursor() as cr:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                env['school.transport.trip.log']._flush_checkin_spool()
+        return flush
+
+    @api.model
+    def _flush_checkin_spool(self):
+        """Insert spooled check-ins, committing before each batch file is removed.
+
+        Also run by cron to pick up batches left behind by a stopped worker.
+        """
+        spool = self._checkin_spool()
+        for path in spool.claim():
+            with spool.open_batch(path) as events:
+                if events is None:
+                    continue
+                self._ingest_checkins(events)
+                self.env.cr.commit()
+
+class CardState(models.Model):
+    """
+    Last accepted tap per card, used to debounce repeated taps and to
+    alternate check-in/check-out without scanning the trip log.
+    """
+    _name = 'school.transport.card.state'
+    _description = 'RFID Card Tap State'
+    _rec_name = 'card_uid'
+
+    card_uid = fields.Char(string="Card UID", required=True, readonly=True)
+    route_id = fields.Many2one('school.transport.route', string="Route", readonly=True, ondelete='set null')
+    last_event_type = fields.Selection([
         ('check_in', 'Check In'),
         ('check_out', 'Check Out')
-    ], string="Event Type", default='check_in')
-    status = fields.Selection([
-        ('success', 'Success'),
-        ('denied', 'Denied'),
-        ('error', 'Error')
-    ], string="Status", default='success')
-    message = fields.Char(string="Log Message")
+    ], string="Last Event", readonly=True)
+    last_event_at = fields.Datetime(string="Last Tap", readonly=True)
+
+    _sql_constraints = [
+        ('card_uid_unique', 'unique(card_uid)', 'Only one tap state per card.'),
+    ]
+
+    @api.model
+    def _load(self, card_uids):
+        """Return ``{card UID: (route id, last event type, last tap)}``."""
+        if not card_uids:
+            return {}
+        self.env.cr.execute("""
+            SELECT card_uid, route_id, last_event_type, last_event_at
+              FROM school_transport_card_state
+             WHERE card_uid IN %s
+        """, [tuple(card_uids)])
+        return {uid: (route_id, event_type, at) for uid, route_id, event_type, at in self.env.cr.fetchall()}
+
+    @api.model
+    def _upsert(self, states):
+        """Store ``{card UID: (route id, event type, tap time)}``, never moving a card back in time."""
+        if not states:
+            return
+        now = fields.Datetime.now()
+        rows = [(uid, route_id or None, event_type, at, self.env.uid, now, self.env.uid, now)
+                for uid, (route_id, event_type, at) in states.items()]
+        execute_values(self.env.cr._obj, """
+            INSERT INTO school_transport_card_state
+                (card_uid, route_id, last_event_type, last_event_at, create_uid, create_date, write_uid, write_date)
+            VALUES %s
+            ON CONFLICT (card_uid) DO UPDATE
+               SET route_id = EXCLUDED.route_id,
+                   last_event_type = EXCLUDED.last_event_type,
+                   last_event_at = EXCLUDED.last_event_at,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+             WHERE school_transport_card_state.last_event_at <= EXCLUDED.last_event_at
+        """, rows)
+        self.invalidate_model()
+
+
+class CacheVersion(models.Model):
+    """
+    Version counters of the in-memory indexes used on the reader and GPS
+    paths. Writers bump the counter of the data they change within their
+    own transaction, so a reader keys its cache on one primary key lookup
+    that is consistent with the data it sees. Values are drawn from a
+    sequence, so a rolled back bump is never reused.
+    """
+    _name = 'school.transport.cache.version'
+    _description = 'Transport Cache Version'
+    _rec_name = 'key'
+
+    key = fields.Char(string="Key", required=True, readonly=True)
+    version = fields.Integer(string="Version", readonly=True)
+
+    _sql_constraints = [
+        ('key_unique', 'unique(key)', 'Only one version per key.'),
+    ]
+
+    def init(self):
+        self.env.cr.execute(f"CREATE SEQUENCE IF NOT EXISTS {CACHE_VERSION_SEQUENCE}")
+
+    @api.model
+    def _get(self, key):
+        self.env.cr.execute("SELECT version FROM school_transport_cache_version WHERE key = %s", [key])
+        row = self.env.cr.fetchone()
+        return row[0] if row else 0
+
+    @api.model
+    def _bump(self, key):
+        now = fields.Datetime.now()
+        self.env.cr.execute(f"""
+            INSERT INTO school_transport_cache_version AS v
+                (key, version, create_uid, create_date, write_uid, write_date)
+            VALUES (%s, nextval('{CACHE_VERSION_SEQUENCE}'), %s, %s, %s, %s)
+            ON CONFLICT (key) DO UPDATE
+               SET version = EXCLUDED.version,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """, [key, self.env.uid, now, self.env.uid, now])
+
+
+class Student(models.Model):
+    _inherit = 'school.student'
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'name' in vals:
+            # Student names are part of the card index.
+            self.env['school.transport.cache.version']._bump('cards')
+        return res
+
 
 class TransportRoute(models.Model):
     _inherit = 'school.transport.route'
 
     vehicle_id = fields.Many2one('fleet.vehicle', string="Assigned Vehicle")
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        routes = super().create(vals_list)
+        self.env['school.transport.cache.version']._bump('routes')
+        return routes
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'vehicle_id' in vals:
+            self.env['school.transport.cache.version']._bump('routes')
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env['school.transport.cache.version']._bump('routes')
+        return res
+
+    @api.model
+    def _vehicle_route_index(self):
+        """Return ``(route ids, {vehicle id: route id})`` for validating reader events.
+
+        Cached per version of the ``routes`` counter, bumped when routes are
+        created, deleted or reassigned to another vehicle.
+        """
+        return self._build_vehicle_route_index(self.env['school.transport.cache.version']._get('routes'))
+
+    @api.model
+    @tools.ormcache('version')
+    def _build_vehicle_route_index(self, version):
+        self.flush_model(['vehicle_id'])
+        self.env.cr.execute("SELECT id, vehicle_id FROM school_transport_route")
+        rows = self.env.cr.fetchall()
+        return frozenset(r for r, _v in rows), {v: r for r, v in rows if v}
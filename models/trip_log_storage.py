@@ -0,0 +1,219 @@
+from odoo import models, fields, api
+import logging
+import time
+from datetime import timedelta
+from psycopg2.extras import execute_values
+from odoo.tools.sql import table_exists
+
+_logger = logging.getLogger(__name__)
+
+# Columns shared by the live trip log and its archive, in copy order.
+TRIP_LOG_COLUMNS = (
+    'student_id', 'card_id', 'route_id', 'vehicle_id', 'stop_id', 'timestamp', 'gps_lat', 'gps_lon',
+    'event_type', 'status', 'message', 'event_key', 'geofenced',
+    'create_uid', 'create_date', 'write_uid', 'write_date',
+)
+
+# Trip log fields the daily rollups are keyed and counted on.
+ROLLUP_FIELDS = ('timestamp', 'route_id', 'student_id', 'status', 'event_type')
+
+
+class TripLogBase(models.AbstractModel):
+    """
+    Fields common to the live trip log and its archive.
+    """
+    _name = 'school.transport.trip.log.base'
+    _description = 'Transport Trip Log Fields'
+    _order = 'timestamp desc'
+
+    student_id = fields.Many2one('school.student', string="Student", index=True)
+    card_id = fields.Char(string="Card UID Used") # For logs where student might not be found or card is invalid
+    route_id = fields.Many2one('school.transport.route', string="Route", index=True)
+    vehicle_id = fields.Many2one('fleet.vehicle', string="Vehicle")
+    stop_id = fields.Many2one('school.transport.stop', string="Stop", index=True, ondelete='set null',
+                              help="Stop whose geofence contains the tap position")
+    timestamp = fields.Datetime(string="Time", default=fields.Datetime.now, required=True, index=True)
+    gps_lat = fields.Float(string="Latitude", digits=(10, 7))
+    gps_lon = fields.Float(string="Longitude", digits=(10, 7))
+    event_type = fields.Selection([
+        ('check_in', 'Check In'),
+        ('check_out', 'Check Out')
+    ], string="Event Type", default='check_in')
+    status = fields.Selection([
+        ('success', 'Success'),
+        ('denied', 'Denied'),
+        ('error', 'Error')
+    ], string="Status", default='success')
+    message = fields.Char(string="Log Message")
+    event_key = fields.Char(string="Event Key", readonly=True, copy=False,
+                            help="Idempotency key of the reader event, used to drop replays")
+    geofenced = fields.Boolean(string="Geofenced", readonly=True, copy=False,
+                               help="The tap went through the live stop geofences, so its segment "
+                                    "times were already learned")
+
+
+class TripLogArchive(models.Model):
+    """
+    Trip log rows older than the hot window, moved here by cron and purged
+    after the retention period.
+    """
+    _name = 'school.transport.trip.log.archive'
+    _inherit = ['school.transport.trip.log.base']
+    _description = 'Archived Transport Trip Log'
+
+    _sql_constraints = [
+        ('event_key_unique', 'unique(event_key)', 'This reader event has already been archived.'),
+    ]
+
+    @api.model
+    def _move_old_logs(self):
+        """Cron: move logs past the hot window to the archive, then purge the archive.
+
+        ``school_transport.trip_log_hot_days`` (default 60) sets how long
+        rows stay in the live table and
+        ``school_transport.trip_log_retention_days`` (default 730) how long
+        archived rows are kept. Work is done in committed chunks.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        hot_days = int(ICP.get_param('school_transport.trip_log_hot_days', 60))
+        retention_days = int(ICP.get_param('school_transport.trip_log_retention_days', 730))
+        chunk_size = int(ICP.get_param('school_transport.trip_log_move_chunk_size', 5000))
+        deadline = time.monotonic() + int(ICP.get_param('school_transport.trip_log_move_time_budget', 600))
+        now = fields.Datetime.now()
+        columns = ', '.join(TRIP_LOG_COLUMNS)
+
+        moved = 0
+        while time.monotonic() < deadline:
+            self.env.cr.execute(f"""
+                WITH moved AS (
+                    DELETE FROM school_transport_trip_log
+                     WHERE id IN (SELECT id FROM school_transport_trip_log
+                                   WHERE timestamp < %s ORDER BY timestamp LIMIT %s)
+                 RETURNING {columns}
+                )
+                INSERT INTO school_transport_trip_log_archive ({columns})
+                SELECT {columns} FROM moved
+                ON CONFLICT (event_key) DO NOTHING
+            """, [now - timedelta(days=hot_days), chunk_size])
+            count = self.env.cr.rowcount
+            moved += count
+            self.env.cr.commit()
+            if count < chunk_size:
+                break
+
+        purged = 0
+        if retention_days > 0:
+            while time.monotonic() < deadline:
+                self.env.cr.execute("""
+                    DELETE FROM school_transport_trip_log_archive
+                     WHERE id IN (SELECT id FROM school_transport_trip_log_archive
+                                   WHERE timestamp < %s LIMIT %s)
+                """, [now - timedelta(days=retention_days), chunk_size])
+                count = self.env.cr.rowcount
+                purged += count
+                self.env.cr.commit()
+                if count < chunk_size:
+                    break
+
+        self.env['school.transport.trip.log'].invalidate_model()
+        self.invalidate_model()
+        _logger.info("Trip log storage: %s rows archived, %s archived rows purged.", moved, purged)
+
+
+class TripRollup(models.Model):
+    """
+    Daily per route and student counters of trip log events, maintained
+    incrementally as logs are created, edited or deleted. Archiving and
+    purging the raw logs leaves them untouched.
+    """
+    _name = 'school.transport.trip.rollup'
+    _description = 'Daily Trip Summary'
+    _order = 'date desc, route_id, student_id'
+
+    date = fields.Date(string="Date", required=True, readonly=True, index=True)
+    route_id = fields.Many2one('school.transport.route', string="Route", readonly=True, ondelete='cascade')
+    student_id = fields.Many2one('school.student', string="Student", readonly=True, index=True, ondelete='cascade')
+    check_ins = fields.Integer(string="Check-ins", readonly=True, aggregator='sum')
+    check_outs = fields.Integer(string="Check-outs", readonly=True, aggregator='sum')
+    denials = fields.Integer(string="Denials", readonly=True, aggregator='sum')
+    first_time = fields.Datetime(string="First Event", readonly=True, aggregator='min')
+    last_time = fields.Datetime(string="Last Event", readonly=True, aggregator='max')
+
+    def init(self):
+        # Route and student may be empty; key the upsert on an expression
+        # index so such rows still aggregate into a single row per day.
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS school_transport_trip_rollup_key_uniq
+                ON school_transport_trip_rollup (date, COALESCE(route_id, 0), COALESCE(student_id, 0))
+        """)
+        if not table_exists(self.env.cr, 'school_transport_trip_log'):
+            return
+        self.env.cr.execute("SELECT 1 FROM school_transport_trip_rollup LIMIT 1")
+        if not self.env.cr.fetchone():
+            # First install on a database with existing logs.
+            self._rebuild()
+
+    def _rollup_tz(self):
+        return self.env.company.partner_id.tz or 'UTC'
+
+    @api.model
+    def _rebuild(self):
+        """Recompute every rollup from the live and archived logs."""
+        self.env.cr.execute("DELETE FROM school_transport_trip_rollup")
+        self.env.cr.execute("""
+            INSERT INTO school_transport_trip_rollup
+                (date, route_id, student_id, check_ins, check_outs, denials, first_time, last_time,
+                 create_uid, create_date, write_uid, write_date)
+            SELECT (timestamp AT TIME ZONE 'UTC' AT TIME ZONE %(tz)s)::date, route_id, student_id,
+                   count(*) FILTER (WHERE status = 'success' AND event_type = 'check_in'),
+                   count(*) FILTER (WHERE status = 'success' AND event_type = 'check_out'),
+                   count(*) FILTER (WHERE status != 'success'),
+                   min(timestamp), max(timestamp),
+                   %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+              FROM (SELECT timestamp, route_id, student_id, status, event_type FROM school_transport_trip_log
+                    UNION ALL
+                    SELECT timestamp, route_id, student_id, status, event_type FROM school_transport_trip_log_archive) logs
+             GROUP BY 1, 2, 3
+        """, {'tz': self._rollup_tz(), 'uid': self.env.uid})
+        self.invalidate_model()
+
+    @api.model
+    def _add_logs(self, logs, sign=1):
+        """Fold trip logs into the rollups with one upsert.
+
+        With ``sign=-1`` the logs are taken out of the counters instead,
+        before they are edited or deleted. First and last times only ever
+        widen, so they may still cover a removed log.
+        """
+        tz = self._rollup_tz()
+        totals = {}
+        for log in logs:
+            day = fields.Datetime.context_timestamp(self.with_context(tz=tz), log.timestamp).date()
+            key = (day, log.route_id.id or None, log.student_id.id or None)
+            ins, outs, denials, first, last = totals.get(key, (0, 0, 0, log.timestamp, log.timestamp))
+            if log.status != 'success':
+                denials += sign
+            elif log.event_type == 'check_out':
+                outs += sign
+            else:
+                ins += sign
+            totals[key] = (ins, outs, denials, min(first, log.timestamp), max(last, log.timestamp))
+        if not totals:
+            return
+        now = fields.Datetime.now()
+        rows = [key + values + (self.env.uid, now, self.env.uid, now) for key, values in totals.items()]
+        execute_values(self.env.cr._obj, """
+            INSERT INTO school_transport_trip_rollup AS r
+                (date, route_id, student_id, check_ins, check_outs, denials, first_time, last_time,
+                 create_uid, create_date, write_uid, write_date)
+            VALUES %s
+            ON CONFLICT (date, COALESCE(route_id, 0), COALESCE(student_id, 0)) DO UPDATE
+               SET check_ins = r.check_ins + EXCLUDED.check_ins,
+                   check_outs = r.check_outs + EXCLUDED.check_outs,
+                   denials = r.denials + EXCLUDED.denials,
+                   first_time = LEAST(r.first_time, EXCLUDED.first_time),
+                   last_time = GREATEST(r.last_time, EXCLUDED.last_time),
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+        """, rows)
+        self.invalidate_model()
@@ -0,0 +1,219 @@
+from odoo import models, fields, api
+import logging
+from psycopg2.extras import execute_values
+
+_logger = logging.getLogger(__name__)
+
+POSITION_SEQUENCE = 'school_transport_vehicle_position_seq_counter'
+MAX_CHANGES = 1000
+# Bus channel of the fleet's live positions; a route's channel adds ".<route id>".
+LIVE_CHANNEL = 'school_transport.positions'
+
+
+class VehiclePosition(models.Model):
+    """
+    Last known position of each vehicle, upserted from GPS pings.
+
+    Every accepted update draws a new ``seq`` from a database sequence and
+    is pushed over the bus to the fleet channel and the route's channel;
+    clients load the current positions once and ask for the positions
+    changed after the last ``seq`` they saw when they reconnect. The cost
+    of tracking is one row per vehicle, whatever the size of the trip log.
+    """
+    _name = 'school.transport.vehicle.position'
+    _description = 'Vehicle Position'
+    _order = 'seq desc'
+    _rec_name = 'vehicle_id'
+
+    vehicle_id = fields.Many2one('fleet.vehicle', string="Vehicle", required=True, readonly=True, ondelete='cascade')
+    route_id = fields.Many2one('school.transport.route', string="Route", readonly=True, ondelete='set null')
+    latitude = fields.Float(string="Latitude", digits=(10, 7), readonly=True)
+    longitude = fields.Float(string="Longitude", digits=(10, 7), readonly=True)
+    speed = fields.Float(string="Speed (km/h)", readonly=True)
+    heading = fields.Float(string="Heading (°)", readonly=True)
+    timestamp = fields.Datetime(string="GPS Time", readonly=True)
+    seq = fields.Integer(string="Update Sequence", readonly=True, index=True)
+    stop_id = fields.Many2one('school.transport.stop', string="At Stop", readonly=True, ondelete='set null')
+    stop_arrived_at = fields.Datetime(string="Arrived At", readonly=True)
+    stop_seen_at = fields.Datetime(string="Last Seen At Stop", readonly=True)
+    last_stop_id = fields.Many2one('school.transport.stop', string="Last Stop", readonly=True, ondelete='set null')
+    last_departed_at = fields.Datetime(string="Departed At", readonly=True)
+
+    _sql_constraints = [
+        ('vehicle_unique', 'unique(vehicle_id)', 'Only one position per vehicle.'),
+    ]
+
+    def init(self):
+        self.env.cr.execute(f"CREATE SEQUENCE IF NOT EXISTS {POSITION_SEQUENCE}")
+
+    @api.model
+    def _record_positions(self, pings):
+        """Upsert ``pings``, never moving a vehicle back in time.
+
+        Every ping also goes through the stop geofences, which emit
+        arrival/departure events; the resulting stop state is stored with
+        the position.
+
+        :param pings: dicts with ``vehicle_id``, ``route_id``, ``latitude``,
+            ``longitude``, ``timestamp`` and optionally ``speed``/``heading``
+        """
+        states = self.env['school.transport.stop.event']._detect(pings)
+        # One row per vehicle: an upsert cannot touch the same row twice.
+        latest = {}
+        for ping in pings:
+            current = latest.get(ping['vehicle_id'])
+            if current is None or current['timestamp'] <= ping['timestamp']:
+                latest[ping['vehicle_id']] = ping
+        if not latest:
+            return
+        now = fields.Datetime.now()
+        rows = [(p['vehicle_id'], p.get('route_id') or None, p['latitude'], p['longitude'],
+                 p.get('speed') or 0.0, p.get('heading') or 0.0, p['timestamp'])
+                + states[p['vehicle_id']] + (self.env.uid, now, self.env.uid, now)
+                for p in latest.values()]
+        updated = execute_values(self.env.cr._obj, """
+            INSERT INTO school_transport_vehicle_position AS p
+                (vehicle_id, route_id, latitude, longitude, speed, heading, timestamp, seq,
+                 stop_id, stop_arrived_at, stop_seen_at, last_stop_id, last_departed_at,
+                 create_uid, create_date, write_uid, write_date)
+            VALUES %s
+            ON CONFLICT (vehicle_id) DO UPDATE
+               SET route_id = EXCLUDED.route_id,
+                   latitude = EXCLUDED.latitude,
+                   longitude = EXCLUDED.longitude,
+                   speed = EXCLUDED.speed,
+                   heading = EXCLUDED.heading,
+                   timestamp = EXCLUDED.timestamp,
+                   seq = EXCLUDED.seq,
+                   stop_id = EXCLUDED.stop_id,
+                   stop_arrived_at = EXCLUDED.stop_arrived_at,
+                   stop_seen_at = EXCLUDED.stop_seen_at,
+                   last_stop_id = EXCLUDED.last_stop_id,
+                   last_departed_at = EXCLUDED.last_departed_at,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+             WHERE p.timestamp <= EXCLUDED.timestamp
+         RETURNING p.seq
+        """, rows, template=f"(%s, %s, %s, %s, %s, %s, %s, nextval('{POSITION_SEQUENCE}'), %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                              fetch=True)
+        self.invalidate_model()
+        self._publish_positions([seq for seq, in updated])
+
+    @api.model
+    def _publish_positions(self, seqs):
+        """Push the positions of update ``seqs`` to the live bus channels.
+
+        Notifications are sent when the transaction commits.
+        """
+        if not seqs:
+            return
+        positions = self._read_positions("p.seq IN %s", [tuple(seqs)])
+        by_route = {}
+        for position in positions:
+            if position['route_id']:
+                by_route.setdefault(position['route_id'], []).append(position)
+        self.env['bus.bus'].sudo()._sendmany(
+            [(LIVE_CHANNEL, 'school_transport/positions', {'positions': positions})]
+            + [(f'{LIVE_CHANNEL}.{route_id}', 'school_transport/positions', {'positions': route_positions})
+               for route_id, route_positions in by_route.items()])
+
+    @api.model
+    def _geofence_states(self, vehicle_ids):
+        """Return ``{vehicle id: ((stop id, arrived, seen, last stop id, departed), position time)}``.
+
+        The rows are locked in vehicle order, so concurrent batches of one
+        vehicle are matched against the geofences one after the other and
+        batches sharing vehicles cannot deadlock.
+        """
+        states = {vehicle_id: ((None, None, None, None, None), None) for vehicle_id in vehicle_ids}
+        self.env.cr.execute("""
+            SELECT vehicle_id, stop_id, stop_arrived_at, stop_seen_at, last_stop_id, last_departed_at, timestamp
+              FROM school_transport_vehicle_position
+             WHERE vehicle_id IN %s
+          ORDER BY vehicle_id
+               FOR UPDATE
+        """, [tuple(vehicle_ids)])
+        for vehicle_id, *state, timestamp in self.env.cr.fetchall():
+            states[vehicle_id] = (tuple(state), timestamp)
+        return states
+
+    @api.model
+    def _ingest_pings(self, events):
+        """Validate and record a batch of GPS pings.
+
+        :param events: dicts with ``vehicle_id``, ``gps_lat``, ``gps_lon`` and
+            optionally ``timestamp``, ``speed``, ``heading`` and ``route_id``
+        :return: list of per-event result dicts, aligned with ``events``
+        """
+        route_ids, vehicle_routes = self.env['school.transport.route']._vehicle_route_index()
+        results, pings = [], []
+        for event in events:
+            if not isinstance(event, dict) or event.get('vehicle_id') not in vehicle_routes:
+                results.append({'status': 'error', 'message': 'Unknown vehicle'})
+                continue
+            try:
+                ping = {
+                    'vehicle_id': event['vehicle_id'],
+                    'latitude': float(event['gps_lat']),
+                    'longitude': float(event['gps_lon']),
+                    'speed': float(event.get('speed') or 0.0),
+                    'heading': float(event.get('heading') or 0.0),
+                    'timestamp': fields.Datetime.to_datetime(event.get('timestamp')) or fields.Datetime.now(),
+                }
+            except (KeyError, TypeError, ValueError):
+                results.append({'status': 'error', 'message': 'Invalid timestamp or coordinates'})
+                continue
+            route_id = event.get('route_id')
+            ping['route_id'] = route_id if route_id in route_ids else vehicle_routes[event['vehicle_id']]
+            pings.append(ping)
+            results.append({'status': 'success'})
+        self._record_positions(pings)
+        return results
+
+    @api.model
+    def _changes_since(self, seq, route_id=None):
+        """Positions updated after ``seq``, oldest first, and the new cursor.
+
+        A transaction may commit after another that drew a later ``seq``;
+        such an update can be skipped by a client, which then gets the
+        vehicle's next ping instead.
+        """
+        positions = self._read_positions("p.seq > %s AND (%s IS NULL OR p.route_id = %s)",
+                                         [seq, route_id, route_id], limit=MAX_CHANGES)
+        return positions, positions[-1]['seq'] if positions else seq
+
+    @api.model
+    def _read_positions(self, condition, params, limit=None):
+        """Positions matching the SQL ``condition``, oldest update first, as
+        the dicts sent to live clients."""
+        self.env.cr.execute(f"""
+            SELECT p.seq, p.vehicle_id, v.license_plate, p.route_id, p.latitude, p.longitude,
+                   p.speed, p.heading, p.timestamp
+              FROM school_transport_vehicle_position p
+              JOIN fleet_vehicle v ON v.id = p.vehicle_id
+             WHERE {condition}
+          ORDER BY p.seq
+             LIMIT %s
+        """, params + [limit])
+        return [{
+            'seq': seq,
+            'vehicle_id': vehicle_id,
+            'plate': plate or '',
+            'route_id': rid,
+            'lat': lat,
+            'lon': lon,
+            'speed': speed,
+            'heading': heading,
+            'timestamp': fields.Datetime.to_string(timestamp),
+        } for seq, vehicle_id, plate, rid, lat, lon, speed, heading, timestamp in self.env.cr.fetchall()]
+
+
+class IrWebsocket(models.AbstractModel):
+    _inherit = 'ir.websocket'
+
+    def _build_bus_channel_list(self, channels):
+        # Live positions are for internal users only.
+        if not self.env.user._is_internal():
+            channels = [channel for channel in channels
+                        if not (isinstance(channel, str) and channel.startswith(LIVE_CHANNEL))]
+        return super()._build_bus_channel_list(channels)
@@ -0,0 +1,110 @@
+/* Helpers shared by the transport map pages (plain script, no asset bundle). */
+(function () {
+    'use strict';
+
+    // Highest zoom of each simplified geometry band, as GEOMETRY_ZOOM_BANDS
+    // in models/transport.py. Closer zooms use the full resolution path.
+    var GEOMETRY_BANDS = [12, 15];
+
+    // Decode a Google encoded polyline into [lat, lon] pairs.
+    function decodePolyline(str, precision) {
+        var factor = Math.pow(10, precision || 5), points = [];
+        var index = 0, lat = 0, lon = 0;
+        while (index < str.length) {
+            var deltas = [];
+            for (var k = 0; k < 2; k++) {
+                var shift = 0, result = 0, b;
+                do {
+                    b = str.charCodeAt(index++) - 63;
+                    result |= (b & 0x1f) << shift;
+                    shift += 5;
+                } while (b >= 0x20);
+                deltas.push(result & 1 ? ~(result >> 1) : result >> 1);
+            }
+            lat += deltas[0];
+            lon += deltas[1];
+            points.push([lat / factor, lon / factor]);
+        }
+        return points;
+    }
+
+    // Index of the geometry band used at map zoom level ``zoom``.
+    function geometryBand(zoom) {
+        for (var i = 0; i < GEOMETRY_BANDS.length; i++) {
+            if (zoom <= GEOMETRY_BANDS[i]) {
+                return i;
+            }
+        }
+        return GEOMETRY_BANDS.length;
+    }
+
+    // Show live vehicle positions on ``map``: the current positions are
+    // loaded once, then updates are pushed over the Odoo bus websocket.
+    // After a reconnection the positions missed meanwhile are fetched from
+    // the last ``seq`` seen. ``routeId`` restricts the vehicles to one
+    // route; ``busVersion`` is the websocket protocol version.
+    function followVehicles(map, routeId, busVersion) {
+        var markers = {};
+        var seqs = {};
+        var seq = 0;
+        var channel = 'school_transport.positions' + (routeId ? '.' + routeId : '');
+
+        function show(pos) {
+            if (seqs[pos.vehicle_id] >= pos.seq) {
+                return;
+            }
+            seqs[pos.vehicle_id] = pos.seq;
+            seq = Math.max(seq, pos.seq);
+            var popup = '<b>Bus ' + (pos.plate || pos.vehicle_id) + '</b><br/>' +
+                'Speed: ' + pos.speed.toFixed(0) + ' km/h<br/>' + pos.timestamp + ' UTC';
+            var marker = markers[pos.vehicle_id];
+            if (marker) {
+                marker.setLatLng([pos.lat, pos.lon]).setPopupContent(popup);
+            } else {
+                markers[pos.vehicle_id] = L.circleMarker([pos.lat, pos.lon], {
+                    radius: 9, color: '#fff', weight: 2, fillColor: '#FF5722', fillOpacity: 1
+                }).bindPopup(popup).addTo(map);
+            }
+        }
+
+        function catchUp() {
+            var url = '/school_transport/api/live?since=' + seq + (routeId ? '&route_id=' + routeId : '');
+            return fetch(url, {credentials: 'same-origin'})
+                .then(function (response) {
+                    if (!response.ok) {
+                        throw new Error(response.statusText);
+                    }
+                    return response.json();
+                })
+                .then(function (data) {
+                    data.positions.forEach(show);
+                });
+        }
+
+        function connect() {
+            var socket = new WebSocket((location.protocol === 'https:' ? 'wss://' : 'ws://') + location.host +
+                '/websocket?version=' + encodeURIComponent(busVersion || ''));
+            socket.onopen = function () {
+                socket.send(JSON.stringify({event_name: 'subscribe', data: {channels: [channel], last: 0}}));
+                catchUp().catch(function () {});
+            };
+            socket.onmessage = function (event) {
+                JSON.parse(event.data).forEach(function (notification) {
+                    if (notification.message.type === 'school_transport/positions') {
+                        notification.message.payload.positions.forEach(show);
+                    }
+                });
+            };
+            socket.onclose = function () {
+                setTimeout(connect, 5000);
+            };
+        }
+        connect();
+    }
+
+    window.schoolTransportMap = {
+        decodePolyline: decodePolyline,
+        geometryBand: geometryBand,
+        followVehicles: followVehicles,
+    };
+})();
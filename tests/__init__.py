@@ -0,0 +1,2 @@
+from . import test_geocoder
+from . import test_route_map
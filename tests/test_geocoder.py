@@ -0,0 +1,23 @@
+from odoo.tests.common import BaseCase
+
+from ..tools.geocoder import has_house_number
+
+
+class TestHouseNumber(BaseCase):
+
+    def test_leading_house_number(self):
+        for address in ("12 Lê Duẩn", "K23/4 Hải Phòng", "số 5 Trần Phú", "Trường THPT, 154 Lê Lợi"):
+            self.assertTrue(has_house_number(address), address)
+
+    def test_alley_house_number(self):
+        for address in ("Kiệt 123 Nguyễn Văn Linh", "Hẻm 45 Điện Biên Phủ",
+                        "kiệt 12 Ông Ích Khiêm, Hải Châu", "số nhà 7 Hùng Vương", "ngách 3 ngõ 5 Lê Lợi"):
+            self.assertTrue(has_house_number(address), address)
+
+    def test_street_names(self):
+        for address in ("Lê Duẩn, Hải Châu", "Chợ Hàn", "Đường 2 Tháng 9", "2 Tháng 9",
+                        "3 Tháng 2, Hải Châu", "30 Tháng 4"):
+            self.assertFalse(has_house_number(address), address)
+
+    def test_house_number_on_date_street(self):
+        self.assertTrue(has_house_number("12 2 Tháng 9, Hải Châu"))
@@ -0,0 +1,27 @@
+import json
+
+from odoo.tests.common import TransactionCase
+
+
+class TestRouteMap(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.route = cls.env['school.transport.route'].create({'name': "Route A", 'bus_number': "43B-001"})
+        cls.env['school.transport.stop'].create([
+            {'name': "Stop 1", 'route_id': cls.route.id, 'sequence': 10, 'latitude': 16.0678, 'longitude': 108.2208},
+            {'name': "Stop 2", 'route_id': cls.route.id, 'sequence': 20, 'latitude': 16.0606, 'longitude': 108.2230},
+        ])
+        cls.route.compute_route_geometry()
+
+    def test_map_payload(self):
+        version = self.route._map_version()[0]
+        full = json.loads(self.route._map_payload(version))
+        self.assertEqual(full['route_name'], "Route A")
+        self.assertEqual([stop['name'] for stop in full['stops']], ["Stop 1", "Stop 2"])
+        self.assertEqual(full['geometry'], self.route.geometry_polyline)
+        low = json.loads(self.route._map_payload(version, 10))
+        self.assertEqual(low['geometry'], self.route.geometry_polyline_low)
+        # Zooms of the same band share one payload.
+        self.assertEqual(self.route._map_payload(version, 10), self.route._map_payload(version, 11))
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent, rate-limited HTTP client for Nominatim's ``/search`` endpoint.
+
+This module is deliberately ORM-free: worker threads only talk HTTP, the
+calling transaction does all cache lookups and writes.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_logger = logging.getLogger(__name__)
+
+USER_AGENT = 'Odoo (http://www.odoo.com)'
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilling ``rate`` tokens per second."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until one token is available, then consume it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class NominatimClient:
+    """
+    Pooled ``requests.Session`` wrapper with rate limiting and retries.
+
+    One client (and therefore one token bucket) is shared by every thread
+    of a server process; see :func:`get_client`.
+    """
+
+    def __init__(self, endpoint, rate=1.0, workers=4, max_retries=3, backoff=1.0, timeout=10):
+        self.endpoint = endpoint
+        self.workers = max(1, int(workers))
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate)
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _retry_delay(self, response, attempt):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * (2 ** attempt)
+
+    def search(self, params):
+        """Run one ``/search`` query and return the decoded JSON list.
+
+        Raises ``requests.RequestException`` once retries are exhausted.
+        """
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            self.bucket.acquire()
+            try:
+                response = self.session.get(self.endpoint, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if last:
+                    raise
+                time.sleep(self._retry_delay(None, attempt))
+                continue
+            if response.status_code in RETRY_STATUSES and not last:
+                _logger.info("Nominatim returned %s, retrying (attempt %s).", response.status_code, attempt + 1)
+                time.sleep(self._retry_delay(response, attempt))
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    def search_many(self, params_list):
+        """Run many queries on the thread pool.
+
+        Returns a list aligned with ``params_list`` holding either the
+        decoded results or the exception raised for that query.
+        """
+        def run(params):
+            try:
+                return self.search(params)
+            except (requests.RequestException, ValueError) as e:
+                return e
+
+        if len(params_list) <= 1:
+            return [run(p) for p in params_list]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(params_list))) as executor:
+            return list(executor.map(run, params_list))
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(endpoint, rate=1.0, workers=4):
+    """Return the process-wide client for this endpoint and settings."""
+    key = (endpoint, float(rate), int(workers))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = NominatimClient(endpoint, rate=rate, workers=workers)
+        return client
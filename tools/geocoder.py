@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Pluggable geocoder backends.
+
+A backend resolves a list of structured address queries (dicts with the
+keys street, city, state, country and postalcode) and returns, for each
+query, one of:
+
+* a list of result dicts (``lat``, ``lon``, ``display_name``, ``address``),
+  empty when the backend is sure the address does not exist;
+* ``None`` when the backend has no answer and the next backend should try;
+* an exception instance when the lookup failed.
+"""
+import abc
+import csv
+import difflib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+
+from .geocode_batch import get_client
+
+_logger = logging.getLogger(__name__)
+
+ADDRESS_KEYS = ('street', 'city', 'state', 'country', 'postalcode')
+
+# Words that qualify a place rather than name it ("đường Lê Duẩn",
+# "phường Hải Châu", ...). They are ignored when matching.
+STOP_WORDS = frozenset({
+    'duong', 'pho', 'phuong', 'quan', 'huyen', 'xa', 'thanh', 'tp', 'tinh',
+    'kiet', 'hem', 'ngo', 'so', 'street', 'st', 'road', 'rd', 'ward', 'district',
+})
+CITY_WORDS = ('da nang', 'danang', 'viet nam', 'vietnam')
+
+
+def fold_text(text):
+    """Lower-case ``text`` and strip Vietnamese diacritics ("Đà Nẵng" -> "da nang")."""
+    text = unicodedata.normalize('NFD', text or '').replace('đ', 'd').replace('Đ', 'D')
+    text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+    return text.casefold()
+
+
+def normalize_place(text):
+    """Accent-insensitive matching key of a street or POI name.
+
+    Parenthesised qualifiers, leading house numbers, city names and
+    qualifier words are dropped.
+    """
+    text = re.sub(r'\(.*?\)', ' ', fold_text(text))
+    for city in CITY_WORDS:
+        text = re.sub(r'\b%s\b' % city, ' ', text)
+    tokens = re.sub(r'[^\w/]+', ' ', text).split()
+    while tokens and any(c.isdigit() for c in tokens[0]) and len(tokens) > 1:
+        tokens.pop(0)
+    return ' '.join(t for t in tokens if t not in STOP_WORDS and '/' not in t)
+
+
+# Streets named after dates ("2 Tháng 9", "3 Tháng 2", "30 Tháng 4"): their
+# numbers are part of the name, not house numbers.
+DATE_STREET = re.compile(r'\b\d{1,2}\s+thang\s+\d{1,2}\b')
+# A house number opening a part ("12 Lê Duẩn", "K23/4 Hải Phòng"), or one
+# introduced by an alley or number word anywhere in it ("Kiệt 123 ...",
+# "Hẻm 45 ...", "ngách 7", "số nhà 5").
+HOUSE_NUMBER = re.compile(r'^\s*[a-z]?\d|\b(kiet|hem|ngo|ngach|so nha|so)\s*\d')
+
+
+def has_house_number(text):
+    """Whether any comma-separated part of ``text`` holds a house number
+    ("12 Lê Duẩn", "Kiệt 123 Nguyễn Văn Linh", "số 5 Trần Phú"), not
+    counting date street names such as "2 Tháng 9"."""
+    return any(HOUSE_NUMBER.search(DATE_STREET.sub(' ', part)) for part in fold_text(text).split(','))
+
+
+class GeocoderBackend(abc.ABC):
+    """Base class of geocoder backends."""
+
+    #: whether answers should be stored in the persistent geocode cache
+    cacheable = False
+
+    @abc.abstractmethod
+    def geocode_many(self, queries, limit=1):
+        """Return one reply per query, as described in the module docstring."""
+
+
+class NominatimBackend(GeocoderBackend):
+    """Remote backend querying a Nominatim ``/search`` endpoint."""
+
+    cacheable = True
+
+    def __init__(self, endpoint, rate=1.0, workers=4):
+        self.client = get_client(endpoint, rate=rate, workers=workers)
+
+    def geocode_many(self, queries, limit=1):
+        params_list = []
+        for query in queries:
+            params = {k: query.get(k) for k in ADDRESS_KEYS}
+            params.update({'format': 'json', 'limit': limit, 'addressdetails': 1})
+            params_list.append({k: v for k, v in params.items() if v})
+
+        replies = []
+        for reply in self.client.search_many(params_list):
+            if isinstance(reply, Exception):
+                replies.append(reply)
+                continue
+            replies.append([{
+                'lat': res.get('lat'),
+                'lon': res.get('lon'),
+                'display_name': res.get('display_name'),
+                'address': res.get('address', {}),
+            } for res in reply or []])
+        return replies
+
+
+class Gazetteer:
+    """
+    In-memory index of named places loaded from a CSV or SQLite extract.
+
+    CSV files need the columns ``name``, ``lat`` and ``lon``; ``kind`` and
+    ``alt_names`` (``;`` separated) are optional. SQLite files must hold a
+    ``gazetteer`` table with the same columns.
+    """
+
+    def __init__(self, rows):
+        self.entries = []
+        self.exact = {}
+        self.tokens = defaultdict(set)
+        for row in rows:
+            try:
+                lat, lon = float(row['lat']), float(row['lon'])
+            except (KeyError, TypeError, ValueError):
+                continue
+            entry = {
+                'lat': lat,
+                'lon': lon,
+                'display_name': row['name'],
+                'address': {'kind': row.get('kind') or 'poi'},
+            }
+            index = len(self.entries)
+            self.entries.append(entry)
+            names = [row['name']] + [n for n in (row.get('alt_names') or '').split(';') if n.strip()]
+            for name in names:
+                key = normalize_place(name)
+                if not key:
+                    continue
+                self.exact.setdefault(key, index)
+                for token in key.split():
+                    self.tokens[token].add(index)
+        self.keys = {}
+        for key, index in self.exact.items():
+            self.keys.setdefault(index, []).append(key)
+        self.match = lru_cache(maxsize=4096)(self._match)
+
+    @classmethod
+    def load(cls, path):
+        if path.endswith(('.sqlite', '.sqlite3', '.db')):
+            with sqlite3.connect(path) as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.execute("SELECT * FROM gazetteer")
+                rows = [dict(row) for row in cursor]
+        else:
+            with open(path, newline='', encoding='utf-8') as f:
+                rows = list(csv.DictReader(f))
+        gazetteer = cls(rows)
+        _logger.info("Loaded gazetteer %s with %s places.", path, len(gazetteer.entries))
+        return gazetteer
+
+    def _match(self, text, cutoff):
+        """Return the best entry index for ``text``, or None."""
+        key = normalize_place(text)
+        if not key:
+            return None
+        if key in self.exact:
+            return self.exact[key]
+        candidates = set()
+        for token in key.split():
+            candidates |= self.tokens.get(token, set())
+        best, best_score = None, cutoff
+        for index in candidates:
+            for name in self.keys.get(index, ()):
+                score = difflib.SequenceMatcher(None, key, name).ratio()
+                if score > best_score:
+                    best, best_score = index, score
+        return best
+
+    def lookup(self, street, cutoff=0.85):
+        """Return the entry matching ``street``, or None.
+
+        The whole string is tried first, then each comma-separated part, so
+        "Chợ Hàn, Hải Châu" matches the market "Chợ Hàn".
+        """
+        parts = [street] + [p for p in street.split(',') if p.strip()]
+        for part in parts:
+            index = self.match(part, cutoff)
+            if index is not None:
+                return self.entries[index]
+        return None
+
+
+class GazetteerBackend(GeocoderBackend):
+    """Offline backend answering from a local :class:`Gazetteer`.
+
+    The gazetteer only knows streets and named places, so addresses with a
+    house number are left to the next backend rather than collapsed onto
+    a single point of their street.
+    """
+
+    def __init__(self, gazetteer, cutoff=0.85):
+        self.gazetteer = gazetteer
+        self.cutoff = cutoff
+
+    def geocode_many(self, queries, limit=1):
+        replies = []
+        for query in queries:
+            street = query.get('street')
+            if not street or has_house_number(street):
+                replies.append(None)
+                continue
+            entry = self.gazetteer.lookup(street, self.cutoff)
+            replies.append([dict(entry)] if entry else None)
+        return replies
+
+
+_gazetteers = {}
+_gazetteers_lock = threading.Lock()
+
+
+def get_gazetteer(path):
+    """Return the process-wide gazetteer for ``path``, reloading it when the file changes."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        _logger.warning("Gazetteer file %s not found.", path)
+        return None
+    with _gazetteers_lock:
+        cached = _gazetteers.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = _gazetteers[path] = (mtime, Gazetteer.load(path))
+        return cached[1]
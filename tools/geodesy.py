@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized great-circle distances (spherical Earth, haversine formula).
+
+Coordinates are in degrees and distances in kilometres. Every function
+accepts sequences or NumPy arrays and works on whole batches at once.
+"""
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Distance between points, broadcasting like NumPy arithmetic."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=float)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distance_matrix(lats_a, lons_a, lats_b, lons_b):
+    """N x M matrix of distances from each point of A to each point of B."""
+    lats_a, lons_a = np.asarray(lats_a, dtype=float), np.asarray(lons_a, dtype=float)
+    return haversine(lats_a[:, None], lons_a[:, None], np.asarray(lats_b, dtype=float), np.asarray(lons_b, dtype=float))
+
+
+def _flatten(paths):
+    """Concatenate ``paths`` of ``(lat, lon)`` points; return coords and path sizes."""
+    sizes = np.fromiter((len(path) for path in paths), dtype=np.int64, count=len(paths))
+    coords = np.array([point for path in paths for point in path], dtype=float).reshape(-1, 2)
+    return coords, sizes
+
+
+def path_lengths(paths):
+    """Total length of each path, a list of ``(lat, lon)`` sequences.
+
+    All legs of all paths are computed in one vectorized pass; paths with
+    fewer than two points have length 0.
+    """
+    coords, sizes = _flatten(paths)
+    lengths = np.zeros(len(sizes))
+    if len(coords) < 2:
+        return lengths
+    legs = haversine(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])
+    # Path of each leg start; legs spanning two paths are dropped.
+    owner = np.repeat(np.arange(len(sizes)), sizes)
+    same_path = owner[:-1] == owner[1:]
+    np.add.at(lengths, owner[:-1][same_path], legs[same_path])
+    return lengths
+
+
+def centroids(paths, default=(0.0, 0.0)):
+    """Mean ``(lat, lon)`` of each path's points, ``default`` for empty paths."""
+    coords, sizes = _flatten(paths)
+    result = np.tile(np.asarray(default, dtype=float), (len(sizes), 1))
+    if len(coords):
+        owner = np.repeat(np.arange(len(sizes)), sizes)
+        sums = np.zeros((len(sizes), 2))
+        np.add.at(sums, owner, coords)
+        filled = sizes > 0
+        result[filled] = sums[filled] / sizes[filled, None]
+    return result
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory index of circular geofences (bus stops).
+
+Circles are sorted by centre latitude; a point lookup bisects to the
+circles whose latitude band can contain it and only measures the distance
+to those, so a query costs O(log n) plus the few nearby circles.
+"""
+import bisect
+import math
+
+from .geodesy import EARTH_RADIUS_KM, haversine
+
+
+class GeofenceIndex:
+
+    def __init__(self, fences):
+        """:param fences: iterable of ``(key, lat, lon, radius_km)``"""
+        fences = sorted(fences, key=lambda f: f[1])
+        self.keys = [f[0] for f in fences]
+        self.lats = [f[1] for f in fences]
+        self.lons = [f[2] for f in fences]
+        self.radii = [f[3] for f in fences]
+        self.max_radius_deg = math.degrees(max(self.radii, default=0.0) / EARTH_RADIUS_KM)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def locate(self, lat, lon):
+        """Key of the nearest geofence containing the point, or None."""
+        lo = bisect.bisect_left(self.lats, lat - self.max_radius_deg)
+        hi = bisect.bisect_right(self.lats, lat + self.max_radius_deg)
+        best, best_distance = None, None
+        for i in range(lo, hi):
+            distance = float(haversine(lat, lon, self.lats[i], self.lons[i]))
+            if distance <= self.radii[i] and (best_distance is None or distance < best_distance):
+                best, best_distance = self.keys[i], distance
+        return best
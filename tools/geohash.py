@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Geohash encoding and prefix covers of bounding boxes.
+
+A geohash of precision ``p`` names a lat/lon cell; longer hashes name
+cells nested inside shorter ones, so "points inside cell X" becomes a
+prefix match that a B-tree index can answer.
+"""
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode(lat, lon, precision=9):
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                value, lon_lo = value * 2 + 1, mid
+            else:
+                value, lon_hi = value * 2, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value, lat_lo = value * 2 + 1, mid
+            else:
+                value, lat_hi = value * 2, mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """``(lat degrees, lon degrees)`` spanned by a cell of ``precision``."""
+    total = 5 * precision
+    return 180.0 / 2 ** (total // 2), 360.0 / 2 ** (total - total // 2)
+
+
+def cover(min_lat, min_lon, max_lat, max_lon, max_cells=16, max_precision=9):
+    """Smallest set of geohash prefixes whose cells cover the box.
+
+    Uses the finest precision that needs at most ``max_cells`` cells.
+    """
+    for precision in range(max_precision, 0, -1):
+        dlat, dlon = cell_size(precision)
+        rows = math.floor(max_lat / dlat) - math.floor(min_lat / dlat) + 1
+        cols = math.floor(max_lon / dlon) - math.floor(min_lon / dlon) + 1
+        if rows * cols <= max_cells or precision == 1:
+            break
+    first_row, first_col = math.floor(min_lat / dlat), math.floor(min_lon / dlon)
+    return sorted({
+        encode(min((first_row + r + 0.5) * dlat, 90.0), ((first_col + c + 0.5) * dlon + 180.0) % 360.0 - 180.0, precision)
+        for r in range(rows) for c in range(cols)
+    })
+
+
+def radius_box(lat, lon, radius_km):
+    """``(min_lat, min_lon, max_lat, max_lon)`` containing the circle."""
+    dlat = math.degrees(radius_km / 6371.0)
+    dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+    return max(lat - dlat, -90.0), lon - dlon, min(lat + dlat, 90.0), lon + dlon
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized grading of exam marks against percentage grade bands.
+"""
+import numpy as np
+
+
+def grade(marks, max_marks, passing_marks, band_mins, band_names):
+    """Grade and pass flag of every mark in one pass.
+
+    :param marks: marks obtained
+    :param max_marks: maximum marks, a scalar or one per mark; marks out
+        of a non-positive maximum get no grade
+    :param passing_marks: passing marks, a scalar or one per mark
+    :param band_mins: lowest percentage of each grade band
+    :param band_names: grade of each band, aligned with ``band_mins``
+    :return: ``(grades, passed)`` lists aligned with ``marks``; a grade
+        is None below the lowest band
+    """
+    marks = np.asarray(marks, dtype=float)
+    max_marks = np.broadcast_to(np.asarray(max_marks, dtype=float), marks.shape)
+    passed = marks >= np.broadcast_to(np.asarray(passing_marks, dtype=float), marks.shape)
+    if not len(band_mins):
+        return [None] * len(marks), passed.tolist()
+
+    order = np.argsort(band_mins, kind='stable')
+    mins = np.asarray(band_mins, dtype=float)[order]
+    names = np.asarray(band_names, dtype=object)[order]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent = np.where(max_marks > 0, marks * 100.0 / max_marks, np.nan)
+    band = np.searchsorted(mins, percent, side='right') - 1
+    graded = ~np.isnan(percent) & (band >= 0)
+    grades = np.where(graded, names[np.clip(band, 0, None)], None)
+    return grades.tolist(), passed.tolist()
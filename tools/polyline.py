@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Compact encodings for lists of ``(lat, lon)`` points.
+
+``encode``/``decode`` implement the Google encoded polyline algorithm
+(signed varint deltas in printable ASCII), which Leaflet plugins and most
+map clients understand. ``quantize`` produces integer deltas for
+quantized GeoJSON, where coordinates are ``round(value * 10**precision)``.
+``simplify`` reduces a path with the Douglas-Peucker algorithm.
+"""
+import math
+
+
+def _encode_value(value, out):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode(points, precision=5):
+    """Encode ``(lat, lon)`` pairs into a polyline string."""
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lon = 0
+    for lat, lon in points:
+        lat, lon = round(lat * factor), round(lon * factor)
+        _encode_value(lat - prev_lat, out)
+        _encode_value(lon - prev_lon, out)
+        prev_lat, prev_lon = lat, lon
+    return ''.join(out)
+
+
+def decode(encoded, precision=5):
+    """Decode a polyline string into a list of ``(lat, lon)`` pairs."""
+    factor = 10 ** precision
+    values = []
+    value = shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    points = []
+    lat = lon = 0
+    for i in range(0, len(values) - 1, 2):
+        lat += values[i]
+        lon += values[i + 1]
+        points.append((lat / factor, lon / factor))
+    return points
+
+
+def quantize(points, precision=5):
+    """Return GeoJSON-ordered ``[lon, lat]`` integer deltas of ``points``."""
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lon = 0
+    for lat, lon in points:
+        lat, lon = round(lat * factor), round(lon * factor)
+        out.append([lon - prev_lon, lat - prev_lat])
+        prev_lat, prev_lon = lat, lon
+    return out
+
+
+def simplify(points, tolerance):
+    """Douglas-Peucker simplification of ``(lat, lon)`` points.
+
+    ``tolerance`` is in metres; distances use an equirectangular
+    projection around the path, which is accurate at city scale. The
+    first and last points are always kept.
+    """
+    if len(points) < 3 or tolerance <= 0:
+        return list(points)
+    cos_lat = math.cos(math.radians(sum(lat for lat, _lon in points) / len(points)))
+    xy = [(lon * 111320.0 * cos_lat, lat * 110540.0) for lat, lon in points]
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        (x1, y1), (x2, y2) = xy[first], xy[last]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+        max_dist, index = 0.0, None
+        for i in range(first + 1, last):
+            x, y = xy[i]
+            if length:
+                dist = abs(dy * x - dx * y + x2 * y1 - y2 * x1) / length
+            else:
+                dist = math.hypot(x - x1, y - y1)
+            if dist > max_dist:
+                max_dist, index = dist, i
+        if index is not None and max_dist > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
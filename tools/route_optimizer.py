@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Heuristics for ordering bus stops and splitting them across buses.
+
+Paths are open (the bus does not return to the first stop) and start at
+index ``start`` of the distance matrix. ``optimize`` builds a tour by
+nearest neighbour, then improves it with 2-opt and Or-opt moves until no
+move helps or the time limit is reached. ``sweep`` is the classic sweep
+heuristic for the capacitated vehicle routing problem.
+"""
+import math
+import time
+
+EPSILON = 1e-9
+
+
+def path_length(order, dist):
+    return sum(dist[a][b] for a, b in zip(order, order[1:]))
+
+
+def nearest_neighbour(dist, start=0):
+    n = len(dist)
+    order = [start]
+    left = set(range(n)) - {start}
+    while left:
+        last = dist[order[-1]]
+        nxt = min(left, key=last.__getitem__)
+        order.append(nxt)
+        left.remove(nxt)
+    return order
+
+
+def _leg(dist, order, i, j):
+    """Distance between positions i and j of ``order``, 0 past the end."""
+    if j >= len(order):
+        return 0.0
+    return dist[order[i]][order[j]]
+
+
+def two_opt(order, dist, deadline):
+    """Reverse segments while it shortens the path. The first stop stays put."""
+    n = len(order)
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for i in range(1, n - 1):
+            a, b = order[i - 1], order[i]
+            for j in range(i + 1, n):
+                c = order[j]
+                delta = dist[a][c] - dist[a][b]
+                if j + 1 < n:
+                    e = order[j + 1]
+                    delta += dist[b][e] - dist[c][e]
+                if delta < -EPSILON:
+                    order[i:j + 1] = reversed(order[i:j + 1])
+                    improved = True
+                    break
+            if improved or time.monotonic() >= deadline:
+                break
+    return order
+
+
+def or_opt(order, dist, deadline, max_segment=3):
+    """Move segments of up to ``max_segment`` stops to a better position."""
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        n = len(order)
+        for size in range(1, max_segment + 1):
+            for i in range(1, n - size + 1):
+                segment = order[i:i + size]
+                # Gain of removing the segment.
+                removed = dist[order[i - 1]][segment[0]] + _leg(dist, order, i + size - 1, i + size)
+                bridged = _leg(dist, order, i - 1, i + size)
+                gain = removed - bridged
+                rest = order[:i] + order[i + size:]
+                best_delta, best_pos, best_segment = -EPSILON, None, None
+                for pos in range(1, len(rest) + 1):
+                    if pos == i:
+                        continue
+                    prev = rest[pos - 1]
+                    nxt = rest[pos] if pos < len(rest) else None
+                    for seg in (segment, segment[::-1]):
+                        added = dist[prev][seg[0]]
+                        if nxt is not None:
+                            added += dist[seg[-1]][nxt] - dist[prev][nxt]
+                        if added - gain < best_delta:
+                            best_delta, best_pos, best_segment = added - gain, pos, seg
+                if best_pos is not None:
+                    order[:] = rest[:best_pos] + list(best_segment) + rest[best_pos:]
+                    improved = True
+                    break
+            if improved or time.monotonic() >= deadline:
+                break
+    return order
+
+
+def optimize(dist, start=0, time_limit=2.0):
+    """Short open path through every point of ``dist``, starting at ``start``.
+
+    ``dist`` is a square matrix (nested lists or a NumPy array).
+    """
+    if hasattr(dist, 'tolist'):
+        dist = dist.tolist()
+    if len(dist) < 3:
+        return [start] + [i for i in range(len(dist)) if i != start]
+    deadline = time.monotonic() + time_limit
+    order = nearest_neighbour(dist, start)
+    while time.monotonic() < deadline:
+        before = path_length(order, dist)
+        two_opt(order, dist, deadline)
+        or_opt(order, dist, deadline)
+        if path_length(order, dist) >= before - EPSILON:
+            break
+    return order
+
+
+def sweep(points, demands, capacities, depot):
+    """Split ``points`` across vehicles by polar angle around ``depot``.
+
+    :param points: ``(lat, lon)`` of each point
+    :param demands: seats needed at each point
+    :param capacities: seats of each vehicle, filled in this order
+    :return: ``(groups, unassigned)`` where ``groups[k]`` lists the point
+        indices given to vehicle ``k``
+    """
+    cos_lat = math.cos(math.radians(depot[0]))
+    angles = [math.atan2(lat - depot[0], (lon - depot[1]) * cos_lat) for lat, lon in points]
+    order = sorted(range(len(points)), key=angles.__getitem__)
+    if len(order) > 1:
+        # Start right after the widest angular gap so groups stay compact.
+        gaps = [(angles[order[(k + 1) % len(order)]] - angles[order[k]]) % (2 * math.pi) for k in range(len(order))]
+        first = (max(range(len(gaps)), key=gaps.__getitem__) + 1) % len(order)
+        order = order[first:] + order[:first]
+
+    groups = [[] for _capacity in capacities]
+    unassigned = []
+    largest = max(capacities, default=0)
+    vehicle, load = 0, 0
+    for i in order:
+        if demands[i] > largest:
+            unassigned.append(i)
+            continue
+        while vehicle < len(capacities) and load + demands[i] > capacities[vehicle]:
+            vehicle, load = vehicle + 1, 0
+        if vehicle >= len(capacities):
+            unassigned.append(i)
+            continue
+        groups[vehicle].append(i)
+        load += demands[i]
+    return groups, unassigned
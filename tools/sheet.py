@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Row streaming from uploaded CSV and XLSX files.
+"""
+import csv
+import io
+
+
+def iter_rows(data, filename):
+    """Yield the rows of a CSV or XLSX file as lists of cell values.
+
+    XLSX files are read in openpyxl's read-only mode, so rows are streamed
+    rather than loaded as a whole; CSV files may be comma, semicolon or
+    tab separated and start with a UTF-8 byte order mark.
+    """
+    if filename.lower().endswith('.xlsx'):
+        import openpyxl
+        book = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+        try:
+            for row in book.active.iter_rows(values_only=True):
+                yield list(row)
+        finally:
+            book.close()
+        return
+    text = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(text, dialect)
+
+
+def cell_text(value):
+    """Cell value as stripped text; whole floats lose their ``.0``."""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def chunked(iterable, size):
+    """Yield lists of up to ``size`` items of ``iterable``."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Uniform latitude/longitude grid index for radius queries over points.
+
+Points are bucketed into cells of about ``cell_km`` a side; a radius query
+only looks at the cells overlapping the search circle, then refines with
+exact haversine distances. Queries for many points are grouped by cell so
+each group is refined with one vectorized distance matrix.
+"""
+import math
+from collections import defaultdict
+
+import numpy as np
+
+from . import geodesy
+
+KM_PER_DEGREE = math.pi * geodesy.EARTH_RADIUS_KM / 180.0
+
+
+class GridIndex:
+
+    def __init__(self, lats, lons, cell_km=0.5):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        mean_lat = float(self.lats.mean()) if len(self.lats) else 0.0
+        self.cell_lat = cell_km / KM_PER_DEGREE
+        self.cell_lon = cell_km / (KM_PER_DEGREE * max(math.cos(math.radians(mean_lat)), 0.01))
+        self.cells = defaultdict(list)
+        for i, key in enumerate(zip(*self._cells(self.lats, self.lons))):
+            self.cells[key].append(i)
+        self.cells = {key: np.array(indices) for key, indices in self.cells.items()}
+
+    def _cells(self, lats, lons):
+        return (np.floor(np.asarray(lats) / self.cell_lat).astype(int).tolist(),
+                np.floor(np.asarray(lons) / self.cell_lon).astype(int).tolist())
+
+    def _candidates(self, row, col, radius_km):
+        span_rows = math.ceil(radius_km / KM_PER_DEGREE / self.cell_lat)
+        # A degree of longitude shrinks towards the poles: size the window
+        # at the highest latitude it covers.
+        max_lat = max(abs(row * self.cell_lat), abs((row + 1) * self.cell_lat)) + radius_km / KM_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(max_lat, 89.0)))
+        span_cols = math.ceil(radius_km / (KM_PER_DEGREE * cos_lat) / self.cell_lon)
+        found = [self.cells[key]
+                 for key in ((r, c) for r in range(row - span_rows, row + span_rows + 1)
+                             for c in range(col - span_cols, col + span_cols + 1))
+                 if key in self.cells]
+        return np.concatenate(found) if found else np.zeros(0, dtype=int)
+
+    def query(self, lat, lon, radius_km):
+        """Indices and distances of the points within ``radius_km``, nearest first."""
+        pairs = self.query_many([lat], [lon], radius_km)
+        return pairs[1], pairs[2]
+
+    def query_many(self, lats, lons, radius_km):
+        """All ``(query index, point index, distance)`` pairs within ``radius_km``.
+
+        Returns three aligned arrays sorted by increasing distance.
+        """
+        lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+        groups = defaultdict(list)
+        for i, key in enumerate(zip(*self._cells(lats, lons))):
+            groups[key].append(i)
+        queries, points, distances = [], [], []
+        for (row, col), members in groups.items():
+            candidates = self._candidates(row, col, radius_km)
+            if not len(candidates):
+                continue
+            members = np.array(members)
+            matrix = geodesy.distance_matrix(lats[members], lons[members],
+                                             self.lats[candidates], self.lons[candidates])
+            q, p = np.nonzero(matrix <= radius_km)
+            queries.append(members[q])
+            points.append(candidates[p])
+            distances.append(matrix[q, p])
+        if not queries:
+            empty = np.zeros(0, dtype=int)
+            return empty, empty, np.zeros(0)
+        queries, points, distances = np.concatenate(queries), np.concatenate(points), np.concatenate(distances)
+        order = np.argsort(distances, kind='stable')
+        return queries[order], points[order], distances[order]
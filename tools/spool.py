@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Durable, multi-process event spool backed by NDJSON files.
+
+Producers append to ``pending.ndjson``; a flusher atomically rotates it
+into a ``batch-*.ndjson`` file, processes the batch and deletes it only
+once the work is committed. A crash at any point leaves the batch on disk
+to be replayed, so delivery is at-least-once.
+"""
+import contextlib
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+
+class Spool:
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.pending_path = os.path.join(directory, 'pending.ndjson')
+        self.lock_path = os.path.join(directory, '.lock')
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def append(self, events):
+        """Durably append ``events`` (JSON-serializable dicts)."""
+        data = ''.join(json.dumps(event, default=str) + '\n' for event in events)
+        with self._locked():
+            fd = os.open(self.pending_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+            try:
+                os.write(fd, data.encode('utf-8'))
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def claim(self):
+        """Rotate pending events into a batch file and return all batch paths, oldest first."""
+        with self._locked():
+            if os.path.exists(self.pending_path) and os.path.getsize(self.pending_path):
+                batch = os.path.join(self.directory, 'batch-%020d-%s.ndjson' % (time.time_ns(), os.getpid()))
+                os.rename(self.pending_path, batch)
+        return sorted(glob.glob(os.path.join(self.directory, 'batch-*.ndjson')))
+
+    @contextlib.contextmanager
+    def open_batch(self, path):
+        """Lock a batch file and yield its events.
+
+        Yields None when another process already holds the batch. The file
+        is deleted on a clean exit of the ``with`` block and kept if it
+        raises.
+        """
+        try:
+            f = open(path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            yield None
+            return
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield None
+                return
+            events = []
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    _logger.warning("Skipping corrupt line in spool batch %s", path)
+            yield events
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
+
+
+class SpoolFlusher(threading.Thread):
+    """
+    Daemon thread calling ``flush()`` every ``interval`` seconds, or
+    sooner once ``threshold`` events were appended by this process.
+    """
+
+    def __init__(self, name, flush, interval=0.5, threshold=200):
+        super().__init__(name=name, daemon=True)
+        self.flush = flush
+        self.interval = interval
+        self.threshold = threshold
+        self.count = 0
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+
+    def notify(self, count):
+        with self.lock:
+            self.count += count
+            if self.count >= self.threshold:
+                self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            with self.lock:
+                if not self.count:
+                    continue
+                self.count = 0
+            try:
+                self.flush()
+            except Exception:
+                _logger.exception("Spool flush failed; events stay queued.")
+
+
+_flushers = {}
+_flushers_lock = threading.Lock()
+
+
+def get_flusher(name, flush, interval, threshold):
+    """Return the running flusher called ``name``, starting it if needed."""
+    with _flushers_lock:
+        flusher = _flushers.get(name)
+        if flusher is None or not flusher.is_alive():
+            flusher = _flushers[name] = SpoolFlusher(name, flush, interval, threshold)
+            flusher.start()
+        return flusher
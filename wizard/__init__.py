@@ -1,2 +1,7 @@
 # -*- coding: utf-8 -*-
-from . import geocode_wizard
\ No newline at end of file
+from . import geocode_wizard
+from . import transport_assign_wizard
+from . import route_optimize_wizard
+from . import library_issue_wizard
+from . import hostel_allocation_wizard
+from . import exam_result_import_wizard
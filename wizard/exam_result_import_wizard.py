@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import base64
+import zipfile
+
+from odoo import models, fields, _
+from odoo.exceptions import UserError
+
+from ..tools.sheet import iter_rows, cell_text
+
+# Accepted header names of the two columns, lower case.
+ADMISSION_HEADERS = ('admission_no', 'admission no', 'admission number', 'admission')
+MARKS_HEADERS = ('marks', 'marks_obtained', 'marks obtained', 'score')
+# Rejected rows listed in the result.
+MAX_REPORTED_ERRORS = 100
+
+
+class ExamResultImportWizard(models.TransientModel):
+    _name = 'school.exam.result.import.wizard'
+    _description = 'Import Exam Results'
+
+    exam_id = fields.Many2one(
+        'school.exam', string="Exam", required=True,
+        default=lambda self: self.env.context.get('active_id') if self.env.context.get('active_model') == 'school.exam' else False,
+    )
+    file = fields.Binary(string="File", required=True, help="CSV or XLSX file with an admission number and a marks column")
+    filename = fields.Char(string="File Name")
+    replace_existing = fields.Boolean(string="Replace Existing Results",
+                                      help="Replace the results students already have for this exam instead of skipping them.")
+    state = fields.Selection([('draft', 'Draft'), ('done', 'Done')], default='draft')
+    imported_count = fields.Integer(string="Imported", readonly=True)
+    skipped_count = fields.Integer(string="Already Graded", readonly=True)
+    error_count = fields.Integer(string="Rejected", readonly=True)
+    error_log = fields.Text(string="Rejected Rows", readonly=True)
+
+    def action_import(self):
+        """Grade and create the results of the uploaded sheet."""
+        self.ensure_one()
+        rows = iter_rows(base64.b64decode(self.file), self.filename or '')
+        try:
+            header = [cell_text(cell).lower() for cell in next(rows, None) or []]
+            admission_col = next((i for i, name in enumerate(header) if name in ADMISSION_HEADERS), None)
+            marks_col = next((i for i, name in enumerate(header) if name in MARKS_HEADERS), None)
+            if admission_col is None or marks_col is None:
+                raise UserError(_("The first row must name an admission number column and a marks column."))
+            width = max(admission_col, marks_col) + 1
+
+            def lines():
+                for line, row in enumerate(rows, start=2):
+                    row = list(row) + [None] * (width - len(row))
+                    if any(cell_text(cell) for cell in row):
+                        yield line, row[admission_col], row[marks_col]
+
+            imported, skipped, errors = self.env['school.exam.result']._import_marks(
+                self.exam_id, lines(), replace_existing=self.replace_existing)
+        except ImportError:
+            raise UserError(_("Reading XLSX files requires the openpyxl Python library."))
+        except (UnicodeDecodeError, ValueError, zipfile.BadZipFile) as e:
+            raise UserError(_("The file could not be read as CSV or XLSX: %s", e))
+
+        log = '\n'.join(_("Line %(line)s: %(message)s", line=line, message=message)
+                        for line, message in errors[:MAX_REPORTED_ERRORS])
+        if len(errors) > MAX_REPORTED_ERRORS:
+            log += '\n' + _("... and %s more.", len(errors) - MAX_REPORTED_ERRORS)
+        self.write({
+            'state': 'done',
+            'imported_count': imported,
+            'skipped_count': skipped,
+            'error_count': len(errors),
+            'error_log': log,
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
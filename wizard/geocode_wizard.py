@@ -42,14 +42,20 @@ class SchoolGeocodeWizard(models.TransientModel):
         if not active_model or not active_ids:
             return {'type': 'ir.actions.act_window_close'}
 
-        _logger.info(f"Geocode wizard running on model {active_model} for IDs {active_ids}")
-        
-        records = self.env[active_model].browse(active_ids)
-        
-        if hasattr(records, 'geocode_record'):
-            records.geocode_record()
-        else:
+        _logger.info(f"Geocode wizard running on model {active_model} for {len(active_ids)} IDs")
+
+        if not hasattr(self.env[active_model], 'geocode_record'):
             _logger.warning(f"Model {active_model} does not have a 'geocode_record' method.")
+            return {'type': 'ir.actions.act_window_close'}
+
+        # Small selections are geocoded right away; larger ones go to a
+        # background job so they don't hold a web worker.
+        sync_limit = int(self.env['ir.config_parameter'].sudo().get_param('schoolbus.geocode_sync_limit', 20))
+        if len(active_ids) > sync_limit:
+            job = self.env['school.geocode.job']._enqueue(active_model, active_ids)
+            return job.action_refresh()
+
+        self.env[active_model].browse(active_ids).geocode_record()
 
         return {
             'type': 'ir.actions.client',
@@ -60,4 +66,4 @@ class SchoolGeocodeWizard(models.TransientModel):
                 'type': 'success',
                 'sticky': False,
             }
-        }
\ No newline at end of file
+        }
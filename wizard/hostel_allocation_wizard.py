@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, Command, _
+from odoo.exceptions import UserError
+
+
+class HostelAllocationWizard(models.TransientModel):
+    _name = 'hostel.allocation.wizard'
+    _description = 'Allocate Hostel Rooms'
+
+    hostel_ids = fields.Many2many('hostel', string="Hostels",
+                                  help="Only fill rooms of these hostels. Leave empty for all hostels.")
+    class_ids = fields.Many2many('school.class', string="Classes")
+    student_ids = fields.Many2many('school.student', string="Students",
+                                   help="Leave empty to allocate every student of the selected classes.")
+    by_class = fields.Boolean(string="Keep Classes Together",
+                              help="Only share rooms between students of the same class.")
+    date_from = fields.Date(string="From Date", required=True, default=fields.Date.today)
+    state = fields.Selection([('draft', 'Draft'), ('done', 'Done')], default='draft')
+    allocated_count = fields.Integer(string="Allocated", readonly=True)
+    unallocated_student_ids = fields.Many2many('school.student', 'hostel_allocation_wizard_unallocated_rel',
+                                               string="Students Without a Bed", readonly=True)
+
+    def action_allocate(self):
+        """Allocate the intake to free beds, rooms filled in hostel and room number order."""
+        self.ensure_one()
+        students = self.student_ids or self.class_ids.students
+        if not students:
+            raise UserError(_("Select classes with students, or the students themselves."))
+        domain = [('available_beds', '>', 0)]
+        if self.hostel_ids:
+            domain.append(('hostel_id', 'in', self.hostel_ids.ids))
+        rooms = self.env['hostel.room'].search(domain, order='hostel_id, name, id')
+
+        allocations, unallocated = self.env['hostel.student']._allocate_rooms(
+            students, rooms, by_class=self.by_class, date_from=self.date_from)
+        self.write({
+            'state': 'done',
+            'allocated_count': len(allocations),
+            'unallocated_student_ids': [Command.set(unallocated.ids)],
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
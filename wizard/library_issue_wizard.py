@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, _
+from odoo.exceptions import UserError
+
+
+class LibraryIssueWizard(models.TransientModel):
+    _name = 'school.library.issue.wizard'
+    _description = 'Issue Books to a Class'
+
+    class_id = fields.Many2one('school.class', string="Class")
+    student_ids = fields.Many2many('school.student', string="Students",
+                                   help="Leave empty to issue to every student of the class.")
+    book_ids = fields.Many2many('school.library.book', string="Books", required=True)
+    issue_date = fields.Date(string="Issue Date", required=True, default=fields.Date.today)
+    state = fields.Selection([('draft', 'Draft'), ('done', 'Done')], default='draft')
+    issued_count = fields.Integer(string="Issued", readonly=True)
+    skipped_count = fields.Integer(string="Already Held", readonly=True)
+
+    def action_issue(self):
+        """Issue one copy of each selected book to each student, all or nothing."""
+        self.ensure_one()
+        students = self.student_ids or self.class_id.students
+        if not students:
+            raise UserError(_("Select a class with students, or the students themselves."))
+        issues, skipped = self.env['school.library.issue']._issue_to_students(
+            self.book_ids, students, self.issue_date)
+        self.write({
+            'state': 'done',
+            'issued_count': len(issues),
+            'skipped_count': skipped,
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, Command, _
+from odoo.exceptions import UserError
+
+
+class RouteOptimizeWizard(models.TransientModel):
+    _name = 'school.transport.optimize.wizard'
+    _description = 'Optimize Transport Routes'
+
+    mode = fields.Selection([
+        ('sequence', 'Reorder Stops of Each Route'),
+        ('fleet', 'Redistribute Stops Across Routes'),
+    ], string="Mode", required=True, default='sequence')
+    route_ids = fields.Many2many(
+        'school.transport.route', string="Routes", required=True,
+        default=lambda self: self.env.context.get('active_ids', []) if self.env.context.get('active_model') == 'school.transport.route' else [],
+    )
+    state = fields.Selection([('draft', 'Draft'), ('done', 'Done')], default='draft')
+    distance_before = fields.Float(string="Distance Before (km)", readonly=True)
+    distance_after = fields.Float(string="Distance After (km)", readonly=True)
+    distance_saved = fields.Float(string="Distance Saved (km)", readonly=True)
+    unassigned_stop_ids = fields.Many2many('school.transport.stop', string="Stops Over Capacity", readonly=True)
+
+    def action_optimize(self):
+        self.ensure_one()
+        if not self.route_ids:
+            raise UserError(_("Select at least one route."))
+        if self.mode == 'fleet':
+            result = self.route_ids._build_fleet_routes()
+            before, after = result['before'], result['after']
+            unassigned = result['unassigned']
+        else:
+            before, after = self.route_ids._optimize_stop_sequence()
+            unassigned = self.env['school.transport.stop']
+        self.write({
+            'state': 'done',
+            'distance_before': before,
+            'distance_after': after,
+            'distance_saved': before - after,
+            'unassigned_stop_ids': [Command.set(unassigned.ids)],
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
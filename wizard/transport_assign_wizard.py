@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, _
+from odoo.exceptions import UserError
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class TransportAssignWizard(models.TransientModel):
+    _name = 'school.transport.assign.wizard'
+    _description = 'Assign Students to Nearest Stops'
+
+    radius_m = fields.Integer(
+        string="Walking Radius (m)", required=True,
+        default=lambda self: int(self.env['ir.config_parameter'].sudo().get_param(
+            'school_transport.walking_radius_m', 500)),
+    )
+    route_ids = fields.Many2many('school.transport.route', string="Routes",
+                                 help="Only use stops of these routes. Leave empty for all routes.")
+    only_unassigned = fields.Boolean(string="Only Students Without a Stop", default=True)
+    state = fields.Selection([('draft', 'Draft'), ('done', 'Done')], default='draft')
+    assigned_count = fields.Integer(string="Assigned", readonly=True)
+    unassigned_count = fields.Integer(string="Not Assigned", readonly=True)
+
+    def action_assign(self):
+        """Assign geocoded students to the nearest stop with seats left on its route."""
+        self.ensure_one()
+        if self.radius_m <= 0:
+            raise UserError(_("The walking radius must be positive."))
+
+        domain = [('x_lat', '!=', 0), ('x_lon', '!=', 0)]
+        if self.only_unassigned:
+            domain.append(('transport_stop_id', '=', False))
+        students = self.env['school.student'].search(domain)
+        stop_domain = [('latitude', '!=', 0), ('longitude', '!=', 0), ('route_id', '!=', False)]
+        if self.route_ids:
+            stop_domain.append(('route_id', 'in', self.route_ids.ids))
+        stops = self.env['school.transport.stop'].search(stop_domain)
+
+        unassigned = students._assign_transport_stops(self.radius_m / 1000.0, stops)
+        _logger.info("Stop assignment: %s students assigned, %s left without a stop.",
+                     len(students) - len(unassigned), len(unassigned))
+        self.write({
+            'state': 'done',
+            'assigned_count': len(students) - len(unassigned),
+            'unassigned_count': len(unassigned),
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }